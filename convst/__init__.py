@@ -2,4 +2,9 @@
 __author__ = 'Antoine Guillaume antoine.guillaume45@gmail.com'
 __version__ = "0.2.3"
 
-__all__ = ['transformers', 'classifiers', 'utils', 'interpreters']
+from convst.utils.warmup_utils import warmup, set_cache_dir
+
+__all__ = [
+    'transformers', 'classifiers', 'utils', 'interpreters', 'warmup',
+    'set_cache_dir'
+]
@@ -1,15 +1,20 @@
 # -*- coding: utf-8 -*-
 
+import os
 import numpy as np
 
 from joblib import Parallel
 
 from convst.utils.checks_utils import check_n_jobs
+from convst.utils.persistence_utils import (
+    save_model, load_model, linear_arrays, set_linear_arrays
+)
 from convst.transformers import R_DST
 from convst.transformers._input_transformers import Raw, Derivate, Periodigram
 
 from sklearn.utils.fixes import delayed
 from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.utils.validation import check_is_fitted
 from sklearn.linear_model import RidgeClassifierCV
 from sklearn.utils.extmath import softmax
 from sklearn.metrics import accuracy_score, make_scorer
@@ -52,6 +57,13 @@ class _internalRidgeCV(RidgeClassifierCV):
             raise ValueError('LOOCV training accuracy is only available with store_cv_values to True')
 
 
+# Input transformers of the ensemble, by class name, used to load it.
+INPUT_TRANSFORMERS = {
+    'Raw': Raw,
+    'Derivate': Derivate,
+    'Periodigram': Periodigram
+}
+
 def _parallel_fit(X, y, model):
     return model.fit(X, y)
 
@@ -156,5 +168,80 @@ class R_DST_Ensemble(BaseEstimator, ClassifierMixin):
         preds_proba = np.asarray(preds_proba).sum(axis=0)
         return preds_proba.argmax(axis=1)
 
-    
-        
\ No newline at end of file
+    def save(self, path):
+        """
+        Save the fitted ensemble in a directory. Each model is saved in a
+        model_i subdirectory, with its transformer saved by R_DST.save, and 
+        the model weights in a versioned JSON file with the parameters of 
+        the ensemble.
+
+        Parameters
+        ----------
+        path : str or path
+            Directory in which the ensemble is saved. It is created if it
+            does not exist.
+
+        Returns
+        -------
+        None.
+
+        """
+        check_is_fitted(self, ['models'])
+        save_model(
+            path, self.__class__.__name__, self.get_params(), {
+                'model_weights': self.model_weights,
+                'input_transformers': [
+                    [model[0].__class__.__name__, model[0].get_params()]
+                    for model in self.models
+                ]
+            }, {}
+        )
+        for i, model in enumerate(self.models):
+            model_path = os.path.join(path, 'model_{}'.format(i))
+            save_model(
+                model_path, model[-1].__class__.__name__, {}, {},
+                linear_arrays(model[-1].scaler, model[-1])
+            )
+            model[1].save(os.path.join(model_path, 'transformer'))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load an ensemble saved by the save method.
+
+        Parameters
+        ----------
+        path : str or path
+            Directory in which the ensemble was saved.
+        mmap : bool, optional
+            Wheter to open the saved arrays as copy on write memory maps, so 
+            that processes loading the same ensemble share one copy of them.
+            The default is True.
+
+        Returns
+        -------
+        R_DST_Ensemble
+            The fitted ensemble.
+
+        """
+        params, attributes, _ = load_model(path, cls.__name__, mmap=mmap)
+        model = cls(**params)
+        model._manage_n_jobs()
+        model.model_weights = attributes['model_weights']
+        model.models = []
+        for i, (name, input_params) in enumerate(
+            attributes['input_transformers']
+        ):
+            model_path = os.path.join(path, 'model_{}'.format(i))
+            _, _, arrays = load_model(
+                model_path, _internalRidgeCV.__name__, mmap=mmap
+            )
+            ridge = _internalRidgeCV()
+            ridge.scaler = StandardScaler()
+            set_linear_arrays(ridge.scaler, ridge, arrays)
+            model.models.append(make_pipeline(
+                INPUT_TRANSFORMERS[name](**input_params),
+                R_DST.load(os.path.join(model_path, 'transformer'), mmap=mmap),
+                ridge
+            ))
+        return model
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import os
 import numpy as np
 
 from sklearn.base import BaseEstimator, ClassifierMixin
@@ -10,6 +11,9 @@ from convst.transformers._input_transformers import c_StandardScaler
 from convst.transformers import R_DST
 
 from convst.utils.checks_utils import check_n_jobs
+from convst.utils.persistence_utils import (
+    save_model, load_model, linear_arrays, set_linear_arrays
+)
 from sklearn.metrics import accuracy_score
 
 from numba import set_num_threads
@@ -54,6 +58,10 @@ class R_DST_Ridge(BaseEstimator, ClassifierMixin):
     fit_intercept : bool, optional
         If True, the intercept term will be fitted during the ridge regression.
         The default is True.
+    dtype : str, optional
+        The floating point type, either 'float64' or 'float32', used by R_DST
+        for the input time series, the shapelets and the transformed output.
+        The default is 'float64'.
     alphas : array, optional
         Array of alpha values to try which influence regularization strength, 
         must be a positive float.
@@ -78,6 +86,7 @@ class R_DST_Ridge(BaseEstimator, ClassifierMixin):
         n_jobs=1,
         random_state=None,
         min_len=None,
+        dtype='float64',
         class_weight=None, 
         fit_intercept=True,
         alphas_ridge=list(np.logspace(-4,4,20))
@@ -105,6 +114,7 @@ class R_DST_Ridge(BaseEstimator, ClassifierMixin):
             set_num_threads(self.n_jobs)
         self.random_state=random_state
         self.min_len=min_len
+        self.dtype=dtype
     
     def _more_tags(self):
         return {
@@ -138,7 +148,8 @@ class R_DST_Ridge(BaseEstimator, ClassifierMixin):
             proba_norm=self.proba_norm,
             percentiles=self.percentiles,
             random_state=self.random_state,
-            min_len=self.min_len 
+            min_len=self.min_len,
+            dtype=self.dtype
         )
     
     def fit(self, X, y):
@@ -200,3 +211,57 @@ class R_DST_Ridge(BaseEstimator, ClassifierMixin):
         """
         preds = self.predict(X)
         return accuracy_score(y, preds)
+    
+    def save(self, path):
+        """
+        Save the fitted classifier in a directory. The transformer is saved
+        by R_DST.save in the transformer subdirectory, and the scaler and 
+        ridge coefficients as .npy files next to a versioned JSON file with
+        the parameters of the classifier.
+
+        Parameters
+        ----------
+        path : str or path
+            Directory in which the classifier is saved. It is created if it
+            does not exist.
+
+        Returns
+        -------
+        None.
+
+        """
+        check_is_fitted(self, ['classifier'])
+        save_model(
+            path, self.__class__.__name__, self.get_params(), {},
+            linear_arrays(self.classifier[0], self.classifier[-1])
+        )
+        self.transformer.save(os.path.join(path, 'transformer'))
+    
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a classifier saved by the save method.
+
+        Parameters
+        ----------
+        path : str or path
+            Directory in which the classifier was saved.
+        mmap : bool, optional
+            Wheter to open the saved arrays as copy on write memory maps, so 
+            that processes loading the same classifier share one copy of
+            them. The default is True.
+
+        Returns
+        -------
+        R_DST_Ridge
+            The fitted classifier.
+
+        """
+        params, _, arrays = load_model(path, cls.__name__, mmap=mmap)
+        model = cls(**params)
+        model._init_components()
+        set_linear_arrays(model.classifier[0], model.classifier[-1], arrays)
+        model.transformer = R_DST.load(
+            os.path.join(path, 'transformer'), mmap=mmap
+        )
+        return model
@@ -11,15 +11,30 @@ Created on Mon Sep 26 12:25:16 2022
 # And for RDST Ensemble, using RDST Ridge interpreter.
 
 
-import seaborn as sns
-from matplotlib import pyplot as plt
+import importlib
 import numpy as np
 from sklearn.utils.validation import check_is_fitted
 
-from convst.transformers._commons import compute_shapelet_dist_vector, manhattan
+from convst.transformers._commons import (
+    compute_shapelet_dist_vector, manhattan, DIST_MANHATTAN
+)
 from convst.transformers import R_DST
 from convst.classifiers import R_DST_Ridge, R_DST_Ensemble
 
+class _LazyModule:
+    """
+    Import a module on the first access to one of its attributes, so that
+    seaborn and matplotlib are only loaded when a plot is made.
+    """
+    def __init__(self, name):
+        self._name = name
+    
+    def __getattr__(self, attribute):
+        return getattr(importlib.import_module(self._name), attribute)
+
+sns = _LazyModule('seaborn')
+plt = _LazyModule('matplotlib.pyplot')
+
 class Shapelet:
     def __init__(self, values, length, dilation, norm, threshold, phase):
         self.values = np.asarray(values)
@@ -56,7 +71,7 @@ class Shapelet:
     ):
         c = compute_shapelet_dist_vector(
             X, self.values, self.length, self.dilation,
-            manhattan, self.norm, self.phase
+            DIST_MANHATTAN, self.norm, self.phase
         )
         _values = self.values
         idx_match = np.asarray(
@@ -82,7 +97,7 @@ class Shapelet:
     ):
         c = compute_shapelet_dist_vector(
             X, self.values, self.length, self.dilation,
-            manhattan, self.norm, self.phase
+            DIST_MANHATTAN, self.norm, self.phase
         )
         if ax is None:
             sns.set()
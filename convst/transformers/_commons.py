@@ -1,7 +1,49 @@
 # -*- coding: utf-8 -*-
 
-from numba import njit, prange
-from numpy import float_, sqrt, zeros, unique, bool_, where, int64
+from numba import njit, prange, literally
+from numpy import (
+    float_, sqrt, zeros, unique, bool_, where, int64, complex128, empty,
+    log2, pi, cos, sin, argsort, abs as _abs, dot, full, uint64, arange
+)
+
+# Values of the sdp_mode parameter, indicating if the sliding dot product
+# engine can be used and which distance it should compute.
+SDP_DISABLED = 0
+SDP_SQUARED = 1
+SDP_EUCLIDEAN = 2
+
+# Values of the metric parameter of the distance functions.
+DIST_MANHATTAN = 0
+DIST_EUCLIDEAN = 1
+DIST_SQUARED = 2
+
+# Estimated cost of one FFT butterfly relative to one iteration of the direct
+# distance loop, used to decide when the sliding dot product engine is faster.
+SDP_FFT_COST = 1.0
+
+# Number of uniform draws tried by the multivariate shapelet generators to 
+# find a sampling point allowed by the self similarity mask, before counting
+# all the allowed points.
+SAMPLING_MAX_TRIES = 16
+
+# Shapelets sharing a self similarity mask (same dilation and normalization)
+# are split into work items of about GENERATION_BLOCK_SHAPELETS shapelets, 
+# each owning a block of at least GENERATION_BLOCK_SAMPLES samples, so that
+# the generation of large dilation groups can run in parallel.
+GENERATION_BLOCK_SHAPELETS = 256
+GENERATION_BLOCK_SAMPLES = 64
+
+# The apply functions split the shapelets of a parameter group in chunks when
+# there are less than APPLY_MIN_TILES tiles (a sample and the shapelets of a
+# chunk), so that a few long samples can be processed by many threads. The 
+# tiles are then split into at most APPLY_N_BLOCKS blocks of about the same
+# estimated cost, which are the iterations of their parallel loop.
+APPLY_MIN_TILES = 256
+APPLY_N_BLOCKS = 256
+
+# Size in bytes of the blocks of windows and dot products processed at once
+# by the batched (GEMM) engine, chosen so that they stay in the L2 cache.
+GEMM_BLOCK_BYTES = 262144
 
 ###############################################################################
 #                                                                             #
@@ -9,33 +51,181 @@ from numpy import float_, sqrt, zeros, unique, bool_, where, int64
 #                                                                             #
 ###############################################################################
 
+# The distance functions can z-normalize x on the fly with its mean mu and
+# the inverse of its standard deviation inv_std, so that normalized
+# subsequences never have to be written in memory. The values of x and y are
+# read in their own type, but the differences and the sum are computed in
+# double precision: with float32 values, a float32 accumulator loses the
+# small differences between the windows of long or offset series, which
+# changes the min and the occurrences of the shapelets.
+#
+# The distance is given to the numba functions as one of the DIST_* integers
+# rather than as a function. The shapelet generators force it to be a literal
+# with numba.literally, and the transform calls apply_all_shapelets with a
+# constant distance, so that the functions are compiled once per distance
+# with the comparisons on metric resolved at compile time. Numba already
+# inlines a distance given as a function, so the loops run at the same speed
+# (see benchmark_distances): the gain is that, contrary to functions, literal
+# integers are found in the numba cache by other processes, which do not
+# compile the functions again when they start.
+
 @njit(
   fastmath=True, cache=True
 )
-def euclidean(x, y):
-    s = 0
-    for i in prange(x.shape[0]):
-        s += (x[i]-y[i])**2
-    return sqrt(s)
+def distance(x, y, metric, mu=0., inv_std=1.):
+    """
+    Distance between a window x, z-normalized with mu and inv_std, and the
+    values y of a shapelet.
+
+    Parameters
+    ----------
+    x : array, shape=(length)
+        Values of the window.
+    y : array, shape=(length)
+        Values of the shapelet.
+    metric : int
+        The distance, among DIST_MANHATTAN, DIST_EUCLIDEAN and DIST_SQUARED.
+    mu : float, optional
+        Value subtracted from x. The default is 0.
+    inv_std : float, optional
+        Value by which x is multiplied after subtracting mu. The default is 1.
+
+    Returns
+    -------
+    float
+        The distance between x and y.
+
+    """
+    s = 0.
+    if metric == DIST_MANHATTAN:
+        for i in range(x.shape[0]):
+            s += abs((x[i]-mu)*inv_std-y[i])
+        return s
+    for i in range(x.shape[0]):
+        s += ((x[i]-mu)*inv_std-y[i])**2
+    if metric == DIST_EUCLIDEAN:
+        return sqrt(s)
+    return s
 
 @njit(
   fastmath=True, cache=True
 )
-def squared_euclidean(x, y):
-    s = 0
-    for i in prange(x.shape[0]):
-        s += (x[i]-y[i])**2
-    return s
+def euclidean(x, y, mu=0., inv_std=1.):
+    return distance(x, y, DIST_EUCLIDEAN, mu, inv_std)
 
 @njit(
   fastmath=True, cache=True
 )
-def manhattan(x, y):
-    s = 0
-    for i in prange(x.shape[0]):
-        s += abs(x[i]-y[i])
+def squared_euclidean(x, y, mu=0., inv_std=1.):
+    return distance(x, y, DIST_SQUARED, mu, inv_std)
+
+@njit(
+  fastmath=True, cache=True
+)
+def manhattan(x, y, mu=0., inv_std=1.):
+    return distance(x, y, DIST_MANHATTAN, mu, inv_std)
+
+# The early abandoning version of the distance visits the points in the given
+# order and stops as soon as the partial distance is greater than bound, in
+# which case the returned value is only guaranteed to be greater than bound.
+# It returns from inside the loop rather than using break, which Numba
+# compiles to a much slower loop.
+
+@njit(
+  fastmath=True, cache=True
+)
+def distance_ea(x, y, order, bound, metric, mu=0., inv_std=1.):
+    """
+    Early abandoning version of distance.
+
+    Parameters
+    ----------
+    x : array, shape=(length)
+        Values of the window.
+    y : array, shape=(length)
+        Values of the shapelet.
+    order : array, shape=(length)
+        Order in which the points are visited, as given by 
+        early_abandon_order.
+    bound : float
+        The distance above which the computation is abandoned.
+    metric : int
+        The distance, among DIST_MANHATTAN, DIST_EUCLIDEAN and DIST_SQUARED.
+    mu : float, optional
+        Value subtracted from x. The default is 0.
+    inv_std : float, optional
+        Value by which x is multiplied after subtracting mu. The default is 1.
+
+    Returns
+    -------
+    float
+        The distance between x and y, or a value greater than bound if the
+        computation was abandoned.
+
+    """
+    s = 0.
+    if metric == DIST_MANHATTAN:
+        for i in range(order.shape[0]):
+            j = order[i]
+            s += abs((x[j]-mu)*inv_std-y[j])
+            if s > bound:
+                return s
+        return s
+    if metric == DIST_EUCLIDEAN:
+        _bound = bound**2
+        for i in range(order.shape[0]):
+            j = order[i]
+            s += ((x[j]-mu)*inv_std-y[j])**2
+            if s > _bound:
+                return sqrt(s)
+        return sqrt(s)
+    for i in range(order.shape[0]):
+        j = order[i]
+        s += ((x[j]-mu)*inv_std-y[j])**2
+        if s > bound:
+            return s
     return s
 
+@njit(
+  fastmath=True, cache=True
+)
+def euclidean_ea(x, y, order, bound, mu=0., inv_std=1.):
+    return distance_ea(x, y, order, bound, DIST_EUCLIDEAN, mu, inv_std)
+
+@njit(
+  fastmath=True, cache=True
+)
+def squared_euclidean_ea(x, y, order, bound, mu=0., inv_std=1.):
+    return distance_ea(x, y, order, bound, DIST_SQUARED, mu, inv_std)
+
+@njit(
+  fastmath=True, cache=True
+)
+def manhattan_ea(x, y, order, bound, mu=0., inv_std=1.):
+    return distance_ea(x, y, order, bound, DIST_MANHATTAN, mu, inv_std)
+
+@njit(cache=True)
+def early_abandon_order(values):
+    """
+    Order in which the points of a shapelet are visited by the early 
+    abandoning distance functions. As in the UCR suite, the points with the 
+    highest absolute z-value are visited first, as they are the most likely
+    to make the partial distance grow quickly.
+
+    Parameters
+    ----------
+    values : array, shape=(length)
+        Values of the shapelet
+
+    Returns
+    -------
+    array, shape=(length)
+        Indexes of the values sorted by decreasing absolute deviation to their
+        mean.
+
+    """
+    return argsort(-_abs(values - values.mean()))
+
 ###############################################################################
 #                                                                             #
 #                    SUBSEQUENCE EXTRACTION FUNCTIONS                         #
@@ -274,305 +464,2622 @@ def _get_subsequence_phase(X, i_start, length, d, normalize):
 
 ###############################################################################
 #                                                                             #
-#                       DISTANCE VECTOR COMPUTATION                           #
+#                      ROLLING WINDOW STATISTICS                              #
 #                                                                             #
 ###############################################################################
 
+# With a dilation d, the windows of a time series are made of the values of
+# "chains" of timestamps spaced by d. Without phase invariance, the d chains
+# are x[p::d] for p in [0, d-1]. With phase invariance, the indexes are taken
+# modulo n_timestamps, which gives gcd(n_timestamps, d) circular chains. On
+# a chain, the windows are contiguous, so that their statistics can be
+# computed from cumulative sums, and so that they can be read as non-owning
+# views of a copy of the series where the chains are laid out one after the
+# other, instead of materializing all the strides.
+
 @njit(cache=True)
-def compute_shapelet_dist_vector(
-    x, values, length, dilation, dist_func, normalize, use_phase
-):
-    if normalize and use_phase:
-        return _compute_shapelet_dist_vector_norm_phase(
-            x, values, length, dilation, dist_func
-        )
-    elif normalize and not use_phase:
-        return _compute_shapelet_dist_vector_norm(
-            x, values, length, dilation, dist_func
-        )
-    elif not normalize and use_phase:
-        return _compute_shapelet_dist_vector_phase(
-            x, values, length, dilation, dist_func
-        )
-    elif not normalize and not use_phase:
-        return _compute_shapelet_dist_vector(
-            x, values, length, dilation, dist_func
-        )
+def _gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return a
+
+@njit(cache=True)
+def _next_pow2(n):
+    p = 1
+    while p < n:
+        p *= 2
+    return p
+
+@njit(cache=True)
+def _n_chains(n_timestamps, dilation, use_phase):
+    if use_phase:
+        return _gcd(n_timestamps, dilation)
     else:
-        raise ValueError('Wrong parameter for normalize or phase')
+        return min(dilation, n_timestamps)
 
-@njit(fastmath=True, cache=True)
-def _compute_shapelet_dist_vector(x, values, length, dilation, dist_func):
+@njit(cache=True)
+def _chain_size(n_timestamps, i_chain, dilation, n_chains, use_phase):
+    if use_phase:
+        return n_timestamps // n_chains
+    else:
+        return (n_timestamps - i_chain + dilation - 1) // dilation
+
+@njit(cache=True)
+def _chains_shape(n_timestamps, length, dilation, use_phase):
+    n_chains = _n_chains(n_timestamps, dilation, use_phase)
+    if use_phase:
+        _extend = length - 1
+        return n_chains, _extend, n_timestamps + n_chains*_extend, n_timestamps
+    else:
+        return n_chains, 0, n_timestamps, n_timestamps - (length-1)*dilation
+
+@njit(cache=True)
+def generate_chains_1D(x, length, dilation, use_phase):
     """
-    Compute a shapelet distance vector from an univariate time series 
-    and a dilated shapelet. Shapelet should be already normalized if normalizing
-    the distance
+    Lay out the chains of an univariate time series one after the other, so
+    that the window starting at timestamp i can be read as the contiguous 
+    view x_chains[win_start[i]:win_start[i]+length]. With phase invariance,
+    each chain is extended by its length-1 first values.
 
     Parameters
     ----------
     x : array, shape=(n_timestamps)
         An input time series
-    values : array, shape=(length)
-        The value array of the shapelet
     length : int
-        Length of the shapelet
+        Length of the windows.
     dilation : int
-        Dilation of the shapelet
-    normalize : float
-        Boolean converted as float (to avoid if statement) indicating
-        wheter or not the distance will be z-normalized
+        Dilation of the windows.
+    use_phase : bool
+        Wheter or not to use phase invariance.
 
     Returns
     -------
-    x_conv : array, shape=(n_timestamps - (length-1) * dilation)
-        The resulting distance vector
+    x_chains : array, shape=(n_chained)
+        Values of the chains.
+    win_start : array, shape=(n_windows)
+        Position in x_chains of the first value of each window.
 
     """
-    c = _generate_strides_1D(x, length, dilation)
-    x_conv = zeros(c.shape[0])
-    for i in prange(x_conv.shape[0]):
-        x_conv[i] = dist_func(c[i], values)
-    return x_conv
+    n_timestamps = x.shape[0]
+    n_chains, _extend, n_chained, n_windows = _chains_shape(
+        n_timestamps, length, dilation, use_phase
+    )
+    x_chains = zeros(n_chained, dtype=x.dtype)
+    win_start = zeros(n_windows, dtype=int64)
+    a = 0
+    for i_chain in range(n_chains):
+        _size = _chain_size(
+            n_timestamps, i_chain, dilation, n_chains, use_phase
+        )
+        for k in range(_size + _extend):
+            j = (i_chain + k*dilation) % n_timestamps
+            x_chains[a+k] = x[j]
+            if k < _size and j < n_windows:
+                win_start[j] = a + k
+        a += _size + _extend
+    return x_chains, win_start
 
-@njit(fastmath=True, cache=True)
-def _compute_shapelet_dist_vector_norm(x, values, length, dilation, dist_func):
+@njit(cache=True)
+def generate_chains_2D(X, length, dilation, use_phase):
     """
-    Compute a shapelet distance vector from an univariate time series 
-    and a dilated shapelet. Shapelet should be already normalized if normalizing
-    the distance.
+    Lay out the chains of each feature of a multivariate time series one after
+    the other, so that the window starting at timestamp i can be read as the 
+    contiguous view X_chains[ft, win_start[i]:win_start[i]+length]. With phase
+    invariance, each chain is extended by its length-1 first values.
 
     Parameters
     ----------
-    x : array, shape=(n_timestamps)
+    X : array, shape=(n_features, n_timestamps)
         An input time series
-    values : array, shape=(max_shapelet_length)
-        The value array of the shapelet
     length : int
-        Length of the shapelet
+        Length of the windows.
     dilation : int
-        Dilation of the shapelet
-    normalize : float
-        Boolean converted as float (to avoid if statement) indicating
-        wheter or not the distance will be z-normalized
+        Dilation of the windows.
+    use_phase : bool
+        Wheter or not to use phase invariance.
 
     Returns
     -------
-    x_conv : array, shape=(n_timestamps - (length-1) * dilation)
-        The resulting distance vector
+    X_chains : array, shape=(n_features, n_chained)
+        Values of the chains.
+    win_start : array, shape=(n_windows)
+        Position in X_chains of the first value of each window.
 
     """
-    c = _generate_strides_1D(x, length, dilation)
-    x_conv = zeros(c.shape[0])
-    for i in prange(x_conv.shape[0]):
-        x0 = (c[i] - c[i].mean())/(c[i].std()+1e-8)
-        x_conv[i] = dist_func(x0, values)
-    return x_conv
+    n_features, n_timestamps = X.shape
+    n_chains, _extend, n_chained, n_windows = _chains_shape(
+        n_timestamps, length, dilation, use_phase
+    )
+    X_chains = zeros((n_features, n_chained), dtype=X.dtype)
+    win_start = zeros(n_windows, dtype=int64)
+    a = 0
+    for i_chain in range(n_chains):
+        _size = _chain_size(
+            n_timestamps, i_chain, dilation, n_chains, use_phase
+        )
+        for k in range(_size + _extend):
+            j = (i_chain + k*dilation) % n_timestamps
+            for ft in range(n_features):
+                X_chains[ft, a+k] = X[ft, j]
+            if k < _size and j < n_windows:
+                win_start[j] = a + k
+        a += _size + _extend
+    return X_chains, win_start
 
 @njit(fastmath=True, cache=True)
-def _compute_shapelet_dist_vector_phase(x, values, length, dilation, dist_func):
+def sliding_mean_std(x, length, dilation, use_phase):
     """
-    Compute a shapelet distance vector from an univariate time series 
-    and a dilated shapelet. Shapelet should be already normalized if normalizing
-    the distance. It uses phase invariance.
+    Compute the mean and standard deviation of all the windows of an input
+    time series for a length and a dilation, in O(n_timestamps) using the
+    cumulative sums of the values and squared values of each dilation chain.
+    Nearly flat windows, for which cumulative sums are not precise enough,
+    are computed directly.
 
     Parameters
     ----------
     x : array, shape=(n_timestamps)
         An input time series
-    values : array, shape=(length)
-        The value array of the shapelet
     length : int
-        Length of the shapelet
+        Length of the windows
     dilation : int
-        Dilation of the shapelet
-    normalize : float
-        Boolean converted as float (to avoid if statement) indicating
-        wheter or not the distance will be z-normalized
+        Dilation of the windows
+    use_phase : bool
+        Wheter to use phase invariance
 
     Returns
     -------
-    x_conv : array, shape=(n_timestamps)
-        The resulting distance vector
+    x_mean : array, shape=(n_windows)
+        Mean of each window, with n_windows equal to n_timestamps if phase
+        invariance is used, n_timestamps - (length-1) * dilation otherwise.
+    x_std : array, shape=(n_windows)
+        Standard deviation of each window.
 
     """
-    c = _generate_strides_1D_phase(x, length, dilation)
-    x_conv = zeros(c.shape[0])
-    for i in prange(x_conv.shape[0]):
-        x_conv[i] = dist_func(c[i], values)
-    return x_conv
+    n_timestamps = x.shape[0]
+    n_chains = _n_chains(n_timestamps, dilation, use_phase)
+    if use_phase:
+        n_windows = n_timestamps
+    else:
+        n_windows = n_timestamps - (length - 1) * dilation
+    # Values are centered to limit rounding errors in the cumulative sums
+    center = x.mean()
+    x_mean = zeros(n_windows)
+    x_std = zeros(n_windows)
+    max_values = _chain_size(n_timestamps, 0, dilation, n_chains, use_phase)
+    s1 = zeros(max_values + length)
+    s2 = zeros(max_values + length)
+    for i_chain in range(n_chains):
+        size = _chain_size(n_timestamps, i_chain, dilation, n_chains, use_phase)
+        if use_phase:
+            n_values = size + length - 1
+            n_win_chain = size
+        else:
+            n_values = size
+            n_win_chain = max(0, size - length + 1)
+        for t in range(n_values):
+            v = x[(i_chain + t*dilation) % n_timestamps] - center
+            s1[t+1] = s1[t] + v
+            s2[t+1] = s2[t] + v*v
+        for k in range(n_win_chain):
+            idx = (i_chain + k*dilation) % n_timestamps
+            _mean = (s1[k+length] - s1[k]) / length
+            _sq = (s2[k+length] - s2[k]) / length
+            _var = _sq - _mean*_mean
+            if _var <= 1e-6 * _sq:
+                _mean = 0.
+                for j in range(length):
+                    _mean += x[(idx + j*dilation) % n_timestamps] - center
+                _mean = _mean / length
+                _var = 0.
+                for j in range(length):
+                    _diff = x[(idx + j*dilation) % n_timestamps] - center - _mean
+                    _var += _diff * _diff
+                _var = _var / length
+            x_mean[idx] = _mean + center
+            x_std[idx] = sqrt(max(0., _var))
+    return x_mean, x_std
 
 @njit(fastmath=True, cache=True)
-def _compute_shapelet_dist_vector_norm_phase(x, values, length, dilation, dist_func):
+def sliding_mean_std_2D(X, length, dilation, use_phase):
     """
-    Compute a shapelet distance vector from an univariate time series 
-    and a dilated shapelet. Shapelet should be already normalized if normalizing
-    the distance. It uses phase invariance.
+    Apply sliding_mean_std to each feature of a multivariate time series.
 
     Parameters
     ----------
-    x : array, shape=(n_timestamps)
-        An input time series
-    values : array, shape=(max_shapelet_length)
-        The value array of the shapelet
+    X : array, shape=(n_features, n_timestamps)
+        A multivariate time series
     length : int
-        Length of the shapelet
+        Length of the windows
     dilation : int
-        Dilation of the shapelet
-    normalize : float
-        Boolean converted as float (to avoid if statement) indicating
-        wheter or not the distance will be z-normalized
+        Dilation of the windows
+    use_phase : bool
+        Wheter to use phase invariance
 
     Returns
     -------
-    x_conv : array, shape=(n_timestamps)
-        The resulting distance vector
+    X_mean : array, shape=(n_features, n_windows)
+        Mean of each window.
+    X_std : array, shape=(n_features, n_windows)
+        Standard deviation of each window.
 
     """
-    c = _generate_strides_1D_phase(x, length, dilation)
-    x_conv = zeros(c.shape[0])
-    for i in prange(x_conv.shape[0]):
-        x0 = (c[i] - c[i].mean())/(c[i].std()+1e-8)
-        x_conv[i] = dist_func(x0, values)
-    return x_conv
+    n_features, n_timestamps = X.shape
+    if use_phase:
+        n_windows = n_timestamps
+    else:
+        n_windows = n_timestamps - (length - 1) * dilation
+    X_mean = zeros((n_features, n_windows))
+    X_std = zeros((n_features, n_windows))
+    for ft in range(n_features):
+        X_mean[ft], X_std[ft] = sliding_mean_std(
+            X[ft], length, dilation, use_phase
+        )
+    return X_mean, X_std
+
+###############################################################################
+#                                                                             #
+#                  SLIDING DOT PRODUCT DISTANCE ENGINE                        #
+#                                                                             #
+###############################################################################
 
+# The distance profile of a shapelet on a dilation chain is a contiguous 
+# sliding dot product, which we compute with the FFT, combined with the 
+# rolling statistics of the windows.
 
-@njit(fastmath=True, cache=True)
-def apply_one_shapelet_one_sample_univariate(x, values, threshold, dist_func):
+@njit(cache=True)
+def _fft_twiddles(n):
     """
-    Extract the three features from the distance between a shapelet and the 
-    strides of an input time series generated by the length and dilation 
-    parameter of the shapelet. If normalization should be used, all strides
-    of should be z-normalized independently.
+    Compute the twiddle factors exp(-2i*pi*k/n) for k in [0, n/2[ used by
+    the radix-2 FFT.
 
     Parameters
     ----------
-    x : array, shape=(n_timestamps - (length-1)*dilation, length)
-        Strides of an input time series
-    values : array, shape=(max(shapelet_sizes))
-        Values of the shapelet
-    threshold : float
-        The threshold to compute the shapelet occurence feature.
-    
+    n : int
+        Size of the FFT, must be a power of 2.
+
     Returns
     -------
-    _min : float
-        The minimum euclidean distance between the shapelet and the input time
-        series
-    float
-        The location of the minimum euclidean distance divided by the length 
-        of the distance vector (i.e scaled between [0,1]).        
-    float
-        The number of points in the distance vector inferior to the threshold 
-        divided by the length of the distance vector (i.e scaled between [0,1])
+    tw : array, shape=(max(1, n//2))
+        The twiddle factors.
 
     """
-    n_candidates, length = x.shape
+    tw = zeros(max(1, n//2), dtype=complex128)
+    for k in range(n//2):
+        tw[k] = complex(cos(2*pi*k/n), -sin(2*pi*k/n))
+    return tw
 
-    _n_match = 0
-    _min = 1e+100
-    _argmin = 0
+@njit(fastmath=True, cache=True)
+def _fft(a, tw, inverse):
+    """
+    In place iterative radix-2 fast Fourier transform.
 
-    #For each step of the moving window in the shapelet distance
-    for i in range(n_candidates):
-        _dist = dist_func(x[i], values)
+    Parameters
+    ----------
+    a : array, shape=(n)
+        Complex array to transform, n must be a power of 2.
+    tw : array, shape=(n//2)
+        Twiddle factors given by _fft_twiddles(n).
+    inverse : bool
+        Wheter to compute the inverse transform (including the 1/n scaling).
 
-        if _dist < _min:
-            _min = _dist
-            _argmin = i
+    Returns
+    -------
+    None.
 
-        if _dist <= threshold:
-            _n_match += 1
-            
-    return _min, float_(_argmin), float_(_n_match)
+    """
+    n = a.shape[0]
+    # Bit reversal permutation
+    j = 0
+    for i in range(1, n):
+        bit = n >> 1
+        while j & bit:
+            j ^= bit
+            bit >>= 1
+        j ^= bit
+        if i < j:
+            tmp = a[i]
+            a[i] = a[j]
+            a[j] = tmp
+    size = 2
+    while size <= n:
+        half = size // 2
+        step = n // size
+        for start in range(0, n, size):
+            for k in range(half):
+                w = tw[k*step]
+                if inverse:
+                    w = w.conjugate()
+                v = a[start+k+half] * w
+                a[start+k+half] = a[start+k] - v
+                a[start+k] = a[start+k] + v
+        size *= 2
+    if inverse:
+        for i in range(n):
+            a[i] = a[i] / n
 
-@njit(fastmath=True, cache=True)
-def apply_one_shapelet_one_sample_multivariate(x, values, threshold, dist_func):
+@njit(cache=True)
+def sdp_is_faster(n_timestamps, length, dilation, use_phase):
     """
-    Extract the three features from the distance between a shapelet and the 
-    strides of an input time series generated by the length and dilation 
-    parameter of the shapelet. If normalization should be used, all strides
-    of should be z-normalized independently.
+    Estimate if the sliding dot product engine is faster than the direct
+    computation of the distance vector for a shapelet.
 
     Parameters
     ----------
-    x : array, shape=(n_timestamps - (length-1)*dilation, length)
-        Strides of an input time series
-    values : array, shape=(max(shapelet_sizes))
-        Values of the shapelet
-    threshold : float
-        The threshold to compute the shapelet occurence feature.
-    
+    n_timestamps : int
+        Number of timestamps of the input time series.
+    length : int
+        Length of the shapelet.
+    dilation : int
+        Dilation of the shapelet.
+    use_phase : bool
+        Wheter to use phase invariance.
+
     Returns
     -------
-    _min : float
-        The minimum euclidean distance between the shapelet and the input time
-        series
-    float
-        The location of the minimum euclidean distance divided by the length 
-        of the distance vector (i.e scaled between [0,1]).        
-    float
-        The number of points in the distance vector inferior to the threshold 
-        divided by the length of the distance vector (i.e scaled between [0,1])
+    bool
+        True if the sliding dot product engine should be used.
 
     """
-    n_ft, n_candidates, length = x.shape
-
-    _n_match = 0
-    _min = 1e+10
-    _argmin = 0
-    
-    #For each step of the moving window in the shapelet distance
-    for i in range(n_candidates):
-        _dist = 0
-        for ft in prange(n_ft):
-            _dist += dist_func(x[ft, i], values[ft])
-    
-        if _dist < _min:
-            _min = _dist
-            _argmin = i
-            
-        if _dist <= threshold:
-            _n_match += 1
-    
-    return _min, float_(_argmin), float_(_n_match)
-
+    n_chains = _n_chains(n_timestamps, dilation, use_phase)
+    size = _chain_size(n_timestamps, 0, dilation, n_chains, use_phase)
+    if use_phase:
+        size += length - 1
+        n_windows = n_timestamps
+    else:
+        n_windows = n_timestamps - (length - 1) * dilation
+    nfft = _next_pow2(size)
+    # One FFT for the shapelet and one inverse FFT per chain
+    sdp_cost = SDP_FFT_COST * (n_chains + 1) * nfft * max(1., log2(nfft))
+    return sdp_cost + 4 * n_windows < n_windows * length
 
-@njit(cache=True)
-def _combinations_1d(x,y):
+@njit(fastmath=True, cache=True)
+def sdp_prepare(x, length, dilation, use_phase):
     """
-    Return the unique combination (in the 2nd dimension) of the 2D array made by
-    concatenating x and y.
+    Compute the elements of the sliding dot product engine that only depend
+    on the input time series and on the (length, dilation) parameters, so they
+    can be shared by all shapelets with these parameters.
 
     Parameters
     ----------
-    x : array, shape=(u)
-        A 1D array of values
-    y : array, shape=(v)
-        A 1D array of values
+    x : array, shape=(n_timestamps)
+        An input time series.
+    length : int
+        Length of the shapelets.
+    dilation : int
+        Dilation of the shapelets.
+    use_phase : bool
+        Wheter to use phase invariance.
 
     Returns
     -------
-    array, shape=(w, 2)
-        The unique combination (in the 2nd dimension) of the 2D array made by
-        concatenating x and y.
+    x_fft : array, shape=(n_chains, nfft)
+        FFT of the centered values of each chain.
+    win_mean : array, shape=(n_windows)
+        Mean of the centered values of each window.
+    win_std : array, shape=(n_windows)
+        Standard deviation of the values of each window.
+    center : float
+        The mean of x, substracted to all values to limit rounding errors.
+    tw : array, shape=(nfft//2)
+        Twiddle factors of the FFT.
 
     """
-    # Fix issues with multiple length, but could be optimized
-    u_x = unique(x)
-    u_y = unique(y)
-    u_mask = zeros((u_x.shape[0], u_y.shape[0]),dtype=bool_)
-    
-    for i in range(x.shape[0]):
-        u_mask[where(u_x==x[i])[0][0],where(u_y==y[i])[0][0]] = True
-    combinations = zeros((u_mask.sum(),2), dtype=int64)
-    i_comb = 0
-    for i in range(x.shape[0]):
-        if u_mask[where(u_x==x[i])[0][0],where(u_y==y[i])[0][0]]:
-            combinations[i_comb,0] = x[i]
-            combinations[i_comb,1] = y[i]
-            u_mask[where(u_x==x[i])[0][0],where(u_y==y[i])[0][0]] = False
-            i_comb += 1
-    return combinations
+    n_timestamps = x.shape[0]
+    n_chains = _n_chains(n_timestamps, dilation, use_phase)
+    size = _chain_size(n_timestamps, 0, dilation, n_chains, use_phase)
+    if use_phase:
+        nfft = _next_pow2(size + length - 1)
+    else:
+        nfft = _next_pow2(size)
+    tw = _fft_twiddles(nfft)
+    center = x.mean()
+    win_mean, win_std = sliding_mean_std(x, length, dilation, use_phase)
+    win_mean -= center
+
+    x_fft = zeros((n_chains, nfft), dtype=complex128)
+    for i_chain in range(n_chains):
+        size = _chain_size(n_timestamps, i_chain, dilation, n_chains, use_phase)
+        if use_phase:
+            n_values = size + length - 1
+        else:
+            n_values = size
+        for t in range(n_values):
+            x_fft[i_chain, t] = x[(i_chain + t*dilation) % n_timestamps] - center
+        _fft(x_fft[i_chain], tw, False)
+    return x_fft, win_mean, win_std, center, tw
+
+@njit(fastmath=True, cache=True)
+def sdp_distance_vector(
+    x_fft, win_mean, win_std, center, tw, n_timestamps, values, length,
+    dilation, normalize, use_phase, sdp_mode
+):
+    """
+    Compute the distance vector between a shapelet and an input time series
+    using the sliding dot product engine. The output is the same as the one of
+    compute_shapelet_dist_vector, up to rounding errors.
+
+    Parameters
+    ----------
+    x_fft, win_mean, win_std, center, tw : 
+        The output of sdp_prepare for the input time series.
+    n_timestamps : int
+        Number of timestamps of the input time series.
+    values : array, shape=(length)
+        The value array of the shapelet
+    length : int
+        Length of the shapelet
+    dilation : int
+        Dilation of the shapelet
+    normalize : bool
+        Wheter the distance is z-normalized. The shapelet values should already
+        be z-normalized.
+    use_phase : bool
+        Wheter to use phase invariance
+    sdp_mode : int
+        Either SDP_SQUARED or SDP_EUCLIDEAN.
+
+    Returns
+    -------
+    x_conv : array, shape=(n_windows)
+        The resulting distance vector
+
+    """
+    n_chains, nfft = x_fft.shape
+    if use_phase:
+        n_windows = n_timestamps
+    else:
+        n_windows = n_timestamps - (length - 1) * dilation
+    
+    #Reversed shapelet to obtain a correlation from a convolution
+    s_fft = zeros(nfft, dtype=complex128)
+    sum_s = 0.
+    sum_s2 = 0.
+    for j in range(length):
+        if normalize:
+            v = values[j]
+        else:
+            v = values[j] - center
+        s_fft[length-1-j] = v
+        sum_s += v
+        sum_s2 += v*v
+    _fft(s_fft, tw, False)
+    
+    buf = empty(nfft, dtype=complex128)
+    x_conv = zeros(n_windows)
+    for i_chain in range(n_chains):
+        size = _chain_size(n_timestamps, i_chain, dilation, n_chains, use_phase)
+        if use_phase:
+            n_win_chain = size
+        else:
+            n_win_chain = max(0, size - length + 1)
+        if n_win_chain == 0:
+            continue
+        for t in range(nfft):
+            buf[t] = x_fft[i_chain, t] * s_fft[t]
+        _fft(buf, tw, True)
+        for k in range(n_win_chain):
+            idx = (i_chain + k*dilation) % n_timestamps
+            x_conv[idx] = _distance_from_dot_product(
+                buf[k+length-1].real, win_mean[idx], win_std[idx], length,
+                sum_s, sum_s2, normalize, sdp_mode
+            )
+    return x_conv
+
+@njit(fastmath=True, cache=True)
+def _distance_from_dot_product(
+    qt, _mean, _std, length, sum_s, sum_s2, normalize, sdp_mode
+):
+    """
+    Compute the distance between a shapelet and a window from their dot
+    product qt and the statistics of the window. Window values and mean are
+    centered, and so should be the shapelet values if they are not 
+    z-normalized, sum_s and sum_s2 being the sum and sum of squares of the
+    shapelet values.
+    """
+    if normalize:
+        if _std == 0:
+            # The z-normalized window is null
+            _dist = sum_s2
+        else:
+            _inv_std = 1 / (_std + 1e-8)
+            _dist = (
+                length * _std * _std * _inv_std * _inv_std
+                - 2 * (qt - _mean * sum_s) * _inv_std + sum_s2
+            )
+    else:
+        _dist = length * (_std*_std + _mean*_mean) - 2*qt + sum_s2
+    _dist = max(0., _dist)
+    if sdp_mode == SDP_EUCLIDEAN:
+        _dist = sqrt(_dist)
+    return _dist
+
+@njit(fastmath=True, cache=True)
+def sdp_prepare_2D(X, length, dilation, use_phase):
+    """
+    Apply sdp_prepare to each feature of a multivariate time series.
+
+    Parameters
+    ----------
+    X : array, shape=(n_features, n_timestamps)
+        A multivariate time series.
+    length : int
+        Length of the shapelets.
+    dilation : int
+        Dilation of the shapelets.
+    use_phase : bool
+        Wheter to use phase invariance.
+
+    Returns
+    -------
+    x_fft : array, shape=(n_features, n_chains, nfft)
+    win_mean : array, shape=(n_features, n_windows)
+    win_std : array, shape=(n_features, n_windows)
+    center : array, shape=(n_features)
+    tw : array, shape=(nfft//2)
+        See sdp_prepare.
+
+    """
+    n_ft = X.shape[0]
+    _x_fft, _win_mean, _win_std, _center, tw = sdp_prepare(
+        X[0], length, dilation, use_phase
+    )
+    x_fft = zeros((n_ft, _x_fft.shape[0], _x_fft.shape[1]), dtype=complex128)
+    win_mean = zeros((n_ft, _win_mean.shape[0]))
+    win_std = zeros((n_ft, _win_std.shape[0]))
+    center = zeros(n_ft)
+    x_fft[0] = _x_fft
+    win_mean[0] = _win_mean
+    win_std[0] = _win_std
+    center[0] = _center
+    for ft in range(1, n_ft):
+        _x_fft, _win_mean, _win_std, _center, _ = sdp_prepare(
+            X[ft], length, dilation, use_phase
+        )
+        x_fft[ft] = _x_fft
+        win_mean[ft] = _win_mean
+        win_std[ft] = _win_std
+        center[ft] = _center
+    return x_fft, win_mean, win_std, center, tw
+
+@njit(fastmath=True, cache=True)
+def _features_from_dist_vector(x_dist, threshold, min_init):
+    """
+    Extract the min, argmin and shapelet occurence features from a distance
+    vector, with the same semantics as the apply_one_shapelet_one_sample
+    functions.
+    """
+    _n_match = 0
+    _min = min_init
+    _argmin = 0
+    for i in range(x_dist.shape[0]):
+        _dist = x_dist[i]
+        if _dist < _min:
+            _min = _dist
+            _argmin = i
+        if _dist <= threshold:
+            _n_match += 1
+    return _min, float_(_argmin), float_(_n_match)
+
+###############################################################################
+#                                                                             #
+#                    BATCHED (GEMM) DISTANCE ENGINE                           #
+#                                                                             #
+###############################################################################
+
+# For the squared and euclidean distances, the dot products between all the
+# windows of a series and all the shapelets sharing a length and dilation are
+# a matrix product, computed by BLAS on blocks of windows. Distances are then
+# obtained from the dot products as in the sliding dot product engine.
+
+@njit(cache=True)
+def gemm_block_size(n_rows, length):
+    """
+    Number of windows processed at once by the batched engine, such that the
+    block of windows and the block of dot products with n_rows shapelets fit
+    in GEMM_BLOCK_BYTES.
+    """
+    return max(16, GEMM_BLOCK_BYTES // (8 * (n_rows + length)))
+
+@njit(fastmath=True, cache=True)
+def gemm_apply_group_univariate(
+    x, S, normalize, threshold, length, dilation, use_phase, sdp_mode
+):
+    """
+    Extract the three features of a group of shapelets sharing the same 
+    length and dilation from an univariate time series, using matrix products
+    between blocks of windows and the shapelets.
+
+    Parameters
+    ----------
+    x : array, shape=(n_timestamps)
+        An input time series
+    S : array, shape=(n_shapelets, length)
+        Values of the shapelets of the group
+    normalize : array, shape=(n_shapelets)
+        Normalization indicator of the shapelets
+    threshold : array, shape=(n_shapelets)
+        Threshold of the shapelets
+    length : int
+        Length of the shapelets
+    dilation : int
+        Dilation of the shapelets
+    use_phase : bool
+        Wheter to use phase invariance
+    sdp_mode : int
+        Either SDP_SQUARED or SDP_EUCLIDEAN.
+
+    Returns
+    -------
+    X_new : array, shape=(n_shapelets, 3)
+        The min, argmin and shapelet occurence features of each shapelet.
+
+    """
+    n_shapelets = S.shape[0]
+    center = x.mean()
+    win_mean, win_std = sliding_mean_std(x, length, dilation, use_phase)
+    x_chains, win_start = generate_chains_1D(x, length, dilation, use_phase)
+    n_windows = win_start.shape[0]
+
+    sum_s = zeros(n_shapelets)
+    sum_s2 = zeros(n_shapelets)
+    for k in range(n_shapelets):
+        for j in range(length):
+            if normalize[k]:
+                v = S[k, j]
+            else:
+                v = S[k, j] - center
+            sum_s[k] += v
+            sum_s2[k] += v*v
+
+    _min = full(n_shapelets, 1e+100)
+    _argmin = zeros(n_shapelets, dtype=int64)
+    _n_match = zeros(n_shapelets, dtype=int64)
+    block = gemm_block_size(n_shapelets, length)
+    W = zeros((block, length))
+    for i0 in range(0, n_windows, block):
+        n_block = min(block, n_windows - i0)
+        for b in range(n_block):
+            _start = win_start[i0+b]
+            for j in range(length):
+                W[b, j] = x_chains[_start+j] - center
+        QT = dot(W, S.T)
+        for b in range(n_block):
+            i = i0 + b
+            _mean = win_mean[i] - center
+            for k in range(n_shapelets):
+                if normalize[k]:
+                    qt = QT[b, k]
+                else:
+                    # Dot product with the centered shapelet
+                    qt = QT[b, k] - center * length * _mean
+                _dist = _distance_from_dot_product(
+                    qt, _mean, win_std[i], length, sum_s[k], sum_s2[k],
+                    normalize[k], sdp_mode
+                )
+                if _dist < _min[k]:
+                    _min[k] = _dist
+                    _argmin[k] = i
+                if _dist <= threshold[k]:
+                    _n_match[k] += 1
+
+    X_new = zeros((n_shapelets, 3))
+    for k in range(n_shapelets):
+        X_new[k, 0] = _min[k]
+        X_new[k, 1] = _argmin[k]
+        X_new[k, 2] = _n_match[k]
+    return X_new
+
+@njit(fastmath=True, cache=True)
+def gemm_apply_group_multivariate(
+    X, S, row_channel, row_shapelet, normalize, threshold, length, dilation,
+    use_phase, sdp_mode
+):
+    """
+    Extract the three features of a group of multivariate shapelets sharing
+    the same length and dilation from a multivariate time series, using matrix
+    products between blocks of windows and the shapelets channels.
+
+    Parameters
+    ----------
+    X : array, shape=(n_features, n_timestamps)
+        An input time series
+    S : array, shape=(n_rows, length)
+        Values of the channels of the shapelets of the group, sorted by 
+        channel.
+    row_channel : array, shape=(n_rows)
+        Channel of the input time series of each row of S.
+    row_shapelet : array, shape=(n_rows)
+        Shapelet (in [0, n_shapelets-1]) of each row of S.
+    normalize : array, shape=(n_shapelets)
+        Normalization indicator of the shapelets
+    threshold : array, shape=(n_shapelets)
+        Threshold of the shapelets
+    length : int
+        Length of the shapelets
+    dilation : int
+        Dilation of the shapelets
+    use_phase : bool
+        Wheter to use phase invariance
+    sdp_mode : int
+        Either SDP_SQUARED or SDP_EUCLIDEAN.
+
+    Returns
+    -------
+    X_new : array, shape=(n_shapelets, 3)
+        The min, argmin and shapelet occurence features of each shapelet.
+
+    """
+    n_features = X.shape[0]
+    n_rows = S.shape[0]
+    n_shapelets = normalize.shape[0]
+    center = zeros(n_features)
+    for ft in range(n_features):
+        center[ft] = X[ft].mean()
+    win_mean, win_std = sliding_mean_std_2D(X, length, dilation, use_phase)
+    X_chains, win_start = generate_chains_2D(X, length, dilation, use_phase)
+    n_windows = win_start.shape[0]
+
+    # Rows of S using each channel are [ch_ptr[ft], ch_ptr[ft+1]]
+    ch_ptr = zeros(n_features+1, dtype=int64)
+    sum_s = zeros(n_rows)
+    sum_s2 = zeros(n_rows)
+    for r in range(n_rows):
+        ch_ptr[row_channel[r]+1] += 1
+        for j in range(length):
+            if normalize[row_shapelet[r]]:
+                v = S[r, j]
+            else:
+                v = S[r, j] - center[row_channel[r]]
+            sum_s[r] += v
+            sum_s2[r] += v*v
+    for ft in range(n_features):
+        ch_ptr[ft+1] += ch_ptr[ft]
+
+    _min = full(n_shapelets, 1e+10)
+    _argmin = zeros(n_shapelets, dtype=int64)
+    _n_match = zeros(n_shapelets, dtype=int64)
+    block = gemm_block_size(n_rows, length)
+    W = zeros((block, length))
+    D = zeros((block, n_shapelets))
+    for i0 in range(0, n_windows, block):
+        n_block = min(block, n_windows - i0)
+        D[:] = 0
+        for ft in range(n_features):
+            r0 = ch_ptr[ft]
+            r1 = ch_ptr[ft+1]
+            if r1 > r0:
+                for b in range(n_block):
+                    _start = win_start[i0+b]
+                    for j in range(length):
+                        W[b, j] = X_chains[ft, _start+j] - center[ft]
+                QT = dot(W, S[r0:r1].T)
+                for b in range(n_block):
+                    _mean = win_mean[ft, i0+b] - center[ft]
+                    for r in range(r0, r1):
+                        k = row_shapelet[r]
+                        if normalize[k]:
+                            qt = QT[b, r-r0]
+                        else:
+                            qt = QT[b, r-r0] - center[ft] * length * _mean
+                        D[b, k] += _distance_from_dot_product(
+                            qt, _mean, win_std[ft, i0+b], length, sum_s[r],
+                            sum_s2[r], normalize[k], sdp_mode
+                        )
+        for b in range(n_block):
+            i = i0 + b
+            for k in range(n_shapelets):
+                _dist = D[b, k]
+                if _dist < _min[k]:
+                    _min[k] = _dist
+                    _argmin[k] = i
+                if _dist <= threshold[k]:
+                    _n_match[k] += 1
+
+    X_new = zeros((n_shapelets, 3))
+    for k in range(n_shapelets):
+        X_new[k, 0] = _min[k]
+        X_new[k, 1] = _argmin[k]
+        X_new[k, 2] = _n_match[k]
+    return X_new
+
+###############################################################################
+#                                                                             #
+#                       DISTANCE VECTOR COMPUTATION                           #
+#                                                                             #
+###############################################################################
+
+@njit(cache=True)
+def compute_shapelet_dist_vector(
+    x, values, length, dilation, metric, normalize, use_phase,
+    sdp_mode=SDP_DISABLED
+):
+    if sdp_mode != SDP_DISABLED and sdp_is_faster(
+        x.shape[0], length, dilation, use_phase
+    ):
+        x_fft, win_mean, win_std, center, tw = sdp_prepare(
+            x, length, dilation, use_phase
+        )
+        return sdp_distance_vector(
+            x_fft, win_mean, win_std, center, tw, x.shape[0], values, length,
+            dilation, normalize, use_phase, sdp_mode
+        )
+    elif normalize and use_phase:
+        return _compute_shapelet_dist_vector_norm_phase(
+            x, values, length, dilation, metric
+        )
+    elif normalize and not use_phase:
+        return _compute_shapelet_dist_vector_norm(
+            x, values, length, dilation, metric
+        )
+    elif not normalize and use_phase:
+        return _compute_shapelet_dist_vector_phase(
+            x, values, length, dilation, metric
+        )
+    elif not normalize and not use_phase:
+        return _compute_shapelet_dist_vector(
+            x, values, length, dilation, metric
+        )
+    else:
+        raise ValueError('Wrong parameter for normalize or phase')
+
+@njit(fastmath=True, cache=True)
+def _compute_shapelet_dist_vector(x, values, length, dilation, metric):
+    """
+    Compute a shapelet distance vector from an univariate time series 
+    and a dilated shapelet. Shapelet should be already normalized if normalizing
+    the distance
+
+    Parameters
+    ----------
+    x : array, shape=(n_timestamps)
+        An input time series
+    values : array, shape=(length)
+        The value array of the shapelet
+    length : int
+        Length of the shapelet
+    dilation : int
+        Dilation of the shapelet
+    normalize : float
+        Boolean converted as float (to avoid if statement) indicating
+        wheter or not the distance will be z-normalized
+
+    Returns
+    -------
+    x_conv : array, shape=(n_timestamps - (length-1) * dilation)
+        The resulting distance vector
+
+    """
+    x_chains, win_start = generate_chains_1D(x, length, dilation, False)
+    x_conv = zeros(win_start.shape[0])
+    for i in prange(x_conv.shape[0]):
+        _start = win_start[i]
+        x_conv[i] = distance(x_chains[_start:_start+length], values, metric)
+    return x_conv
+
+@njit(fastmath=True, cache=True)
+def _compute_shapelet_dist_vector_norm(x, values, length, dilation, metric):
+    """
+    Compute a shapelet distance vector from an univariate time series 
+    and a dilated shapelet. Shapelet should be already normalized if normalizing
+    the distance.
+
+    Parameters
+    ----------
+    x : array, shape=(n_timestamps)
+        An input time series
+    values : array, shape=(max_shapelet_length)
+        The value array of the shapelet
+    length : int
+        Length of the shapelet
+    dilation : int
+        Dilation of the shapelet
+    normalize : float
+        Boolean converted as float (to avoid if statement) indicating
+        wheter or not the distance will be z-normalized
+
+    Returns
+    -------
+    x_conv : array, shape=(n_timestamps - (length-1) * dilation)
+        The resulting distance vector
+
+    """
+    x_chains, win_start = generate_chains_1D(x, length, dilation, False)
+    x_mean, x_std = sliding_mean_std(x, length, dilation, False)
+    x_conv = zeros(win_start.shape[0])
+    for i in prange(x_conv.shape[0]):
+        _start = win_start[i]
+        x_conv[i] = distance(
+            x_chains[_start:_start+length], values, metric, x_mean[i],
+            1/(x_std[i]+1e-8)
+        )
+    return x_conv
+
+@njit(fastmath=True, cache=True)
+def _compute_shapelet_dist_vector_phase(x, values, length, dilation, metric):
+    """
+    Compute a shapelet distance vector from an univariate time series 
+    and a dilated shapelet. Shapelet should be already normalized if normalizing
+    the distance. It uses phase invariance.
+
+    Parameters
+    ----------
+    x : array, shape=(n_timestamps)
+        An input time series
+    values : array, shape=(length)
+        The value array of the shapelet
+    length : int
+        Length of the shapelet
+    dilation : int
+        Dilation of the shapelet
+    normalize : float
+        Boolean converted as float (to avoid if statement) indicating
+        wheter or not the distance will be z-normalized
+
+    Returns
+    -------
+    x_conv : array, shape=(n_timestamps)
+        The resulting distance vector
+
+    """
+    x_chains, win_start = generate_chains_1D(x, length, dilation, True)
+    x_conv = zeros(win_start.shape[0])
+    for i in prange(x_conv.shape[0]):
+        _start = win_start[i]
+        x_conv[i] = distance(x_chains[_start:_start+length], values, metric)
+    return x_conv
+
+@njit(fastmath=True, cache=True)
+def _compute_shapelet_dist_vector_norm_phase(x, values, length, dilation, metric):
+    """
+    Compute a shapelet distance vector from an univariate time series 
+    and a dilated shapelet. Shapelet should be already normalized if normalizing
+    the distance. It uses phase invariance.
+
+    Parameters
+    ----------
+    x : array, shape=(n_timestamps)
+        An input time series
+    values : array, shape=(max_shapelet_length)
+        The value array of the shapelet
+    length : int
+        Length of the shapelet
+    dilation : int
+        Dilation of the shapelet
+    normalize : float
+        Boolean converted as float (to avoid if statement) indicating
+        wheter or not the distance will be z-normalized
+
+    Returns
+    -------
+    x_conv : array, shape=(n_timestamps)
+        The resulting distance vector
+
+    """
+    x_chains, win_start = generate_chains_1D(x, length, dilation, True)
+    x_mean, x_std = sliding_mean_std(x, length, dilation, True)
+    x_conv = zeros(win_start.shape[0])
+    for i in prange(x_conv.shape[0]):
+        _start = win_start[i]
+        x_conv[i] = distance(
+            x_chains[_start:_start+length], values, metric, x_mean[i],
+            1/(x_std[i]+1e-8)
+        )
+    return x_conv
+
+
+@njit(fastmath=True, cache=True)
+def apply_one_shapelet_one_sample_univariate(
+    x_chains, win_start, values, threshold, metric
+):
+    """
+    Extract the three features from the distance between a shapelet and the 
+    windows of an input time series generated by the length and dilation 
+    parameter of the shapelet. Windows are read as views of the chains of the
+    input, without being copied.
+
+    Parameters
+    ----------
+    x_chains : array, shape=(n_chained)
+        Chains of an input time series, as given by generate_chains_1D.
+    win_start : array, shape=(n_windows)
+        Position in x_chains of the first value of each window.
+    values : array, shape=(length)
+        Values of the shapelet
+    threshold : float
+        The threshold to compute the shapelet occurence feature.
+    metric : int
+        The distance, among DIST_MANHATTAN, DIST_EUCLIDEAN and DIST_SQUARED.
+    
+    Returns
+    -------
+    _min : float
+        The minimum euclidean distance between the shapelet and the input time
+        series
+    float
+        The location of the minimum euclidean distance divided by the length 
+        of the distance vector (i.e scaled between [0,1]).        
+    float
+        The number of points in the distance vector inferior to the threshold 
+        divided by the length of the distance vector (i.e scaled between [0,1])
+
+    """
+    length = values.shape[0]
+    n_candidates = win_start.shape[0]
+
+    _n_match = 0
+    _min = 1e+100
+    _argmin = 0
+
+    #For each step of the moving window in the shapelet distance
+    for i in range(n_candidates):
+        _start = win_start[i]
+        _dist = distance(x_chains[_start:_start+length], values, metric)
+
+        if _dist < _min:
+            _min = _dist
+            _argmin = i
+
+        if _dist <= threshold:
+            _n_match += 1
+            
+    return _min, float_(_argmin), float_(_n_match)
+
+@njit(fastmath=True, cache=True)
+def apply_one_shapelet_one_sample_multivariate(
+    x_chains, win_start, channels, values, threshold, metric
+):
+    """
+    Extract the three features from the distance between a multivariate 
+    shapelet and the windows of an input time series generated by the length
+    and dilation parameter of the shapelet. Windows are read as views of the
+    chains of the input, without being copied.
+
+    Parameters
+    ----------
+    x_chains : array, shape=(n_features, n_chained)
+        Chains of an input time series, as given by generate_chains_2D.
+    win_start : array, shape=(n_windows)
+        Position in x_chains of the first value of each window.
+    channels : array, shape=(n_channels)
+        Channels of x used by the shapelet
+    values : array, shape=(n_channels, length)
+        Values of the shapelet
+    threshold : float
+        The threshold to compute the shapelet occurence feature.
+    metric : int
+        The distance, among DIST_MANHATTAN, DIST_EUCLIDEAN and DIST_SQUARED.
+    
+    Returns
+    -------
+    _min : float
+        The minimum euclidean distance between the shapelet and the input time
+        series
+    float
+        The location of the minimum euclidean distance divided by the length 
+        of the distance vector (i.e scaled between [0,1]).        
+    float
+        The number of points in the distance vector inferior to the threshold 
+        divided by the length of the distance vector (i.e scaled between [0,1])
+
+    """
+    n_ft, length = values.shape
+    n_candidates = win_start.shape[0]
+
+    _n_match = 0
+    _min = 1e+10
+    _argmin = 0
+    
+    #For each step of the moving window in the shapelet distance
+    for i in range(n_candidates):
+        _start = win_start[i]
+        _dist = 0
+        for i_ft in prange(n_ft):
+            _dist += distance(
+                x_chains[channels[i_ft], _start:_start+length], values[i_ft],
+                metric
+            )
+    
+        if _dist < _min:
+            _min = _dist
+            _argmin = i
+            
+        if _dist <= threshold:
+            _n_match += 1
+    
+    return _min, float_(_argmin), float_(_n_match)
+
+
+@njit(fastmath=True, cache=True)
+def apply_one_shapelet_one_sample_univariate_norm(
+    x_chains, win_start, values, threshold, metric, x_mean, x_inv_std
+):
+    """
+    Extract the three features from the z-normalized distance between a 
+    shapelet and the windows of an input time series generated by the length
+    and dilation parameter of the shapelet. The windows are z-normalized on
+    the fly using their mean and standard deviation.
+
+    Parameters
+    ----------
+    x_chains : array, shape=(n_chained)
+        Chains of an input time series, as given by generate_chains_1D.
+    win_start : array, shape=(n_windows)
+        Position in x_chains of the first value of each window.
+    values : array, shape=(length)
+        Values of the shapelet
+    threshold : float
+        The threshold to compute the shapelet occurence feature.
+    metric : int
+        The distance, among DIST_MANHATTAN, DIST_EUCLIDEAN and DIST_SQUARED.
+    x_mean : array, shape=(n_windows)
+        Mean of each window.
+    x_inv_std : array, shape=(n_windows)
+        Inverse of the standard deviation of each window.
+    
+    Returns
+    -------
+    _min : float
+        The minimum euclidean distance between the shapelet and the input time
+        series
+    float
+        The location of the minimum euclidean distance divided by the length 
+        of the distance vector (i.e scaled between [0,1]).        
+    float
+        The number of points in the distance vector inferior to the threshold 
+        divided by the length of the distance vector (i.e scaled between [0,1])
+
+    """
+    length = values.shape[0]
+    n_candidates = win_start.shape[0]
+
+    _n_match = 0
+    _min = 1e+100
+    _argmin = 0
+
+    #For each step of the moving window in the shapelet distance
+    for i in range(n_candidates):
+        _start = win_start[i]
+        _dist = distance(
+            x_chains[_start:_start+length], values, metric, x_mean[i],
+            x_inv_std[i]
+        )
+
+        if _dist < _min:
+            _min = _dist
+            _argmin = i
+
+        if _dist <= threshold:
+            _n_match += 1
+            
+    return _min, float_(_argmin), float_(_n_match)
+
+@njit(fastmath=True, cache=True)
+def apply_one_shapelet_one_sample_multivariate_norm(
+    x_chains, win_start, channels, values, threshold, metric, x_mean,
+    x_inv_std
+):
+    """
+    Extract the three features from the z-normalized distance between a
+    multivariate shapelet and the windows of an input time series generated
+    by the length and dilation parameter of the shapelet. The windows are
+    z-normalized on the fly using their mean and standard deviation.
+
+    Parameters
+    ----------
+    x_chains : array, shape=(n_features, n_chained)
+        Chains of an input time series, as given by generate_chains_2D.
+    win_start : array, shape=(n_windows)
+        Position in x_chains of the first value of each window.
+    channels : array, shape=(n_channels)
+        Channels of x used by the shapelet
+    values : array, shape=(n_channels, length)
+        Values of the shapelet
+    threshold : float
+        The threshold to compute the shapelet occurence feature.
+    metric : int
+        The distance, among DIST_MANHATTAN, DIST_EUCLIDEAN and DIST_SQUARED.
+    x_mean : array, shape=(n_features, n_windows)
+        Mean of each window.
+    x_inv_std : array, shape=(n_features, n_windows)
+        Inverse of the standard deviation of each window.
+    
+    Returns
+    -------
+    _min : float
+        The minimum euclidean distance between the shapelet and the input time
+        series
+    float
+        The location of the minimum euclidean distance divided by the length 
+        of the distance vector (i.e scaled between [0,1]).        
+    float
+        The number of points in the distance vector inferior to the threshold 
+        divided by the length of the distance vector (i.e scaled between [0,1])
+
+    """
+    n_ft, length = values.shape
+    n_candidates = win_start.shape[0]
+
+    _n_match = 0
+    _min = 1e+10
+    _argmin = 0
+    
+    #For each step of the moving window in the shapelet distance
+    for i in range(n_candidates):
+        _start = win_start[i]
+        _dist = 0
+        for i_ft in prange(n_ft):
+            ft = channels[i_ft]
+            _dist += distance(
+                x_chains[ft, _start:_start+length], values[i_ft], metric,
+                x_mean[ft, i], x_inv_std[ft, i]
+            )
+    
+        if _dist < _min:
+            _min = _dist
+            _argmin = i
+            
+        if _dist <= threshold:
+            _n_match += 1
+    
+    return _min, float_(_argmin), float_(_n_match)
+
+@njit(fastmath=True, cache=True)
+def apply_one_shapelet_one_sample_univariate_ea(
+    x_chains, win_start, values, order, threshold, metric
+):
+    """
+    Early abandoning version of apply_one_shapelet_one_sample_univariate. A
+    window is abandoned as soon as its partial distance exceeds both the 
+    current minimum and the threshold, as it can then neither update the min
+    and argmin features nor be counted as an occurrence.
+
+    Parameters
+    ----------
+    x_chains : array, shape=(n_chained)
+        Chains of an input time series, as given by generate_chains_1D.
+    win_start : array, shape=(n_windows)
+        Position in x_chains of the first value of each window.
+    values : array, shape=(length)
+        Values of the shapelet
+    order : array, shape=(length)
+        Order in which the values are visited, as given by 
+        early_abandon_order.
+    threshold : float
+        The threshold to compute the shapelet occurence feature.
+    metric : int
+        The distance, among DIST_MANHATTAN, DIST_EUCLIDEAN and DIST_SQUARED.
+    
+    Returns
+    -------
+    _min : float
+        The minimum euclidean distance between the shapelet and the input time
+        series
+    float
+        The location of the minimum euclidean distance divided by the length 
+        of the distance vector (i.e scaled between [0,1]).        
+    float
+        The number of points in the distance vector inferior to the threshold 
+        divided by the length of the distance vector (i.e scaled between [0,1])
+
+    """
+    length = values.shape[0]
+    n_candidates = win_start.shape[0]
+
+    _n_match = 0
+    _min = 1e+100
+    _argmin = 0
+
+    #For each step of the moving window in the shapelet distance
+    for i in range(n_candidates):
+        _start = win_start[i]
+        _dist = distance_ea(
+            x_chains[_start:_start+length], values, order, max(_min, threshold),
+            metric
+        )
+
+        if _dist < _min:
+            _min = _dist
+            _argmin = i
+
+        if _dist <= threshold:
+            _n_match += 1
+            
+    return _min, float_(_argmin), float_(_n_match)
+
+@njit(fastmath=True, cache=True)
+def apply_one_shapelet_one_sample_multivariate_ea(
+    x_chains, win_start, channels, values, order, threshold, metric
+):
+    """
+    Early abandoning version of apply_one_shapelet_one_sample_multivariate. A
+    window is abandoned as soon as its partial distance exceeds both the 
+    current minimum and the threshold, as it can then neither update the min
+    and argmin features nor be counted as an occurrence.
+
+    Parameters
+    ----------
+    x_chains : array, shape=(n_features, n_chained)
+        Chains of an input time series, as given by generate_chains_2D.
+    win_start : array, shape=(n_windows)
+        Position in x_chains of the first value of each window.
+    channels : array, shape=(n_channels)
+        Channels of x used by the shapelet
+    values : array, shape=(n_channels, length)
+        Values of the shapelet
+    order : array, shape=(n_channels, length)
+        Order in which the values of each channel are visited, as given by 
+        early_abandon_order.
+    threshold : float
+        The threshold to compute the shapelet occurence feature.
+    metric : int
+        The distance, among DIST_MANHATTAN, DIST_EUCLIDEAN and DIST_SQUARED.
+    
+    Returns
+    -------
+    _min : float
+        The minimum euclidean distance between the shapelet and the input time
+        series
+    float
+        The location of the minimum euclidean distance divided by the length 
+        of the distance vector (i.e scaled between [0,1]).        
+    float
+        The number of points in the distance vector inferior to the threshold 
+        divided by the length of the distance vector (i.e scaled between [0,1])
+
+    """
+    n_ft, length = values.shape
+    n_candidates = win_start.shape[0]
+
+    _n_match = 0
+    _min = 1e+10
+    _argmin = 0
+    
+    #For each step of the moving window in the shapelet distance
+    for i in range(n_candidates):
+        _start = win_start[i]
+        _bound = max(_min, threshold)
+        _dist = 0
+        for i_ft in range(n_ft):
+            _dist += distance_ea(
+                x_chains[channels[i_ft], _start:_start+length], values[i_ft],
+                order[i_ft], _bound - _dist, metric
+            )
+            if _dist > _bound:
+                break
+    
+        if _dist < _min:
+            _min = _dist
+            _argmin = i
+            
+        if _dist <= threshold:
+            _n_match += 1
+    
+    return _min, float_(_argmin), float_(_n_match)
+
+@njit(fastmath=True, cache=True)
+def apply_one_shapelet_one_sample_univariate_norm_ea(
+    x_chains, win_start, values, order, threshold, metric, x_mean,
+    x_inv_std
+):
+    """
+    Early abandoning version of apply_one_shapelet_one_sample_univariate_norm.
+    A window is abandoned as soon as its partial distance exceeds both the 
+    current minimum and the threshold.
+
+    Parameters
+    ----------
+    x_chains : array, shape=(n_chained)
+        Chains of an input time series, as given by generate_chains_1D.
+    win_start : array, shape=(n_windows)
+        Position in x_chains of the first value of each window.
+    values : array, shape=(length)
+        Values of the shapelet
+    order : array, shape=(length)
+        Order in which the values are visited, as given by 
+        early_abandon_order.
+    threshold : float
+        The threshold to compute the shapelet occurence feature.
+    metric : int
+        The distance, among DIST_MANHATTAN, DIST_EUCLIDEAN and DIST_SQUARED.
+    x_mean : array, shape=(n_windows)
+        Mean of each window.
+    x_inv_std : array, shape=(n_windows)
+        Inverse of the standard deviation of each window.
+    
+    Returns
+    -------
+    _min : float
+        The minimum euclidean distance between the shapelet and the input time
+        series
+    float
+        The location of the minimum euclidean distance divided by the length 
+        of the distance vector (i.e scaled between [0,1]).        
+    float
+        The number of points in the distance vector inferior to the threshold 
+        divided by the length of the distance vector (i.e scaled between [0,1])
+
+    """
+    length = values.shape[0]
+    n_candidates = win_start.shape[0]
+
+    _n_match = 0
+    _min = 1e+100
+    _argmin = 0
+
+    #For each step of the moving window in the shapelet distance
+    for i in range(n_candidates):
+        _start = win_start[i]
+        _dist = distance_ea(
+            x_chains[_start:_start+length], values, order, max(_min, threshold),
+            metric, x_mean[i], x_inv_std[i]
+        )
+
+        if _dist < _min:
+            _min = _dist
+            _argmin = i
+
+        if _dist <= threshold:
+            _n_match += 1
+            
+    return _min, float_(_argmin), float_(_n_match)
+
+@njit(fastmath=True, cache=True)
+def apply_one_shapelet_one_sample_multivariate_norm_ea(
+    x_chains, win_start, channels, values, order, threshold, metric, x_mean,
+    x_inv_std
+):
+    """
+    Early abandoning version of 
+    apply_one_shapelet_one_sample_multivariate_norm. A window is abandoned as
+    soon as its partial distance exceeds both the current minimum and the 
+    threshold.
+
+    Parameters
+    ----------
+    x_chains : array, shape=(n_features, n_chained)
+        Chains of an input time series, as given by generate_chains_2D.
+    win_start : array, shape=(n_windows)
+        Position in x_chains of the first value of each window.
+    channels : array, shape=(n_channels)
+        Channels of x used by the shapelet
+    values : array, shape=(n_channels, length)
+        Values of the shapelet
+    order : array, shape=(n_channels, length)
+        Order in which the values of each channel are visited, as given by 
+        early_abandon_order.
+    threshold : float
+        The threshold to compute the shapelet occurence feature.
+    metric : int
+        The distance, among DIST_MANHATTAN, DIST_EUCLIDEAN and DIST_SQUARED.
+    x_mean : array, shape=(n_features, n_windows)
+        Mean of each window.
+    x_inv_std : array, shape=(n_features, n_windows)
+        Inverse of the standard deviation of each window.
+    
+    Returns
+    -------
+    _min : float
+        The minimum euclidean distance between the shapelet and the input time
+        series
+    float
+        The location of the minimum euclidean distance divided by the length 
+        of the distance vector (i.e scaled between [0,1]).        
+    float
+        The number of points in the distance vector inferior to the threshold 
+        divided by the length of the distance vector (i.e scaled between [0,1])
+
+    """
+    n_ft, length = values.shape
+    n_candidates = win_start.shape[0]
+
+    _n_match = 0
+    _min = 1e+10
+    _argmin = 0
+    
+    #For each step of the moving window in the shapelet distance
+    for i in range(n_candidates):
+        _start = win_start[i]
+        _bound = max(_min, threshold)
+        _dist = 0
+        for i_ft in range(n_ft):
+            ft = channels[i_ft]
+            _dist += distance_ea(
+                x_chains[ft, _start:_start+length], values[i_ft], order[i_ft],
+                _bound - _dist, metric, x_mean[ft, i], x_inv_std[ft, i]
+            )
+            if _dist > _bound:
+                break
+    
+        if _dist < _min:
+            _min = _dist
+            _argmin = i
+            
+        if _dist <= threshold:
+            _n_match += 1
+    
+    return _min, float_(_argmin), float_(_n_match)
+
+###############################################################################
+#                                                                             #
+#                         DISTANCE BENCHMARK                                  #
+#                                                                             #
+###############################################################################
+
+@njit(fastmath=True, cache=True)
+def _benchmark_literal_metric(x_chains, win_start, values, threshold, metric):
+    # Each branch calls the loop specialized for its distance
+    if metric == DIST_MANHATTAN:
+        return apply_one_shapelet_one_sample_univariate(
+            x_chains, win_start, values, threshold, DIST_MANHATTAN
+        )
+    if metric == DIST_EUCLIDEAN:
+        return apply_one_shapelet_one_sample_univariate(
+            x_chains, win_start, values, threshold, DIST_EUCLIDEAN
+        )
+    return apply_one_shapelet_one_sample_univariate(
+        x_chains, win_start, values, threshold, DIST_SQUARED
+    )
+
+@njit(fastmath=True, cache=True)
+def _benchmark_function_argument(
+    x_chains, win_start, values, threshold, dist_func
+):
+    # Loop of apply_one_shapelet_one_sample_univariate with the distance
+    # given as a function, as it was before the DIST_* integers.
+    length = values.shape[0]
+    _n_match = 0
+    _min = 1e+100
+    _argmin = 0
+    for i in range(win_start.shape[0]):
+        _start = win_start[i]
+        _dist = dist_func(x_chains[_start:_start+length], values)
+        if _dist < _min:
+            _min = _dist
+            _argmin = i
+        if _dist <= threshold:
+            _n_match += 1
+    return _min, float_(_argmin), float_(_n_match)
+
+def benchmark_distances(
+    n_timestamps=100000, length=9, dilation=1, dtype='float64', n_repeats=20,
+    random_state=0
+):
+    """
+    Microbenchmark of the loop extracting the features of a shapelet from
+    the windows of a time series, for each distance, with the distance given
+    as a function, as done before the DIST_* integers, and with the
+    specialized distance used by the transform. Both versions are compiled
+    before being timed.
+
+    With the default arguments and n_repeats=5, the two versions take
+    0.42/0.43 ms for the manhattan distance, 0.45/0.43 ms for the euclidean
+    distance and 0.42/0.39 ms for the squared distance, which is a tie
+    within the noise of the measure. The DIST_* integers do not make the
+    loop faster: their gain is in the numba cache, which other processes
+    can read instead of compiling the functions again when they start.
+
+    Parameters
+    ----------
+    n_timestamps : int, optional
+        Length of the random time series. The default is 100000.
+    length : int, optional
+        Length of the shapelet. The default is 9.
+    dilation : int, optional
+        Dilation of the shapelet. The default is 1.
+    dtype : str, optional
+        Dtype of the time series and of the shapelet. The default is 
+        'float64'.
+    n_repeats : int, optional
+        Number of timed calls of each version, of which the fastest is 
+        reported. The default is 20.
+    random_state : int, optional
+        Seed of the random time series. The default is 0.
+
+    Returns
+    -------
+    dict
+        For each distance among 'manhattan', 'euclidean' and 'squared', a
+        tuple with the time in seconds of one call with the distance given
+        as a function and with the specialized distance.
+
+    """
+    from time import perf_counter
+    from numpy.random import RandomState
+    rng = RandomState(random_state)
+    x = rng.normal(size=n_timestamps).astype(dtype)
+    values = rng.normal(size=length).astype(dtype)
+    x_chains, win_start = generate_chains_1D(x, length, dilation, False)
+    results = {}
+    for name, metric, dist_func in [
+        ('manhattan', DIST_MANHATTAN, manhattan),
+        ('euclidean', DIST_EUCLIDEAN, euclidean),
+        ('squared', DIST_SQUARED, squared_euclidean)
+    ]:
+        timings = []
+        for func, arg in [
+            (_benchmark_function_argument, dist_func),
+            (_benchmark_literal_metric, metric)
+        ]:
+            func(x_chains, win_start, values, 0., arg)
+            best = float('inf')
+            for _ in range(n_repeats):
+                t0 = perf_counter()
+                func(x_chains, win_start, values, 0., arg)
+                best = min(best, perf_counter() - t0)
+            timings.append(best)
+        results[name] = tuple(timings)
+    return results
+
+###############################################################################
+#                                                                             #
+#                 COUNTER-BASED RANDOM NUMBER GENERATION                      #
+#                                                                             #
+###############################################################################
+
+# The shapelet generators draw the random parameters of each shapelet from its
+# own stream, derived from the seed and the index of the shapelet, instead of
+# the global numpy generator shared by the threads. Each draw is the SplitMix64
+# hash of the stream key and of a counter, so the shapelets do not depend on
+# the number of threads nor on the order in which they are generated.
+
+@njit(cache=True)
+def _splitmix64(x):
+    x = (x ^ (x >> uint64(30))) * uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> uint64(27))) * uint64(0x94D049BB133111EB)
+    return x ^ (x >> uint64(31))
+
+@njit(cache=True)
+def rng_stream(seed, stream):
+    """
+    Initialize a random stream.
+
+    Parameters
+    ----------
+    seed : int
+        The random seed.
+    stream : int
+        Index of the stream.
+
+    Returns
+    -------
+    state : array, shape=(2)
+        The key and the counter of the stream.
+
+    """
+    state = zeros(2, dtype=uint64)
+    state[0] = _splitmix64(_splitmix64(uint64(seed)) ^ uint64(stream))
+    return state
+
+@njit(cache=True)
+def rng_next(state):
+    """Return the next random 64 bits integer of a stream."""
+    state[1] += uint64(1)
+    return _splitmix64(state[0] + state[1] * uint64(0x9E3779B97F4A7C15))
+
+@njit(cache=True)
+def rng_random(state):
+    """Return the next random float in [0, 1[ of a stream."""
+    return (rng_next(state) >> uint64(11)) * 1.1102230246251565e-16
+
+@njit(cache=True)
+def rng_randint(state, low, high):
+    """Return the next random integer in [low, high[ of a stream."""
+    return low + int64(rng_next(state) % uint64(high - low))
+
+@njit(cache=True)
+def rng_uniform(state, low, high):
+    """Return the next random float in [low, high[ of a stream."""
+    return low + (high - low) * rng_random(state)
+
+@njit(cache=True)
+def rng_choice(state, n, size):
+    """
+    Draw size distinct integers in [0, n[ from a stream, as choice() without
+    replacement.
+    """
+    values = arange(n)
+    for i in range(size):
+        j = rng_randint(state, i, n)
+        values[i], values[j] = values[j], values[i]
+    return values[:size]
+
+###############################################################################
+#                                                                             #
+#                        SAMPLING MASK (BITSETS)                              #
+#                                                                             #
+###############################################################################
+
+# The self similarity masks of the shapelet generators store one bit per 
+# timestamp in arrays of uint64 words. All the constants are cast to uint64, 
+# as Numba would otherwise convert the operations to floats.
+
+@njit(cache=True)
+def bitset_n_words(n_bits):
+    """Number of uint64 words needed to store n_bits bits."""
+    return (n_bits + 63) // 64
+
+@njit(cache=True)
+def bitset_fill(bits, n_bits):
+    """Set the n_bits first bits of a bitset to 1, and the others to 0."""
+    for w in range(bits.shape[0]):
+        r = n_bits - w*64
+        if r >= 64:
+            bits[w] = ~uint64(0)
+        elif r > 0:
+            bits[w] = (uint64(1) << uint64(r)) - uint64(1)
+        else:
+            bits[w] = uint64(0)
+
+@njit(cache=True)
+def bitset_get(bits, i):
+    """Return True if the bit i of a bitset is set."""
+    return (bits[i >> 6] >> uint64(i & 63)) & uint64(1) == uint64(1)
+
+@njit(cache=True)
+def bitset_clear(bits, i):
+    """Set the bit i of a bitset to 0."""
+    bits[i >> 6] &= ~(uint64(1) << uint64(i & 63))
+
+@njit(cache=True)
+def _popcount(x):
+    x = x - ((x >> uint64(1)) & uint64(0x5555555555555555))
+    x = (x & uint64(0x3333333333333333)) + (
+        (x >> uint64(2)) & uint64(0x3333333333333333)
+    )
+    x = (x + (x >> uint64(4))) & uint64(0x0F0F0F0F0F0F0F0F)
+    return int64((x * uint64(0x0101010101010101)) >> uint64(56))
+
+@njit(cache=True)
+def bitset_count(bits, end):
+    """Return the number of bits set in [0, end[."""
+    n_full = end >> 6
+    count = 0
+    for w in range(n_full):
+        count += _popcount(bits[w])
+    r = end & 63
+    if r > 0:
+        count += _popcount(bits[n_full] & ((uint64(1) << uint64(r)) - uint64(1)))
+    return count
+
+@njit(cache=True)
+def bitset_select(bits, k):
+    """Return the index of the k-th (starting at 0) bit set of a bitset."""
+    for w in range(bits.shape[0]):
+        p = _popcount(bits[w])
+        if k < p:
+            word = bits[w]
+            for b in range(64):
+                if (word >> uint64(b)) & uint64(1) == uint64(1):
+                    if k == 0:
+                        return w*64 + b
+                    k -= 1
+        k -= p
+    return -1
+
+@njit(cache=True)
+def bitset_channels_valid(bits, channels, min_count, i):
+    """
+    Return True if at least min_count of the bitsets bits[channels] have their
+    bit i set.
+    """
+    count = 0
+    for c in channels:
+        if bitset_get(bits[c], i):
+            count += 1
+    return count >= min_count
+
+@njit(cache=True)
+def bitset_count_channels(bits, channels, min_count, end):
+    """
+    Return the number of indexes in [0, end[ for which at least min_count of
+    the bitsets bits[channels] are set.
+    """
+    count = 0
+    for i in range(end):
+        if bitset_channels_valid(bits, channels, min_count, i):
+            count += 1
+    return count
+
+@njit(cache=True)
+def bitset_select_channels(bits, channels, min_count, k):
+    """
+    Return the k-th (starting at 0) index for which at least min_count of the
+    bitsets bits[channels] are set.
+    """
+    for i in range(bits.shape[1]*64):
+        if bitset_channels_valid(bits, channels, min_count, i):
+            if k == 0:
+                return i
+            k -= 1
+    return -1
+
+@njit(cache=True)
+def bitset_any_channels(bits, channels, min_count, end):
+    """
+    Return True if there is an index in [0, end[ for which at least min_count
+    of the bitsets bits[channels] are set.
+    """
+    for i in range(end):
+        if bitset_channels_valid(bits, channels, min_count, i):
+            return True
+    return False
+
+###############################################################################
+#                                                                             #
+#                      RAGGED TIME SERIES AND BITSETS                         #
+#                                                                             #
+###############################################################################
+
+# Variable length time series are stored in a single buffer X, the values of 
+# the i-th sample, of shape (n_features, X_len[i]), being stored in C order 
+# in X[X_offsets[i]:X_offsets[i+1]] (see convst.utils.ragged_utils).
+
+@njit(cache=True)
+def ragged_sample(X, X_offsets, X_len, i):
+    """Return a (n_features, X_len[i]) view of the i-th sample of X."""
+    return X[X_offsets[i]:X_offsets[i+1]].reshape(
+        ((X_offsets[i+1] - X_offsets[i]) // X_len[i], X_len[i])
+    )
+
+@njit(cache=True)
+def ragged_bitsets(n_bits, n_rows):
+    """
+    Allocate, for each i, n_rows bitsets of n_bits[i] bits set to one in a
+    single buffer, and return the buffer with the offset of each i.
+    """
+    offsets = zeros(n_bits.shape[0]+1, dtype=int64)
+    for i in range(n_bits.shape[0]):
+        offsets[i+1] = offsets[i] + n_rows * bitset_n_words(n_bits[i])
+    bits = zeros(offsets[n_bits.shape[0]], dtype=uint64)
+    for i in range(n_bits.shape[0]):
+        rows = ragged_bitset(bits, offsets, n_rows, i)
+        for j in range(n_rows):
+            bitset_fill(rows[j], n_bits[i])
+    return bits, offsets
+
+@njit(cache=True)
+def ragged_bitset(bits, offsets, n_rows, i):
+    """Return a (n_rows, n_words) view of the bitsets of i."""
+    return bits[offsets[i]:offsets[i+1]].reshape(
+        (n_rows, (offsets[i+1] - offsets[i]) // n_rows)
+    )
+
+###############################################################################
+#                                                                             #
+#                     SAMPLING INDEX (FENWICK TREES)                          #
+#                                                                             #
+###############################################################################
+
+# The univariate shapelet generators keep, for each shapelet length of a 
+# dilation group, the number of allowed sampling points of each sample in a
+# Fenwick tree, so that a sample can be drawn with the same probabilities as
+# a scan of the whole mask in O(log(n_samples)).
+
+@njit(cache=True)
+def fenwick_init(counts):
+    """Build in O(n) the Fenwick tree of the prefix sums of counts."""
+    n = counts.shape[0]
+    tree = zeros(n+1, dtype=int64)
+    for i in range(1, n+1):
+        tree[i] += counts[i-1]
+        j = i + (i & -i)
+        if j <= n:
+            tree[j] += tree[i]
+    return tree
+
+@njit(cache=True)
+def fenwick_add(tree, i, delta):
+    """Add delta to the element i of a Fenwick tree."""
+    i += 1
+    while i < tree.shape[0]:
+        tree[i] += delta
+        i += i & -i
+
+@njit(cache=True)
+def fenwick_prefix(tree, i):
+    """Return the sum of the i first elements of a Fenwick tree."""
+    s = 0
+    while i > 0:
+        s += tree[i]
+        i -= i & -i
+    return s
+
+@njit(cache=True)
+def fenwick_search(tree, k):
+    """
+    Return the smallest i such that the sum of the i+1 first elements of a 
+    Fenwick tree is greater than k.
+    """
+    n = tree.shape[0] - 1
+    step = 1
+    while step * 2 <= n:
+        step *= 2
+    i = 0
+    while step > 0:
+        if i + step <= n and tree[i + step] <= k:
+            i += step
+            k -= tree[i]
+        step //= 2
+    return i
+
+@njit(cache=True)
+def sampling_index_init(d_shapes, indicator):
+    """
+    Initialize the sampling index of one norm of a dilation group.
+
+    Parameters
+    ----------
+    d_shapes : array, shape=(n_lengths, n_samples)
+        Number of possible sampling points of each sample for each length.
+    indicator : bool
+        If True, the trees count the samples with at least one allowed 
+        sampling point, otherwise they count the allowed sampling points.
+
+    Returns
+    -------
+    counts : array, shape=(n_lengths, n_samples)
+        The number of allowed sampling points of each sample.
+    trees : array, shape=(n_lengths, n_samples+1)
+        The Fenwick trees of each length.
+
+    """
+    n_lengths, n_samples = d_shapes.shape
+    counts = zeros((n_lengths, n_samples), dtype=int64)
+    trees = zeros((n_lengths, n_samples+1), dtype=int64)
+    for li in range(n_lengths):
+        for i_x in range(n_samples):
+            counts[li, i_x] = max(0, d_shapes[li, i_x])
+        if indicator:
+            trees[li] = fenwick_init((counts[li] > 0).astype(int64))
+        else:
+            trees[li] = fenwick_init(counts[li])
+    return counts, trees
+
+@njit(cache=True)
+def sampling_index_clear(bits, i, id_sample, d_shapes, counts, trees, indicator):
+    """
+    Clear the bit i of the bitset of id_sample, and update the sampling index
+    initialized by sampling_index_init if it was set.
+    """
+    if bitset_get(bits, i):
+        bitset_clear(bits, i)
+        for li in range(d_shapes.shape[0]):
+            if i < d_shapes[li, id_sample]:
+                counts[li, id_sample] -= 1
+                if not indicator:
+                    fenwick_add(trees[li], id_sample, -1)
+                elif counts[li, id_sample] == 0:
+                    fenwick_add(trees[li], id_sample, -1)
+
+@njit(cache=True)
+def same_class_index(y):
+    """
+    Index the samples by class, to draw a sample of the same class as another
+    one in constant time.
+
+    Parameters
+    ----------
+    y : array, shape=(n_samples)
+        Class of each input time series
+
+    Returns
+    -------
+    order : array, shape=(n_samples)
+        The samples sorted by class, and by index inside a class.
+    start : array, shape=(n_samples)
+        Position in order of the first sample of the class of each sample.
+    size : array, shape=(n_samples)
+        Number of samples in the class of each sample.
+    rank : array, shape=(n_samples)
+        Position of each sample among the samples of its class.
+
+    """
+    n_samples = y.shape[0]
+    order = argsort(y, kind='mergesort')
+    start = zeros(n_samples, dtype=int64)
+    size = zeros(n_samples, dtype=int64)
+    rank = zeros(n_samples, dtype=int64)
+    a = 0
+    while a < n_samples:
+        b = a
+        while b < n_samples and y[order[b]] == y[order[a]]:
+            b += 1
+        for j in range(a, b):
+            start[order[j]] = a
+            size[order[j]] = b - a
+            rank[order[j]] = j - a
+        a = b
+    return order, start, size, rank
+
+@njit(cache=True)
+def choose_same_class(state, id_sample, order, start, size, rank):
+    """
+    Draw uniformly another sample of the same class as id_sample from the
+    random stream state. If id_sample is alone in its class, it is returned.
+    """
+    if size[id_sample] > 1:
+        k = rng_randint(state, 0, size[id_sample] - 1)
+        if k >= rank[id_sample]:
+            k += 1
+        return order[start[id_sample] + k]
+    return id_sample
+
+@njit(cache=True)
+def generation_schedule(dilations, normalize, n_samples, r_seed):
+    """
+    Split the generation of the shapelets into independent work items.
+
+    The shapelets with the same dilation and normalization share a self
+    similarity mask, so they must be generated sequentially. To generate
+    large groups in parallel, their samples are split into blocks, and each
+    shapelet draws its block with a probability proportional to its size.
+    A work item is the sequence of shapelets of a group sampling from the 
+    same block, which only updates the mask of its own samples.
+    The split only depends on the data and the parameters of the shapelets,
+    not on the number of threads.
+
+    Parameters
+    ----------
+    dilations : array, shape=(n_shapelets)
+        Dilation parameter of the shapelets
+    normalize : array, shape=(n_shapelets)
+        Normalization indicator of the shapelets
+    n_samples : int
+        Number of input time series
+    r_seed : int
+        Random seed of the random streams of the shapelets
+
+    Returns
+    -------
+    states : array, shape=(n_shapelets, 2)
+        The random streams used to generate each shapelet.
+    items_ptr : array, shape=(n_items+1)
+        Position of the shapelets of each work item in items_shapelets.
+    items_shapelets : array, shape=(n_shapelets)
+        The shapelets of each work item, by increasing index.
+    items_samples : array, shape=(n_items, 2)
+        The first and last+1 samples of the block of each work item.
+
+    """
+    n_shapelets = dilations.shape[0]
+    states = zeros((n_shapelets, 2), dtype=uint64)
+    for i in range(n_shapelets):
+        states[i] = rng_stream(r_seed, 2*i+1)
+    blocks = zeros(n_shapelets, dtype=int64)
+    items_ptr = zeros(n_shapelets+1, dtype=int64)
+    items_shapelets = zeros(n_shapelets, dtype=int64)
+    items_samples = zeros((n_shapelets, 2), dtype=int64)
+    n_items = 0
+    a = 0
+    unique_dil = unique(dilations)
+    for i_d in range(unique_dil.shape[0]):
+        for norm in range(2):
+            id_shps = where(
+                (dilations == unique_dil[i_d]) & (normalize == norm)
+            )[0]
+            n_blocks = min(
+                (id_shps.shape[0] - 1) // GENERATION_BLOCK_SHAPELETS + 1,
+                n_samples // GENERATION_BLOCK_SAMPLES
+            )
+            if n_blocks > 1:
+                for i_shp in id_shps:
+                    blocks[i_shp] = (
+                        rng_randint(states[i_shp], 0, n_samples) * n_blocks
+                    ) // n_samples
+            else:
+                n_blocks = 1
+            for i_b in range(n_blocks):
+                b = a
+                for i_shp in id_shps:
+                    if blocks[i_shp] == i_b:
+                        items_shapelets[b] = i_shp
+                        b += 1
+                if b > a:
+                    items_samples[n_items, 0] = (
+                        i_b * n_samples + n_blocks - 1
+                    ) // n_blocks
+                    items_samples[n_items, 1] = (
+                        (i_b + 1) * n_samples + n_blocks - 1
+                    ) // n_blocks
+                    n_items += 1
+                    items_ptr[n_items] = b
+                    a = b
+    return (
+        states, items_ptr[:n_items+1], items_shapelets, items_samples[:n_items]
+    )
+
+###############################################################################
+#                                                                             #
+#                    TRANSFORM EXECUTION PLAN AND SCHEDULE                    #
+#                                                                             #
+###############################################################################
+
+# The apply functions read the shapelets from an execution plan built once at
+# fit time, in which the shapelets are sorted by length, dilation and
+# normalization, so that the shapelets of a parameter group are contiguous,
+# with the non normalized ones first. The i-th element of a plan array is
+# the one of the i-th shapelet of the plan, which is the shapelet order[i]
+# of the fitter, so that its features are written at their public position.
+
+@njit(cache=True)
+def shapelet_plan(
+    values, lengths, dilations, threshold, normalize, n_channels, channel_ids
+):
+    """
+    Build the execution plan of the apply functions for a set of shapelets.
+
+    Parameters
+    ----------
+    values : array, shape=(sum(n_channels*lengths))
+        Values of the shapelets, one after the other, as one row of lengths[i]
+        values per channel of the i-th shapelet.
+    lengths : array, shape=(n_shapelets)
+        Length parameter of the shapelets
+    dilations : array, shape=(n_shapelets)
+        Dilation parameter of the shapelets
+    threshold : array, shape=(n_shapelets)
+        Threshold parameter of the shapelets
+    normalize : array, shape=(n_shapelets)
+        Normalization indicator of the shapelets
+    n_channels : array, shape=(n_shapelets)
+        Number of channels of the shapelets, one for univariate shapelets.
+    channel_ids : array, shape=(sum(n_channels))
+        Channels of the shapelets, one after the other.
+
+    Returns
+    -------
+    groups : array, shape=(n_groups, 2)
+        Length and dilation of each parameter group
+    group_ptr : array, shape=(n_groups+1)
+        First position in the plan of the shapelets of each group, followed
+        by n_shapelets.
+    norm_ptr : array, shape=(n_groups)
+        First position in the plan of the normalized shapelets of each group.
+    order : array, shape=(n_shapelets)
+        Shapelet of the fitter at each position of the plan.
+    values : array, shape=(sum(n_channels*lengths))
+        Values of the shapelets in the order of the plan.
+    values_ptr : array, shape=(n_shapelets+1)
+        Position of the values of each shapelet of the plan.
+    channel_ids : array, shape=(sum(n_channels))
+        Channels of the shapelets in the order of the plan.
+    channels_ptr : array, shape=(n_shapelets+1)
+        Position of the channels of each shapelet of the plan.
+    threshold : array, shape=(n_shapelets)
+        Threshold of the shapelets in the order of the plan.
+    ea_orders : array, shape=(sum(n_channels*lengths))
+        Early abandoning order of each row of values.
+
+    """
+    n_shapelets = lengths.shape[0]
+    key = (lengths * (dilations.max() + 1) + dilations) * 2
+    for i in range(n_shapelets):
+        if normalize[i]:
+            key[i] += 1
+    order = argsort(key, kind='mergesort')
+    
+    n_groups = 0
+    for p in range(n_shapelets):
+        if p == 0 or key[order[p]] // 2 != key[order[p-1]] // 2:
+            n_groups += 1
+    groups = zeros((n_groups, 2), dtype=int64)
+    group_ptr = zeros(n_groups+1, dtype=int64)
+    norm_ptr = zeros(n_groups, dtype=int64)
+    i_group = -1
+    for p in range(n_shapelets):
+        i = order[p]
+        if p == 0 or key[i] // 2 != key[order[p-1]] // 2:
+            i_group += 1
+            groups[i_group, 0] = lengths[i]
+            groups[i_group, 1] = dilations[i]
+            group_ptr[i_group] = p
+            norm_ptr[i_group] = p
+        if not normalize[i]:
+            norm_ptr[i_group] = p + 1
+    group_ptr[n_groups] = n_shapelets
+    
+    a1 = zeros(n_shapelets+1, dtype=int64)
+    a2 = zeros(n_shapelets+1, dtype=int64)
+    values_ptr = zeros(n_shapelets+1, dtype=int64)
+    channels_ptr = zeros(n_shapelets+1, dtype=int64)
+    for i in range(n_shapelets):
+        a1[i+1] = a1[i] + n_channels[i] * lengths[i]
+        a2[i+1] = a2[i] + n_channels[i]
+        values_ptr[i+1] = values_ptr[i] + n_channels[order[i]] * lengths[order[i]]
+        channels_ptr[i+1] = channels_ptr[i] + n_channels[order[i]]
+    
+    _values = zeros(values.shape[0], dtype=values.dtype)
+    _channel_ids = zeros(channel_ids.shape[0], dtype=int64)
+    ea_orders = zeros(values.shape[0], dtype=int64)
+    for p in range(n_shapelets):
+        i = order[p]
+        _values[values_ptr[p]:values_ptr[p+1]] = values[a1[i]:a1[i+1]]
+        _channel_ids[channels_ptr[p]:channels_ptr[p+1]] = channel_ids[a2[i]:a2[i+1]]
+        for k in range(n_channels[i]):
+            _a = values_ptr[p] + k * lengths[i]
+            ea_orders[_a:_a+lengths[i]] = early_abandon_order(
+                _values[_a:_a+lengths[i]]
+            )
+    return (
+        groups, group_ptr, norm_ptr, order, _values, values_ptr, _channel_ids,
+        channels_ptr, threshold[order], ea_orders
+    )
+
+@njit(cache=True)
+def _n_windows(n_timestamps, length, dilation, use_phase):
+    if use_phase:
+        return n_timestamps
+    return max(1, n_timestamps - (length - 1) * dilation)
+
+@njit(cache=True)
+def _tile_cost(n_timestamps, params_shp, chunk, use_phase):
+    return _n_windows(
+        n_timestamps, params_shp[chunk[0], 0], params_shp[chunk[0], 1],
+        use_phase
+    ) * (chunk[2] - chunk[1])
+
+@njit(cache=True)
+def apply_schedule(
+    params_shp, n_shp_params, X_len, use_phase, split_groups=True
+):
+    """
+    Split the application of the shapelets into tiles made of a sample and a
+    chunk of the shapelets of a parameter group, and group the tiles in 
+    blocks of about the same cost.
+
+    The shapelets of a group share the subsequences of a sample, so a chunk
+    contains the whole group, unless there are less than APPLY_MIN_TILES
+    tiles and split_groups is True. The cost of a tile is estimated as its
+    number of windows times its number of shapelets. The i-th tile is made
+    of the sample samples[i // n_chunks] and of the chunk i % n_chunks, the
+    samples being sorted by decreasing length and the chunks by decreasing
+    cost, so that the longest series are started first and the shortest ones
+    are packed in the last blocks. The blocks are ranges of consecutive
+    tiles, so that the tiles of a sample are mostly processed by the same
+    thread, and the split does not depend on the number of threads.
+
+    Parameters
+    ----------
+    params_shp : array, shape=(n_groups, 2)
+        Length and dilation of each parameter group
+    n_shp_params : array, shape=(n_groups+1)
+        Cumulative number of shapelets of the parameter groups, starting at 0
+    X_len : array, shape=(n_samples)
+        Length of each input time series
+    use_phase : bool
+        Wheter to use phase invariance
+    split_groups : bool, optional
+        Wheter the groups can be split into several chunks. The batched 
+        engine keeps each group in a single chunk, so that its matrix
+        products, and their rounding, do not depend on the number of 
+        samples. The default is True.
+
+    Returns
+    -------
+    samples : array, shape=(n_samples)
+        The samples, by decreasing length.
+    chunks : array, shape=(n_chunks, 3)
+        The group of each chunk, and the first and last+1 positions of its
+        shapelets in the index of the groups, by decreasing cost.
+    blocks : array, shape=(n_blocks+1)
+        The first tile of each block, followed by the number of tiles.
+
+    """
+    n_groups = params_shp.shape[0]
+    n_samples = X_len.shape[0]
+    samples = argsort(-X_len, kind='mergesort')
+    max_len = X_len[samples[0]]
+    if split_groups:
+        chunk = max(1, -(-(n_samples * n_shp_params[n_groups]) // APPLY_MIN_TILES))
+    else:
+        chunk = max(1, (n_shp_params[1:] - n_shp_params[:-1]).max())
+    n_chunks = 0
+    for i in range(n_groups):
+        n_chunks += -(-(n_shp_params[i+1] - n_shp_params[i]) // chunk)
+    chunks = zeros((n_chunks, 3), dtype=int64)
+    costs = zeros(n_chunks, dtype=int64)
+    i_chunk = 0
+    for i in range(n_groups):
+        for a in range(n_shp_params[i], n_shp_params[i+1], chunk):
+            chunks[i_chunk, 0] = i
+            chunks[i_chunk, 1] = a
+            chunks[i_chunk, 2] = min(a + chunk, n_shp_params[i+1])
+            costs[i_chunk] = _tile_cost(
+                max_len, params_shp, chunks[i_chunk], use_phase
+            )
+            i_chunk += 1
+    chunks = chunks[argsort(-costs, kind='mergesort')]
+    
+    # The cost of the tiles is computed twice rather than stored, as there
+    # can be many more tiles than shapelets.
+    n_tiles = n_samples * n_chunks
+    total = 0
+    for i_sample in range(n_samples):
+        for i_chunk in range(n_chunks):
+            total += _tile_cost(
+                X_len[samples[i_sample]], params_shp, chunks[i_chunk], use_phase
+            )
+    n_blocks = min(n_tiles, APPLY_N_BLOCKS)
+    blocks = zeros(n_blocks+1, dtype=int64)
+    blocks[n_blocks] = n_tiles
+    cum = 0
+    k = 1
+    for i_sample in range(n_samples):
+        for i_chunk in range(n_chunks):
+            cum += _tile_cost(
+                X_len[samples[i_sample]], params_shp, chunks[i_chunk], use_phase
+            )
+            while k < n_blocks and cum * n_blocks >= k * total:
+                blocks[k] = i_sample * n_chunks + i_chunk + 1
+                k += 1
+    return samples, chunks, blocks
+
+# The same apply kernel is used for the four types of input, all given as
+# ragged arrays: a same length input is a ragged array of uniform lengths,
+# and an univariate input one with a single feature. The distance vectors of
+# univariate inputs are computed by the univariate functions, which do not
+# loop over channels, as they are the most common case.
+
+@njit(cache=True, fastmath=True)
+def _apply_tile_univariate(
+    out, x, plan, a, b, c, _length, _dilation, metric, early_abandon,
+    sdp_mode, use_phase
+):
+    """
+    Compute the features of the shapelets of positions [a, b) of the plan, 
+    of which those of positions [c, b) are normalized, on an univariate 
+    series x, and write them in out.
+    """
+    (_, _, _, order, values, values_ptr, _, _, threshold, ea_orders) = plan
+    n_timestamps = x.shape[0]
+    if sdp_mode != SDP_DISABLED and sdp_is_faster(
+        n_timestamps, _length, _dilation, use_phase
+    ):
+        x_fft, win_mean, win_std, center, tw = sdp_prepare(
+            x, _length, _dilation, use_phase
+        )
+        for p in range(a, b):
+            i_shp = order[p]
+            x_dist = sdp_distance_vector(
+                x_fft, win_mean, win_std, center, tw, n_timestamps,
+                values[values_ptr[p]:values_ptr[p+1]], _length, _dilation,
+                p >= c, use_phase, sdp_mode
+            )
+            out[3 * i_shp:3 * i_shp + 3] = _features_from_dist_vector(
+                x_dist, threshold[p], 1e+100
+            )
+        return
+
+    x_chains, win_start = generate_chains_1D(x, _length, _dilation, use_phase)
+    for p in range(a, c):
+        i_shp = order[p]
+        _values = values[values_ptr[p]:values_ptr[p+1]]
+        if not early_abandon:
+            out[3 * i_shp:3 * i_shp + 3] = \
+            apply_one_shapelet_one_sample_univariate(
+                x_chains, win_start, _values, threshold[p], metric
+            )
+        else:
+            out[3 * i_shp:3 * i_shp + 3] = \
+            apply_one_shapelet_one_sample_univariate_ea(
+                x_chains, win_start, _values,
+                ea_orders[values_ptr[p]:values_ptr[p+1]], threshold[p],
+                metric
+            )
+    if c < b:
+        x_mean, x_std = sliding_mean_std(x, _length, _dilation, use_phase)
+        x_inv_std = 1 / (x_std + 1e-8)
+        for p in range(c, b):
+            i_shp = order[p]
+            _values = values[values_ptr[p]:values_ptr[p+1]]
+            if not early_abandon:
+                out[3 * i_shp:3 * i_shp + 3] = \
+                apply_one_shapelet_one_sample_univariate_norm(
+                    x_chains, win_start, _values, threshold[p], metric,
+                    x_mean, x_inv_std
+                )
+            else:
+                out[3 * i_shp:3 * i_shp + 3] = \
+                apply_one_shapelet_one_sample_univariate_norm_ea(
+                    x_chains, win_start, _values,
+                    ea_orders[values_ptr[p]:values_ptr[p+1]], threshold[p],
+                    metric, x_mean, x_inv_std
+                )
+
+@njit(cache=True, fastmath=True)
+def _apply_tile_multivariate(
+    out, x, plan, a, b, c, _length, _dilation, metric, early_abandon,
+    sdp_mode, use_phase
+):
+    """
+    Compute the features of the shapelets of positions [a, b) of the plan, 
+    of which those of positions [c, b) are normalized, on a multivariate 
+    series x, and write them in out.
+    """
+    (_, _, _, order, values, values_ptr, channel_ids, channels_ptr, threshold,
+     ea_orders) = plan
+    n_timestamps = x.shape[1]
+    if sdp_mode != SDP_DISABLED and sdp_is_faster(
+        n_timestamps, _length, _dilation, use_phase
+    ):
+        x_fft, win_mean, win_std, center, tw = sdp_prepare_2D(
+            x, _length, _dilation, use_phase
+        )
+        for p in range(a, b):
+            i_shp = order[p]
+            _channels = channel_ids[channels_ptr[p]:channels_ptr[p+1]]
+            _values = values[values_ptr[p]:values_ptr[p+1]].reshape(
+                _channels.shape[0], _length
+            )
+            x_dist = zeros(win_mean.shape[1])
+            for i_ft in range(_channels.shape[0]):
+                ft = _channels[i_ft]
+                x_dist += sdp_distance_vector(
+                    x_fft[ft], win_mean[ft], win_std[ft], center[ft], tw,
+                    n_timestamps, _values[i_ft], _length, _dilation, p >= c,
+                    use_phase, sdp_mode
+                )
+            out[3 * i_shp:3 * i_shp + 3] = _features_from_dist_vector(
+                x_dist, threshold[p], 1e+10
+            )
+        return
+
+    x_chains, win_start = generate_chains_2D(x, _length, _dilation, use_phase)
+    for p in range(a, c):
+        i_shp = order[p]
+        _channels = channel_ids[channels_ptr[p]:channels_ptr[p+1]]
+        _values = values[values_ptr[p]:values_ptr[p+1]].reshape(
+            _channels.shape[0], _length
+        )
+        if not early_abandon:
+            out[3 * i_shp:3 * i_shp + 3] = \
+            apply_one_shapelet_one_sample_multivariate(
+                x_chains, win_start, _channels, _values, threshold[p],
+                metric
+            )
+        else:
+            _order = ea_orders[values_ptr[p]:values_ptr[p+1]].reshape(
+                _channels.shape[0], _length
+            )
+            out[3 * i_shp:3 * i_shp + 3] = \
+            apply_one_shapelet_one_sample_multivariate_ea(
+                x_chains, win_start, _channels, _values, _order,
+                threshold[p], metric
+            )
+    if c < b:
+        x_mean, x_std = sliding_mean_std_2D(x, _length, _dilation, use_phase)
+        x_inv_std = 1 / (x_std + 1e-8)
+        for p in range(c, b):
+            i_shp = order[p]
+            _channels = channel_ids[channels_ptr[p]:channels_ptr[p+1]]
+            _values = values[values_ptr[p]:values_ptr[p+1]].reshape(
+                _channels.shape[0], _length
+            )
+            if not early_abandon:
+                out[3 * i_shp:3 * i_shp + 3] = \
+                apply_one_shapelet_one_sample_multivariate_norm(
+                    x_chains, win_start, _channels, _values, threshold[p],
+                    metric, x_mean, x_inv_std
+                )
+            else:
+                _order = ea_orders[values_ptr[p]:values_ptr[p+1]].reshape(
+                    _channels.shape[0], _length
+                )
+                out[3 * i_shp:3 * i_shp + 3] = \
+                apply_one_shapelet_one_sample_multivariate_norm_ea(
+                    x_chains, win_start, _channels, _values, _order,
+                    threshold[p], metric, x_mean, x_inv_std
+                )
+
+@njit(cache=True, parallel=True, fastmath=True, nogil=True)
+def apply_all_shapelets(
+    X, plan, metric, early_abandon, sdp_mode, use_phase, X_len, X_offsets,
+    X_new
+):
+    """
+    Apply a set of generated shapelet using the execution plan previously 
+    built to a set of time series, of any of the four types of input.
+
+    Parameters
+    ----------
+    X : array, shape=(n_values)
+        Input time series, the values of the i-th sample being
+        X[X_offsets[i]:X_offsets[i+1]] in the shape (n_features, X_len[i]).
+    plan : tuple of array
+        The execution plan of the shapelets, built by shapelet_plan at fit
+        time.
+    metric : int
+        The distance, among DIST_MANHATTAN, DIST_EUCLIDEAN and DIST_SQUARED.
+    early_abandon : bool
+        Wheter to use early abandoning.
+    sdp_mode : int
+        Indicate if the sliding dot product engine can be used to compute
+        distance vectors, and for which distance.
+    use_phase: bool
+        Wheter to use phase invariance
+    X_len : array, shape=(n_samples)
+        The length of each input time series
+    X_offsets : array, shape=(n_samples+1)
+        The position of each input time series in X
+    X_new : array, shape=(n_samples, 3*n_shapelets)
+        Array of the type of X in which the features are written, for 
+        example a view of a shared memory block.
+    
+    Returns
+    -------
+    X_new : array, shape=(n_samples, 3*n_shapelets)
+        The transformed input time series with each shapelet extracting 3
+        feature from the distance vector computed on each time series, 
+        written in the X_new argument.
+
+    """
+    groups, group_ptr, norm_ptr, order = plan[:4]
+    samples, chunks, blocks = apply_schedule(
+        groups, group_ptr, X_len, use_phase
+    )
+    n_chunks = chunks.shape[0]
+    for i_block in prange(blocks.shape[0]-1):
+        for i_tile in range(blocks[i_block], blocks[i_block+1]):
+            i_sample = samples[i_tile // n_chunks]
+            i_chunk = i_tile % n_chunks
+            i_group = chunks[i_chunk, 0]
+            # Positions in the plan of the shapelets of the chunk, the
+            # normalized ones starting at c
+            a = chunks[i_chunk, 1]
+            b = chunks[i_chunk, 2]
+            c = min(max(a, norm_ptr[i_group]), b)
+            x = ragged_sample(X, X_offsets, X_len, i_sample)
+            if x.shape[0] == 1:
+                _apply_tile_univariate(
+                    X_new[i_sample], x[0], plan, a, b, c, groups[i_group, 0],
+                    groups[i_group, 1], metric, early_abandon, sdp_mode,
+                    use_phase
+                )
+            else:
+                _apply_tile_multivariate(
+                    X_new[i_sample], x, plan, a, b, c, groups[i_group, 0],
+                    groups[i_group, 1], metric, early_abandon, sdp_mode,
+                    use_phase
+                )
+    return X_new
+
+# Versions of apply_all_shapelets specialized for each distance, called by
+# R_DST.transform. Forcing a literal distance with numba.literally would
+# instead type the function again at each call made from Python, which takes
+# several milliseconds.
+
+@njit(cache=True, nogil=True)
+def apply_all_shapelets_manhattan(
+    X, plan, early_abandon, sdp_mode, use_phase, X_len, X_offsets, X_new
+):
+    return apply_all_shapelets(
+        X, plan, DIST_MANHATTAN, early_abandon, sdp_mode, use_phase, X_len,
+        X_offsets, X_new
+    )
+
+@njit(cache=True, nogil=True)
+def apply_all_shapelets_euclidean(
+    X, plan, early_abandon, sdp_mode, use_phase, X_len, X_offsets, X_new
+):
+    return apply_all_shapelets(
+        X, plan, DIST_EUCLIDEAN, early_abandon, sdp_mode, use_phase, X_len,
+        X_offsets, X_new
+    )
+
+@njit(cache=True, nogil=True)
+def apply_all_shapelets_squared(
+    X, plan, early_abandon, sdp_mode, use_phase, X_len, X_offsets, X_new
+):
+    return apply_all_shapelets(
+        X, plan, DIST_SQUARED, early_abandon, sdp_mode, use_phase, X_len,
+        X_offsets, X_new
+    )
+
+APPLY_ALL_SHAPELETS = {
+    DIST_MANHATTAN: apply_all_shapelets_manhattan,
+    DIST_EUCLIDEAN: apply_all_shapelets_euclidean,
+    DIST_SQUARED: apply_all_shapelets_squared
+}
 
 @njit(cache=True)
 def prime_up_to(n):
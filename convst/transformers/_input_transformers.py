@@ -9,9 +9,7 @@ Created on Tue Sep  6 16:35:58 2022
 from sklearn.base import BaseEstimator, TransformerMixin
 from convst.utils.checks_utils import check_array_3D
 from numba import njit, prange
-from pyts.approximation import DiscreteFourierTransform, SymbolicAggregateApproximation
 import numpy as np
-from scipy.signal import periodogram
 from sklearn.preprocessing import StandardScaler, MinMaxScaler
 
 class c_StandardScaler(StandardScaler):
@@ -94,6 +92,7 @@ class Periodigram(BaseEstimator, TransformerMixin):
         return self
     
     def transform(self, X):
+        from scipy.signal import periodogram
         n_ts = periodogram(X[0,0,:], detrend=False, window=self.window_type)[1].shape[0]
         X_new = np.empty((X.shape[0], X.shape[1], n_ts))
         for i in range(X.shape[0]):
@@ -121,6 +120,8 @@ class Sax(BaseEstimator, TransformerMixin):
         
     
     def fit(self, X, y=None):
+        # pyts is only imported by the transformers using it
+        from pyts.approximation import SymbolicAggregateApproximation
         if self.random:
             self._random_init(X.shape[1])
         self.transformer = SymbolicAggregateApproximation(
@@ -147,6 +148,7 @@ class FourrierCoefs(BaseEstimator, TransformerMixin):
         self.norm_std = norm_std
     
     def fit(self, X, y=None):
+        from pyts.approximation import DiscreteFourierTransform
         self.transformer = DiscreteFourierTransform(
             n_coefs=self.n_coefs, drop_sum=self.drop_sum, anova=self.anova,
             norm_std=self.norm_std, norm_mean=self.norm_mean,
@@ -2,24 +2,26 @@
 """
 @author: Antoine Guillaume
 """
-from numpy.random import choice, uniform, random, seed
 from numpy import (
-    unique, where, percentile, int64, bool_, float64, concatenate,
-    dot, log2, floor_divide, zeros, floor, power, ones, cumsum, mean, std,
-    arange
+    percentile, int64, bool_, float64, concatenate, dot, log2, floor_divide,
+    zeros, floor, power, ones, cumsum, argsort, uint64, arange, full
 )
 
 from convst.transformers._commons import (
-    get_subsequence, compute_shapelet_dist_vector,
-    apply_one_shapelet_one_sample_multivariate, _combinations_1d,
-    generate_strides_2D, prime_up_to
+    get_subsequence, compute_shapelet_dist_vector, prime_up_to, bitset_n_words,
+    bitset_fill, bitset_clear, bitset_count_channels, bitset_select_channels,
+    bitset_channels_valid, same_class_index, choose_same_class,
+    SAMPLING_MAX_TRIES, rng_stream, rng_randint, generation_schedule,
+    rng_random, rng_uniform, rng_choice, gemm_apply_group_multivariate,
+    apply_schedule
 )
 
-from numba import njit, prange
+from numba import njit, prange, literally
 
 @njit(cache=True)
 def M_SL_init_random_shapelet_params(
-    n_shapelets, shapelet_sizes, n_timestamps, p_norm, max_channels, prime_scheme
+    n_shapelets, shapelet_sizes, n_timestamps, p_norm, max_channels,
+    prime_scheme, r_seed
 ):
     """
     Initialize the parameters of the shapelets.    
@@ -37,6 +39,8 @@ def M_SL_init_random_shapelet_params(
         shapelet to use z-normalized distance
     max_channels : int
         The maximum number of features considered for one shapelet
+    r_seed : int
+        Random seed of the random streams of the shapelets
         
     Returns
     -------
@@ -53,8 +57,21 @@ def M_SL_init_random_shapelet_params(
     channels : array, shape=(n_shapelet, n_features)
         The features considered by each shapelet
     """
-    # Lengths of the shapelets
-    lengths = choice(shapelet_sizes, size=n_shapelets).astype(int64)
+    # Each shapelet draws its parameters from its own random stream
+    states = zeros((n_shapelets, 2), dtype=uint64)
+    lengths = zeros(n_shapelets, dtype=int64)
+    normalize = zeros(n_shapelets, dtype=bool_)
+    n_channels = zeros(n_shapelets, dtype=int64)
+    for i in prange(n_shapelets):
+        states[i] = rng_stream(r_seed, 2*i)
+        # Lengths of the shapelets
+        lengths[i] = shapelet_sizes[
+            rng_randint(states[i], 0, shapelet_sizes.shape[0])
+        ]
+        # Is shapelet using z-normalization ?
+        normalize[i] = rng_random(states[i]) < p_norm
+        # channels (i.e. features)
+        n_channels[i] = rng_randint(states[i], 0, max_channels) + 1
 
     # Dilations
     upper_bounds = log2(floor_divide(n_timestamps - 1, lengths - 1))
@@ -62,19 +79,19 @@ def M_SL_init_random_shapelet_params(
         primes = prime_up_to(int64(2**upper_bounds.max()))
         dilations = zeros(n_shapelets, dtype=int64)
         for i in prange(n_shapelets):
-            dilations[i] = choice(primes[primes<=int64(2**upper_bounds[i])])
+            _primes = primes[primes<=int64(2**upper_bounds[i])]
+            dilations[i] = _primes[
+                rng_randint(states[i], 0, _primes.shape[0])
+            ]
     else:
         powers = zeros(n_shapelets)
         for i in prange(n_shapelets):
-            powers[i] = uniform(0, upper_bounds[i])
+            powers[i] = rng_uniform(states[i], 0, upper_bounds[i])
         dilations = floor(power(2, powers)).astype(int64)
     
     # Init threshold array
     threshold = zeros(n_shapelets)
 
-    # channels (i.e. features)
-    n_channels = choice(max_channels, size=n_shapelets)+1
-
     channel_ids = zeros(n_channels.sum(), dtype=int64)
 
     # Init values array
@@ -84,16 +101,12 @@ def M_SL_init_random_shapelet_params(
         )
     )
 
-    # Is shapelet using z-normalization ?
-    normalize = random(size=n_shapelets)
-    normalize = (normalize < p_norm)
-
     return values, lengths, dilations, threshold, normalize, n_channels, channel_ids
 
 @njit(cache=True, parallel=True)
 def M_SL_generate_shapelet(
     X, y, n_shapelets, shapelet_sizes, r_seed, p_norm, p_min, p_max, alpha,
-    dist_func, use_phase, max_channels, prime_scheme
+    metric, sdp_mode, use_phase, max_channels, prime_scheme
 ):
     """
     Given a time series dataset and parameters of the method, generate the
@@ -109,8 +122,8 @@ def M_SL_generate_shapelet(
         Number of shapelet to generate
     shapelet_sizes : array, shape=()
         An array of possible shapelet length.
-    seed : int
-        Random seed generator for numpy
+    r_seed : int
+        Random seed of the random streams of the shapelets
     p_norm : float
         Probability of each shapelet to use z-normalized distance
     p_min : float
@@ -119,9 +132,11 @@ def M_SL_generate_shapelet(
         Upper bound for the percentile during the choice of threshold
     alpha : float
         Alpha similarity parameter
-    dist_func: function
-        A distance function implemented with Numba taking two 1D vectors as
-        input.
+    metric : int
+        The distance, among DIST_MANHATTAN, DIST_EUCLIDEAN and DIST_SQUARED.
+    sdp_mode : int
+        Indicate if the sliding dot product engine can be used to compute
+        distance vectors, and for which distance.
     use_phase: bool
         Wheter to use phase invariance
     
@@ -141,70 +156,108 @@ def M_SL_generate_shapelet(
         normalize : array, shape=(n_shapelets)
             Normalization indicatorr of the shapelets
     """
+    literally(metric)
     n_samples, n_features, n_timestamps = X.shape
-    # Fix the random seed
-    seed(r_seed)
 
     #Initialize shapelets
     values, lengths, dilations, threshold, normalize, n_channels, channel_ids = \
     M_SL_init_random_shapelet_params(
-        n_shapelets, shapelet_sizes, n_timestamps, p_norm, max_channels, prime_scheme
-    )
-    #Initialize self similarity mask
-    unique_dil = unique(dilations)
-    mask_sampling = ones(
-        (2,unique_dil.shape[0],n_samples,n_features,n_timestamps), dtype=bool_
+        n_shapelets, shapelet_sizes, n_timestamps, p_norm, max_channels,
+        prime_scheme, r_seed
     )
+    n_words = bitset_n_words(n_timestamps)
     mask_return = ones(n_shapelets, dtype=bool_)
-    #Counter for values array indexes
-    a1 = 0
-    #Counter for channels_ids array indexes
-    a2 = 0     
+    order, start, size, rank = same_class_index(y)
+    #Position of each shapelet in the values and channel_ids arrays, fixed
+    #by its index so that it does not depend on the order of generation
+    a1 = concatenate((zeros(1, dtype=int64),cumsum(n_channels*lengths)))
+    a2 = concatenate((zeros(1, dtype=int64),cumsum(n_channels)))
+
+    states, items_ptr, items_shapelets, items_samples = generation_schedule(
+        dilations, normalize, n_samples, r_seed
+    )
 
-    #For each dilation, we can do in parallel
-    for i_d in prange(unique_dil.shape[0]):
-        #For each shapelet id with this dilation
-        id_shps = where(dilations==unique_dil[i_d])[0]
-        min_l = min(lengths[id_shps])
+    #For each work item (a block of samples of a dilation and normalization
+    #group), we can do in parallel
+    for i_item in prange(items_samples.shape[0]):
+        #For each shapelet id of this work item
+        id_shps = items_shapelets[items_ptr[i_item]:items_ptr[i_item+1]]
+        _dilation = dilations[id_shps[0]]
+        norm = int64(normalize[id_shps[0]])
+        min_l = min(lengths[dilations==_dilation])
+        x_start = items_samples[i_item, 0]
+        n_block = items_samples[i_item, 1] - x_start
+        #Initialize self similarity mask of the block, as one bitset per
+        #(sample, feature)
+        mask_dil = zeros((n_block, n_features, n_words), dtype=uint64)
+        for i_x in range(n_block):
+            for i_ft in range(n_features):
+                bitset_fill(mask_dil[i_x, i_ft], n_timestamps)
+        n_valid_sample = zeros(n_block, dtype=int64)
+        
         for i_shp in id_shps:
-            _dilation = dilations[i_shp]
             _length = lengths[i_shp]
-            norm = int64(normalize[i_shp])
+            state = states[i_shp]
             _n_channels = n_channels[i_shp]
             if use_phase:
                 d_shape = n_timestamps
             else:
                 d_shape = n_timestamps-(_length-1)*_dilation
-            mask_dil = mask_sampling[norm,i_d]
             
             #Possible sampling points given self similarity mask
             
             _values = zeros(_n_channels * _length)
             
-            _channel_ids = choice(
-                arange(0, n_features), _n_channels, replace=False
-            )
+            _channel_ids = rng_choice(state, n_features, _n_channels)
             
-            i_mask = where(
-                mask_dil[:,_channel_ids,:d_shape].sum(axis=1)>=_n_channels*alpha
-            )
+            #Choose a (sample, timestamp) pair uniformly among the possible
+            #ones, first by rejection of uniform draws, which is fast as long
+            #as the mask is not too full, then by counting all of them
+            i_sample = -1
+            index = -1
+            if d_shape > 0:
+                for i_try in range(SAMPLING_MAX_TRIES):
+                    i_x = rng_randint(state, 0, n_block)
+                    i_t = rng_randint(state, 0, d_shape)
+                    if bitset_channels_valid(
+                        mask_dil[i_x], _channel_ids, _n_channels*alpha,
+                        i_t
+                    ):
+                        i_sample = i_x
+                        index = i_t
+                        break
+            
+            if i_sample < 0:
+                n_valid = 0
+                for i_x in range(n_block):
+                    n_valid_sample[i_x] = bitset_count_channels(
+                        mask_dil[i_x], _channel_ids, _n_channels*alpha,
+                        d_shape
+                    )
+                    n_valid += n_valid_sample[i_x]
+                
+                if n_valid > 0:
+                    i_pair = rng_randint(state, 0, n_valid)
+                    i_sample = 0
+                    while i_pair >= n_valid_sample[i_sample]:
+                        i_pair -= n_valid_sample[i_sample]
+                        i_sample += 1
+                    index = bitset_select_channels(
+                        mask_dil[i_sample], _channel_ids,
+                        _n_channels*alpha,
+                        rng_randint(state, 0, n_valid_sample[i_sample])
+                    )
             
-            if i_mask[0].shape[0] > 0:
+            if i_sample >= 0:
+                id_sample = x_start + i_sample
                 x_dist = zeros(d_shape)
-                #Choose a sample
-                id_sample = choice(i_mask[0])
-                #Choose a timestamp
-                index = choice(i_mask[1][i_mask[0]==id_sample])
                 #Counter to keep track of indexes for value affectation
                 a3 = 0
                 
                 #Select another sample of the same class as the sample used
-                loc_others = where(y == y[id_sample])[0]
-                if loc_others.shape[0] > 1:
-                    loc_others = loc_others[loc_others != id_sample]
-                    id_test = choice(loc_others)
-                else:
-                    id_test = id_sample
+                id_test = choose_same_class(
+                    state, id_sample, order, start, size, rank
+                )
                 
                 #Update the mask
                 alpha_size = _length - int64(max(1,(1-alpha)*min_l))
@@ -212,14 +265,14 @@ def M_SL_generate_shapelet(
                     for j in range(alpha_size):
                         #We can use modulo even without phase invariance, as we
                         #limit the sampling to d_shape
-                        mask_sampling[
-                            norm, i_d, id_sample, _channel_ids[k],
+                        bitset_clear(
+                            mask_dil[i_sample, _channel_ids[k]],
                             (index-(j*_dilation))%n_timestamps
-                        ] = False
-                        mask_sampling[
-                            norm, i_d, id_sample, _channel_ids[k],
+                        )
+                        bitset_clear(
+                            mask_dil[i_sample, _channel_ids[k]],
                             (index+(j*_dilation))%n_timestamps
-                        ] = False
+                        )
                     
                     b3 = a3 + _length
                     #Extract the values
@@ -231,154 +284,127 @@ def M_SL_generate_shapelet(
                     #Compute distance vector
                     x_dist += compute_shapelet_dist_vector(
                         X[id_test, _channel_ids[k]], _v, _length, _dilation,
-                        dist_func, norm, use_phase
+                        metric, norm, use_phase, sdp_mode
                     )
                     
                     _values[a3:b3] = _v
                     a3 = b3
-                #Counter for values array indexes
-                b1 = a1 + _n_channels*_length
-                #Counter for channels_ids array indexes
-                b2 = a2 + _n_channels
-                
-                values[a1:b1] = _values
-                channel_ids[a2:b2] = _channel_ids
+                values[a1[i_shp]:a1[i_shp+1]] = _values
+                channel_ids[a2[i_shp]:a2[i_shp+1]] = _channel_ids
                 
                 #Extract value between two percentile as threshold for SO
                 ps = percentile(x_dist, [p_min,p_max])
-                threshold[i_shp] = uniform(
-                    ps[0], ps[1]
+                threshold[i_shp] = rng_uniform(
+                    state, ps[0], ps[1]
                 )
-                a1 = b1
-                a2 = b2
             else:
                 mask_return[i_shp] = False
+    
+    mask_values = zeros(values.shape[0], dtype=bool_)
+    mask_channels = zeros(channel_ids.shape[0], dtype=bool_)
+    for i_shp in prange(n_shapelets):
+        if mask_return[i_shp]:
+            mask_values[a1[i_shp]:a1[i_shp+1]] = True
+            mask_channels[a2[i_shp]:a2[i_shp+1]] = True
             
     return (
-        values[:a1],
+        values[mask_values],
         lengths[mask_return],
         dilations[mask_return],
         threshold[mask_return],
         normalize[mask_return],
         n_channels[mask_return],
-        channel_ids[:a2]
+        channel_ids[mask_channels]
     )
 
-@njit(cache=True, parallel=True, fastmath=True)
-def M_SL_apply_all_shapelets(
-    X, shapelets, dist_func, use_phase
-):
+@njit(cache=True, parallel=True, fastmath=True, nogil=True)
+def M_SL_apply_all_shapelets_gemm(X, plan, sdp_mode, use_phase, X_new):
     """
     Apply a set of generated shapelet using the parameter arrays previously 
-    generated to a set of time series.
+    generated to a set of time series, with the batched engine : for each
+    sample and each channel, the distances to all the shapelets sharing a 
+    length and a dilation are computed from a matrix product between the
+    windows of the channel and the shapelets values on this channel.
 
     Parameters
     ----------
     X : array, shape=(n_samples, n_features, n_timestamps)
         Input time series
-    shapelets: set of array, shape=(5)
-        values : array, shape=(n_shapelets, max(shapelet_sizes))
-            Values of the shapelets. If the shapelet use z-normalized distance,
-            those values are already z-normalized by the shapelet 
-            initialization step.
-        lengths : array, shape=(n_shapelets)
-            Length parameter of the shapelets
-        dilations : array, shape=(n_shapelets)
-            Dilation parameter of the shapelets
-        threshold : array, shape=(n_shapelets)
-            Threshold parameter of the shapelets
-        normalize : array, shape=(n_shapelets)
-            Normalization indicatorr of the shapelets
-    dist_func: function
-        A distance function implemented with Numba taking two 1D vectors as
-        input.
+    plan : tuple of array
+        The execution plan of the shapelets, built by shapelet_plan at fit
+        time.
+    sdp_mode : int
+        Either SDP_SQUARED or SDP_EUCLIDEAN, the distance to use.
     use_phase: bool
         Wheter to use phase invariance
+    X_new : array, shape=(n_samples, 3*n_shapelets)
+        Array of the type of X in which the features are written, for 
+        example a view of a shared memory block.
     
     Returns
     -------
     X_new : array, shape=(n_samples, 3*n_shapelets)
         The transformed input time series with each shapelet extracting 3
-        feature from the distance vector computed on each time series.
+        feature from the distance vector computed on each time series, 
+        written in the X_new argument.
 
     """
-    (values, lengths, dilations, threshold, 
-     normalize, n_channels, channel_ids) = shapelets
-    n_shapelets = len(lengths)
+    (groups, group_ptr, norm_ptr, order, values, values_ptr, channel_ids,
+     channels_ptr, threshold, _) = plan
     n_samples, n_ft, n_timestamps = X.shape
     n_features = 3
-    
-    #(u_l * u_d , 2)
-    params_shp = _combinations_1d(lengths, dilations)
-    #(u_l * u_d) + 1
-    n_shp_params = zeros(params_shp.shape[0]+1, dtype=int64)
-    #(n_shapelets)
-    idx_shp = zeros(n_shapelets, dtype=int64)
-    
-    #Indexes per shapelets for values array
-    a1 = concatenate((zeros(1, dtype=int64),cumsum(n_channels*lengths)))
-    #Indexes per shapelets for channel_ids array
-    a2 = concatenate((zeros(1, dtype=int64),cumsum(n_channels)))
-    # Counter for shapelet params array
-    a3 = 0
-    
-    for i in range(params_shp.shape[0]):
-        _length = params_shp[i, 0]
-        _dilation = params_shp[i, 1]
-        
-        ix_shapelets = where((lengths == _length) & (dilations == _dilation))[0]
-        b = a3 + ix_shapelets.shape[0]
-        
-        idx_shp[a3:b] = ix_shapelets
-        n_shp_params[i+1] = ix_shapelets.shape[0]
-        
-        a3 = b
-    n_shp_params = cumsum(n_shp_params)
-    
-    X_new = zeros((n_samples, n_features * n_shapelets))
-    for i_sample in prange(n_samples):
-        #n_shp_params is a cumsum starting at 0
-        for i_shp_param in prange(n_shp_params.shape[0]-1):
-            _length = params_shp[i_shp_param, 0]
-            _dilation = params_shp[i_shp_param, 1]
-            
-            strides = generate_strides_2D(
-                X[i_sample], _length, _dilation, use_phase
-            )
-            # Indexes of shapelets corresponding to the params of i_shp_param
-            _idx_shp = idx_shp[n_shp_params[i_shp_param]:n_shp_params[i_shp_param+1]]
-            
-            _idx_no_norm = _idx_shp[where(normalize[_idx_shp] == False)[0]]
-            for i_idx in range(_idx_no_norm.shape[0]):               
-                i_shp = _idx_no_norm[i_idx]
-                _channels = channel_ids[a2[i_shp]:a2[i_shp+1]]
-                _values = values[a1[i_shp]:a1[i_shp+1]].reshape(
-                    n_channels[i_shp], _length
-                )
 
+    # The tiles of apply_schedule, made of a sample and a whole group, are 
+    # the iterations of a single parallel loop, so that the groups of a long
+    # sample use several threads
+    samples, chunks, blocks = apply_schedule(
+        groups, group_ptr, full(n_samples, n_timestamps), use_phase, False
+    )
+    n_chunks = chunks.shape[0]
+
+    # The rows of the shapelets of a chunk, one per (shapelet, channel) pair,
+    # are sorted by channel once for all the samples
+    S = zeros(values.shape[0])
+    row_channel = zeros(channel_ids.shape[0], dtype=int64)
+    row_shapelet = zeros(channel_ids.shape[0], dtype=int64)
+    for i_chunk in range(n_chunks):
+        _length = groups[chunks[i_chunk, 0], 0]
+        a = chunks[i_chunk, 1]
+        b = chunks[i_chunk, 2]
+        r0 = channels_ptr[a]
+        r1 = channels_ptr[b]
+        _row_shapelet = zeros(r1 - r0, dtype=int64)
+        for p in range(a, b):
+            _row_shapelet[channels_ptr[p]-r0:channels_ptr[p+1]-r0] = p - a
+        rows = argsort(channel_ids[r0:r1], kind='mergesort')
+        for k in range(rows.shape[0]):
+            row_channel[r0+k] = channel_ids[r0+rows[k]]
+            row_shapelet[r0+k] = _row_shapelet[rows[k]]
+            _a = values_ptr[a] + rows[k]*_length
+            _b = values_ptr[a] + k*_length
+            S[_b:_b+_length] = values[_a:_a+_length]
+
+    for i_block in prange(blocks.shape[0]-1):
+        for i_tile in range(blocks[i_block], blocks[i_block+1]):
+            i_sample = samples[i_tile // n_chunks]
+            i_chunk = i_tile % n_chunks
+            i_group = chunks[i_chunk, 0]
+            a = chunks[i_chunk, 1]
+            b = chunks[i_chunk, 2]
+            _length = groups[i_group, 0]
+            _dilation = groups[i_group, 1]
+            r0 = channels_ptr[a]
+            r1 = channels_ptr[b]
+
+            _X_new = gemm_apply_group_multivariate(
+                X[i_sample],
+                S[values_ptr[a]:values_ptr[b]].reshape((r1 - r0, _length)),
+                row_channel[r0:r1], row_shapelet[r0:r1],
+                arange(a, b) >= norm_ptr[i_group], threshold[a:b], _length,
+                _dilation, use_phase, sdp_mode
+            )
+            for p in range(a, b):
+                i_shp = order[p]
                 X_new[i_sample, (n_features * i_shp):(n_features * i_shp + n_features)] = \
-                apply_one_shapelet_one_sample_multivariate(
-                    strides[_channels], _values, threshold[i_shp], dist_func
-                )
-                        
-            _idx_norm = _idx_shp[where(normalize[_idx_shp] == True)[0]]
-            if _idx_norm.shape[0] > 0:
-                #n_features
-                for i_stride in range(strides.shape[0]):
-                    #n_timestamps
-                    for j_stride in range(strides.shape[1]):
-                      _str = strides[i_stride,j_stride]
-                      strides[i_stride,j_stride] = (_str - mean(_str))/(std(_str)+1e-8)
-                          
-                for i_idx in range(_idx_norm.shape[0]):               
-                    i_shp = _idx_norm[i_idx]
-                    _channels = channel_ids[a2[i_shp]:a2[i_shp+1]]
-                    _values = values[a1[i_shp]:a1[i_shp+1]].reshape(
-                        n_channels[i_shp], _length
-                    )
-                    
-                    X_new[i_sample, (n_features * i_shp):(n_features * i_shp + n_features)] = \
-                    apply_one_shapelet_one_sample_multivariate(
-                        strides[_channels], _values, threshold[i_shp], dist_func
-                    )
-    return X_new
\ No newline at end of file
+                _X_new[p - a]
+    return X_new
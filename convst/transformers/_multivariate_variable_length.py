@@ -2,24 +2,25 @@
 """
 @author: Antoine Guillaume
 """
-from numpy.random import choice, uniform, random, seed
 from numpy import (
-    unique, where, percentile, int64, bool_, float64, concatenate, any as _any,
-    dot, log2, floor_divide, zeros, floor, power, ones, cumsum, mean, std,
-    arange
+    percentile, int64, bool_, float64, concatenate,
+    dot, log2, floor_divide, zeros, floor, power, ones, cumsum, uint64
 )
 
 from convst.transformers._commons import (
-    get_subsequence, compute_shapelet_dist_vector,
-    apply_one_shapelet_one_sample_multivariate, _combinations_1d,
-    generate_strides_2D, prime_up_to
+    get_subsequence, compute_shapelet_dist_vector, prime_up_to, bitset_clear,
+    bitset_count_channels, ragged_sample, ragged_bitsets, ragged_bitset,
+    bitset_select_channels, bitset_channels_valid, bitset_any_channels,
+    same_class_index, choose_same_class, SAMPLING_MAX_TRIES, rng_stream,
+    rng_randint, rng_random, rng_uniform, rng_choice, generation_schedule
 )
 
-from numba import njit, prange
+from numba import njit, prange, literally
 
 @njit(cache=True)
 def M_VL_init_random_shapelet_params(
-    n_shapelets, shapelet_sizes, n_timestamps, p_norm, max_channels, prime_scheme
+    n_shapelets, shapelet_sizes, n_timestamps, p_norm, max_channels,
+    prime_scheme, r_seed
 ):
     """
     Initialize the parameters of the shapelets.    
@@ -37,6 +38,8 @@ def M_VL_init_random_shapelet_params(
         shapelet to use z-normalized distance
     max_channels : int
         The maximum number of features considered for one shapelet
+    r_seed : int
+        Random seed of the random streams of the shapelets
         
     Returns
     -------
@@ -53,8 +56,21 @@ def M_VL_init_random_shapelet_params(
     channels : array, shape=(n_shapelet, n_features)
         The features considered by each shapelet
     """
-    # Lengths of the shapelets
-    lengths = choice(shapelet_sizes, size=n_shapelets).astype(int64)
+    # Each shapelet draws its parameters from its own random stream
+    states = zeros((n_shapelets, 2), dtype=uint64)
+    lengths = zeros(n_shapelets, dtype=int64)
+    normalize = zeros(n_shapelets, dtype=bool_)
+    n_channels = zeros(n_shapelets, dtype=int64)
+    for i in prange(n_shapelets):
+        states[i] = rng_stream(r_seed, 2*i)
+        # Lengths of the shapelets
+        lengths[i] = shapelet_sizes[
+            rng_randint(states[i], 0, shapelet_sizes.shape[0])
+        ]
+        # Is shapelet using z-normalization ?
+        normalize[i] = rng_random(states[i]) < p_norm
+        # channels (i.e. features)
+        n_channels[i] = rng_randint(states[i], 0, max_channels) + 1
 
     # Dilations
     upper_bounds = log2(floor_divide(n_timestamps - 1, lengths - 1))
@@ -62,19 +78,19 @@ def M_VL_init_random_shapelet_params(
         primes = prime_up_to(int64(2**upper_bounds.max()))
         dilations = zeros(n_shapelets, dtype=int64)
         for i in prange(n_shapelets):
-            dilations[i] = choice(primes[primes<=int64(2**upper_bounds[i])])
+            _primes = primes[primes<=int64(2**upper_bounds[i])]
+            dilations[i] = _primes[
+                rng_randint(states[i], 0, _primes.shape[0])
+            ]
     else:
         powers = zeros(n_shapelets)
         for i in prange(n_shapelets):
-            powers[i] = uniform(0, upper_bounds[i])
+            powers[i] = rng_uniform(states[i], 0, upper_bounds[i])
         dilations = floor(power(2, powers)).astype(int64)
 
     # Init threshold array
     threshold = zeros(n_shapelets)
 
-    # channels (i.e. features)
-    n_channels = choice(max_channels, size=n_shapelets)+1
-
     channel_ids = zeros(n_channels.sum(), dtype=int64)
 
     # Init values array
@@ -84,16 +100,13 @@ def M_VL_init_random_shapelet_params(
         )
     )
 
-    # Is shapelet using z-normalization ?
-    normalize = random(size=n_shapelets)
-    normalize = (normalize < p_norm)
-
     return values, lengths, dilations, threshold, normalize, n_channels, channel_ids
 
 @njit(cache=True, parallel=True)
 def M_VL_generate_shapelet(
     X, y, n_shapelets, shapelet_sizes, r_seed, p_norm, p_min, p_max, alpha,
-    dist_func, use_phase, max_channels, min_len, X_len, prime_scheme
+    metric, sdp_mode, use_phase, max_channels, min_len, X_len, X_offsets,
+    prime_scheme
 ):
     """
     Given a time series dataset and parameters of the method, generate the
@@ -101,16 +114,17 @@ def M_VL_generate_shapelet(
 
     Parameters
     ----------
-    X : array, shape=(n_samples, n_features, n_timestamps)
-        Time series dataset
+    X : array, shape=(n_values)
+        Time series dataset, the values of the i-th sample being
+        X[X_offsets[i]:X_offsets[i+1]] in the shape (n_features, X_len[i]).
     y : array, shape=(n_samples)
         Class of each input time series
     n_shapelets : int
         Number of shapelet to generate
     shapelet_sizes : array, shape=()
         An array of possible shapelet length.
-    seed : int
-        Random seed generator for numpy
+    r_seed : int
+        Random seed of the random streams of the shapelets
     p_norm : float
         Probability of each shapelet to use z-normalized distance
     p_min : float
@@ -119,15 +133,19 @@ def M_VL_generate_shapelet(
         Upper bound for the percentile during the choice of threshold
     alpha : float
         Alpha similarity parameter
-    dist_func: function
-        A distance function implemented with Numba taking two 1D vectors as
-        input.
+    metric : int
+        The distance, among DIST_MANHATTAN, DIST_EUCLIDEAN and DIST_SQUARED.
+    sdp_mode : int
+        Indicate if the sliding dot product engine can be used to compute
+        distance vectors, and for which distance.
     use_phase: bool
         Wheter to use phase invariance
     min_len : int
         Minimum length for input time series
     X_len : array, shape=(n_samples)
         The length of each input time series
+    X_offsets : array, shape=(n_samples+1)
+        The position of each input time series in X
     
     Returns
     -------
@@ -145,91 +163,136 @@ def M_VL_generate_shapelet(
         normalize : array, shape=(n_shapelets)
             Normalization indicatorr of the shapelets
     """
-    max_len = max(X_len)
-    n_samples, n_features, _ = X.shape
-    # Fix the random seed
-    seed(r_seed)
+    literally(metric)
+    n_samples = X_len.shape[0]
+    n_features = (X_offsets[1] - X_offsets[0]) // X_len[0]
 
     #Initialize shapelets
     values, lengths, dilations, threshold, normalize, n_channels, channel_ids = \
     M_VL_init_random_shapelet_params(
-        n_shapelets, shapelet_sizes, min_len, p_norm, max_channels, prime_scheme
-    )
-    #Initialize self similarity mask
-    unique_dil = unique(dilations)
-    mask_sampling = ones(
-        (2,unique_dil.shape[0],n_samples,n_features,max_len), dtype=bool_
+        n_shapelets, shapelet_sizes, min_len, p_norm, max_channels,
+        prime_scheme, r_seed
     )
     mask_return = ones(n_shapelets, dtype=bool_)
-    #Counter for values array indexes
-    a1 = 0
-    #Counter for channels_ids array indexes
-    a2 = 0     
-    for i in prange(n_samples):
-        mask_sampling[:,:,i,:,X_len[i]:] = 0
+    order, start, size, rank = same_class_index(y)
+    #Position of each shapelet in the values and channel_ids arrays, fixed
+    #by its index so that it does not depend on the order of generation
+    a1 = concatenate((zeros(1, dtype=int64),cumsum(n_channels*lengths)))
+    a2 = concatenate((zeros(1, dtype=int64),cumsum(n_channels)))
     
-    #For each dilation, we can do in parallel
-    for i_d in prange(unique_dil.shape[0]):
-        #For each shapelet id with this dilation
-        id_shps = where(dilations==unique_dil[i_d])[0]
-        min_l = min(lengths[id_shps])
+    states, items_ptr, items_shapelets, items_samples = generation_schedule(
+        dilations, normalize, n_samples, r_seed
+    )
+
+    #For each work item (a block of samples of a dilation and normalization
+    #group), we can do in parallel
+    for i_item in prange(items_samples.shape[0]):
+        #For each shapelet id of this work item
+        id_shps = items_shapelets[items_ptr[i_item]:items_ptr[i_item+1]]
+        _dilation = dilations[id_shps[0]]
+        norm = int64(normalize[id_shps[0]])
+        min_l = min(lengths[dilations==_dilation])
+        x_start = items_samples[i_item, 0]
+        n_block = items_samples[i_item, 1] - x_start
+        #Initialize self similarity mask of the block, as one bitset per
+        #(sample, feature) of the size of the sample
+        mask_bits, mask_offsets = ragged_bitsets(
+            X_len[x_start:x_start+n_block], n_features
+        )
+        n_valid_sample = zeros(n_block, dtype=int64)
+        
         for i_shp in id_shps:
-            _dilation = dilations[i_shp]
             _length = lengths[i_shp]
-            norm = int64(normalize[i_shp])
+            state = states[i_shp]
             _n_channels = n_channels[i_shp]
             
-            _channel_ids = choice(
-                arange(0, n_features), _n_channels, replace=False
-            )
+            _channel_ids = rng_choice(state, n_features, _n_channels)
             
             _values = zeros(_n_channels * _length)
             
-            
-            mask_dil = mask_sampling[norm,i_d]
-            
-            i_mask = zeros(n_samples)
             # TODO : the choice of sample don't have the same probability
             # compared to same length version, evaluate the impact.
-            if use_phase:
-                for i_x in range(n_samples):
-                    i_mask[i_x] = _any((
-                        mask_dil[i_x][_channel_ids, :X_len[i_x]]
-                    ).sum(axis=0)>=_n_channels*alpha)
-            else:
-                for i_x in range(n_samples):
-                    i_mask[i_x] = _any((
-                        mask_dil[i_x][_channel_ids, :X_len[i_x]-(_length-1)*_dilation]
-                    ).sum(axis=0)>=_n_channels*alpha)
+            #Choose a sample uniformly among the samples with possible
+            #sampling points, first by rejection of uniform draws, which is
+            #fast as long as the mask is not too full, then by counting them
+            i_sample = -1
+            for i_try in range(SAMPLING_MAX_TRIES):
+                i_x = rng_randint(state, 0, n_block)
+                if use_phase:
+                    d_shape = X_len[x_start+i_x]
+                else:
+                    d_shape = X_len[x_start+i_x]-(_length-1)*_dilation
+                if bitset_any_channels(
+                    ragged_bitset(mask_bits, mask_offsets, n_features, i_x),
+                    _channel_ids, _n_channels*alpha,
+                    d_shape
+                ):
+                    i_sample = i_x
+                    break
+            
+            if i_sample < 0:
+                n_valid = 0
+                for i_x in range(n_block):
+                    if use_phase:
+                        d_shape = X_len[x_start+i_x]
+                    else:
+                        d_shape = X_len[x_start+i_x]-(_length-1)*_dilation
+                    n_valid_sample[i_x] = bitset_count_channels(
+                        ragged_bitset(
+                            mask_bits, mask_offsets, n_features, i_x
+                        ), _channel_ids, _n_channels*alpha,
+                        d_shape
+                    )
+                    if n_valid_sample[i_x] > 0:
+                        n_valid += 1
                 
-            i_mask = where(i_mask)
-            if i_mask[0].shape[0] > 0:
+                if n_valid > 0:
+                    i_valid = rng_randint(state, 0, n_valid)
+                    i_sample = 0
+                    while i_valid > 0 or n_valid_sample[i_sample] == 0:
+                        if n_valid_sample[i_sample] > 0:
+                            i_valid -= 1
+                        i_sample += 1
                 
-                #Choose a sample
-                id_sample = choice(i_mask[0])
-                #Choose a timestamp
-                loc_others = where(y == y[id_sample])[0]
-                if loc_others.shape[0] > 1:
-                    loc_others = loc_others[loc_others != id_sample]
-                    id_test = choice(loc_others)
-                else:
-                    id_test = id_sample
+            if i_sample >= 0:
+                id_sample = x_start + i_sample
+                mask_x = ragged_bitset(
+                    mask_bits, mask_offsets, n_features, i_sample
+                )
+                
+                #Select another sample of the same class as the sample used
+                id_test = choose_same_class(
+                    state, id_sample, order, start, size, rank
+                )
                 
                 if use_phase:
                     x_dist = zeros(X_len[id_test])
-                    t_mask = where(
-                        mask_dil[id_sample][
-                            _channel_ids ,:X_len[id_sample]
-                        ].sum(axis=0)>=_n_channels*alpha
-                    )
                 else:
                     x_dist = zeros(X_len[id_test]-(_length-1)*_dilation)
-                    t_mask = where(
-                        mask_dil[id_sample][
-                            _channel_ids ,:X_len[id_sample]-(_length-1)*_dilation
-                        ].sum(axis=0)>=_n_channels*alpha
+                #Choose a timestamp uniformly among the possible sampling
+                #points of this sample, with the same strategy
+                if use_phase:
+                    d_shape = X_len[id_sample]
+                else:
+                    d_shape = X_len[id_sample]-(_length-1)*_dilation
+                index = -1
+                for i_try in range(SAMPLING_MAX_TRIES):
+                    i_t = rng_randint(state, 0, d_shape)
+                    if bitset_channels_valid(
+                        mask_x, _channel_ids,
+                        _n_channels*alpha, i_t
+                    ):
+                        index = i_t
+                        break
+                if index < 0:
+                    n_valid = bitset_count_channels(
+                        mask_x, _channel_ids,
+                        _n_channels*alpha, d_shape
+                    )
+                    index = bitset_select_channels(
+                        mask_x, _channel_ids,
+                        _n_channels*alpha, rng_randint(state, 0, n_valid)
                     )
-                index = choice(t_mask[0])    
                 
                 #Counter to keep track of indexes for value affectation
                 a3 = 0
@@ -242,173 +305,58 @@ def M_VL_generate_shapelet(
                     for j in range(alpha_size):
                         #We can use modulo event without phase invariance, as we
                         #limit the sampling to d_shape
-                        mask_sampling[
-                            norm, i_d, id_sample, _channel_ids[k],
+                        bitset_clear(
+                            mask_x[_channel_ids[k]],
                             (index-(j*_dilation))%X_len[id_sample]
-                        ] = False
-                        mask_sampling[
-                            norm, i_d, id_sample, _channel_ids[k],
+                        )
+                        bitset_clear(
+                            mask_x[_channel_ids[k]],
                             (index+(j*_dilation))%X_len[id_sample]
-                        ] = False
+                        )
                     
                     b3 = a3 + _length
                     #Extract the values
                     _v = get_subsequence(
-                        X[id_sample, _channel_ids[k], :X_len[id_sample]], index, _length,
+                        ragged_sample(X, X_offsets, X_len, id_sample)[
+                            _channel_ids[k]
+                        ], index, _length,
                         _dilation, norm, use_phase
                     )
                     
                     #Compute distance vector
                     x_dist += compute_shapelet_dist_vector(
-                        X[id_test, _channel_ids[k], :X_len[id_test]], _v, _length, _dilation,
-                        dist_func, norm, use_phase
+                        ragged_sample(X, X_offsets, X_len, id_test)[
+                            _channel_ids[k]
+                        ], _v, _length, _dilation,
+                        metric, norm, use_phase, sdp_mode
                     )
                     
                     _values[a3:b3] = _v
                     a3 = b3
-                #Counter for values array indexes
-                b1 = a1 + _n_channels*_length
-                #Counter for channels_ids array indexes
-                b2 = a2 + _n_channels
-                
-                values[a1:b1] = _values
-                channel_ids[a2:b2] = _channel_ids
+                values[a1[i_shp]:a1[i_shp+1]] = _values
+                channel_ids[a2[i_shp]:a2[i_shp+1]] = _channel_ids
                 
                 #Extract value between two percentile as threshold for SO
                 ps = percentile(x_dist, [p_min,p_max])
-                threshold[i_shp] = uniform(
-                    ps[0], ps[1]
+                threshold[i_shp] = rng_uniform(
+                    state, ps[0], ps[1]
                 )
-                a1 = b1
-                a2 = b2
             else:
                 mask_return[i_shp] = False
+    
+    mask_values = zeros(values.shape[0], dtype=bool_)
+    mask_channels = zeros(channel_ids.shape[0], dtype=bool_)
+    for i_shp in prange(n_shapelets):
+        if mask_return[i_shp]:
+            mask_values[a1[i_shp]:a1[i_shp+1]] = True
+            mask_channels[a2[i_shp]:a2[i_shp+1]] = True
             
     return (
-        values[:a1],
+        values[mask_values],
         lengths[mask_return],
         dilations[mask_return],
         threshold[mask_return],
         normalize[mask_return],
         n_channels[mask_return],
-        channel_ids[:a2]
+        channel_ids[mask_channels]
     )
-
-@njit(cache=True, parallel=True, fastmath=True)
-def M_VL_apply_all_shapelets(
-    X, shapelets, dist_func, use_phase, X_len
-):
-    """
-    Apply a set of generated shapelet using the parameter arrays previously 
-    generated to a set of time series.
-
-    Parameters
-    ----------
-    X : array, shape=(n_samples, n_features, n_timestamps)
-        Input time series
-    shapelets: set of array, shape=(5)
-        values : array, shape=(n_shapelets, max(shapelet_sizes))
-            Values of the shapelets. If the shapelet use z-normalized distance,
-            those values are already z-normalized by the shapelet 
-            initialization step.
-        lengths : array, shape=(n_shapelets)
-            Length parameter of the shapelets
-        dilations : array, shape=(n_shapelets)
-            Dilation parameter of the shapelets
-        threshold : array, shape=(n_shapelets)
-            Threshold parameter of the shapelets
-        normalize : array, shape=(n_shapelets)
-            Normalization indicatorr of the shapelets
-    dist_func: function
-        A distance function implemented with Numba taking two 1D vectors as
-        input.
-    use_phase: bool
-        Wheter to use phase invariance
-    X_len : array, shape=(n_samples)
-        The length of each input time series
-    
-    Returns
-    -------
-    X_new : array, shape=(n_samples, 3*n_shapelets)
-        The transformed input time series with each shapelet extracting 3
-        feature from the distance vector computed on each time series.
-
-    """
-    (values, lengths, dilations, threshold, 
-     normalize, n_channels, channel_ids) = shapelets
-    n_shapelets = len(lengths)
-    n_samples, n_ft, _ = X.shape
-    n_features = 3
-    
-    #(u_l * u_d , 2)
-    params_shp = _combinations_1d(lengths, dilations)
-    #(u_l * u_d) + 1
-    n_shp_params = zeros(params_shp.shape[0]+1, dtype=int64)
-    #(n_shapelets)
-    idx_shp = zeros(n_shapelets, dtype=int64)
-    
-    #Indexes per shapelets for values array
-    a1 = concatenate((zeros(1, dtype=int64),cumsum(n_channels*lengths)))
-    #Indexes per shapelets for channel_ids array
-    a2 = concatenate((zeros(1, dtype=int64),cumsum(n_channels)))
-    # Counter for shapelet params array
-    a3 = 0
-    
-    for i in range(params_shp.shape[0]):
-        _length = params_shp[i, 0]
-        _dilation = params_shp[i, 1]
-        
-        ix_shapelets = where((lengths == _length) & (dilations == _dilation))[0]
-        b = a3 + ix_shapelets.shape[0]
-        
-        idx_shp[a3:b] = ix_shapelets
-        n_shp_params[i+1] = ix_shapelets.shape[0]
-        
-        a3 = b
-    n_shp_params = cumsum(n_shp_params)
-    X_new = zeros((n_samples, n_features * n_shapelets))
-    for i_sample in prange(n_samples):
-        #n_shp_params is a cumsum starting at 0
-        for i_shp_param in prange(n_shp_params.shape[0]-1):
-            _length = params_shp[i_shp_param, 0]
-            _dilation = params_shp[i_shp_param, 1]
-            strides = generate_strides_2D(
-                X[i_sample, :, :X_len[i_sample]], _length, _dilation, use_phase
-            )
-            # Indexes of shapelets corresponding to the params of i_shp_param
-            _idx_shp = idx_shp[n_shp_params[i_shp_param]:n_shp_params[i_shp_param+1]]
-            
-            _idx_no_norm = _idx_shp[where(normalize[_idx_shp] == False)[0]]
-            for i_idx in range(_idx_no_norm.shape[0]):               
-                i_shp = _idx_no_norm[i_idx]
-                _channels = channel_ids[a2[i_shp]:a2[i_shp+1]]
-                _values = values[a1[i_shp]:a1[i_shp+1]].reshape(
-                    n_channels[i_shp], _length
-                )
-
-                X_new[i_sample, (n_features * i_shp):(n_features * i_shp + n_features)] = \
-                apply_one_shapelet_one_sample_multivariate(
-                    strides[_channels], _values, threshold[i_shp], dist_func
-                )
-                        
-            _idx_norm = _idx_shp[where(normalize[_idx_shp] == True)[0]]
-            if _idx_norm.shape[0] > 0:
-                #n_features
-                for i_stride in range(strides.shape[0]):
-                    #n_timestamps
-                    for j_stride in range(strides.shape[1]):
-                      _str = strides[i_stride,j_stride]
-                      strides[i_stride,j_stride] = (_str - mean(_str))/(std(_str)+1e-8)
-                          
-                for i_idx in range(_idx_norm.shape[0]):               
-                    i_shp = _idx_norm[i_idx]
-                    _channels = channel_ids[a2[i_shp]:a2[i_shp+1]]
-                    _values = values[a1[i_shp]:a1[i_shp+1]].reshape(
-                        n_channels[i_shp], _length
-                    )
-                    
-                    X_new[i_sample, (n_features * i_shp):(n_features * i_shp + n_features)] = \
-                    apply_one_shapelet_one_sample_multivariate(
-                        strides[_channels], _values, threshold[i_shp], dist_func
-                    )
-    return X_new
\ No newline at end of file
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Antoine Guillaume
+"""
+from numpy import (
+    arange, zeros, unique, where, sqrt, abs as _abs, add, searchsorted,
+    float64, int64
+)
+from numpy.lib.stride_tricks import sliding_window_view
+
+from convst.transformers._commons import DIST_MANHATTAN, DIST_EUCLIDEAN
+
+# Pure NumPy version of apply_all_shapelets, which does not compile any numba
+# function, for environments where the JIT compilation is forbidden or too
+# slow compared to the size of the input. The windows of the samples sharing
+# a length are read as a strided view for each length and dilation, and the
+# distances between these windows and a block of shapelets of the group are
+# computed at once. As in the numba kernels, the differences and the sums are
+# computed in double precision, and the features are those of the numba
+# kernels up to the rounding of the sums, which are not done in the same
+# order.
+
+# Maximum size in bytes of the arrays of windows and of differences between
+# windows and shapelets computed at once.
+NUMPY_BLOCK_BYTES = 16777216
+
+def _windows(X, length, dilation, use_phase):
+    """
+    Windows of a batch of same length time series as a view of shape
+    (n_samples, n_features, n_windows, length), with n_windows equal to
+    n_timestamps if phase invariance is used, in which case the series are
+    extended by their first values, n_timestamps - (length-1) * dilation
+    otherwise.
+    """
+    n_timestamps = X.shape[2]
+    span = (length - 1) * dilation + 1
+    if use_phase:
+        X = X[:, :, arange(n_timestamps + span - 1) % n_timestamps]
+    return sliding_window_view(X, span, axis=2)[:, :, :, ::dilation]
+
+def _normalized_windows(W):
+    """
+    Z-normalize the windows given by _windows, as done by the numba kernels
+    with the mean and standard deviation of each window.
+    """
+    mean = W.mean(axis=3, dtype=float64)
+    inv_std = 1 / (W.std(axis=3, dtype=float64) + 1e-8)
+    return (W - mean[..., None]) * inv_std[..., None]
+
+def _block_bounds(channels_ptr, a, b, max_rows):
+    """
+    Split the shapelets of positions [a, b) of the plan into blocks of at
+    most max_rows rows of values, or of one shapelet if it has more rows.
+    """
+    bounds = [a]
+    while bounds[-1] < b:
+        start = bounds[-1]
+        stop = searchsorted(
+            channels_ptr[start+1:b+1], channels_ptr[start] + max_rows,
+            side='right'
+        )
+        bounds.append(start + max(1, stop))
+    return bounds
+
+def _apply_block(out, W, plan, a, b, length, metric, min_init):
+    """
+    Compute the features of the shapelets of positions [a, b) of the plan
+    on the windows W of a batch of samples, and write them in out.
+    """
+    (_, _, _, order, values, values_ptr, channel_ids, channels_ptr, threshold,
+     _) = plan
+    V = values[values_ptr[a]:values_ptr[b]].reshape(-1, length)
+    # The rows of the values of a shapelet are consecutive, the distance to a
+    # multivariate shapelet being the sum of the distances of its channels.
+    diff = W[:, channel_ids[channels_ptr[a]:channels_ptr[b]]].astype(
+        float64, copy=False
+    )
+    diff -= V[:, None, :]
+    if metric == DIST_MANHATTAN:
+        x_dist = _abs(diff, out=diff).sum(axis=3)
+    else:
+        diff *= diff
+        x_dist = diff.sum(axis=3)
+        if metric == DIST_EUCLIDEAN:
+            x_dist = sqrt(x_dist)
+    del diff
+    if channels_ptr[b] - channels_ptr[a] != b - a:
+        x_dist = add.reduceat(
+            x_dist, channels_ptr[a:b] - channels_ptr[a], axis=1
+        )
+
+    n_samples = x_dist.shape[0]
+    _argmin = x_dist.argmin(axis=2)
+    _min = x_dist.min(axis=2)
+    # The numba kernels only update the minimum with distances lower than
+    # min_init.
+    no_min = _min >= min_init
+    if no_min.any():
+        _min[no_min] = min_init
+        _argmin[no_min] = 0
+    _n_match = (x_dist <= threshold[a:b, None]).sum(axis=2)
+
+    cols = 3 * order[a:b]
+    rows = arange(n_samples)[:, None]
+    out[rows, cols] = _min
+    out[rows, cols + 1] = _argmin
+    out[rows, cols + 2] = _n_match
+
+def _apply_batch(out, X, plan, metric, use_phase):
+    """
+    Compute the features of all the shapelets of the plan on a batch of same
+    length time series X of shape (n_samples, n_features, n_timestamps),
+    and write them in out.
+    """
+    groups, group_ptr, norm_ptr, _, _, _, _, channels_ptr = plan[:8]
+    n_samples, n_features, _ = X.shape
+    min_init = 1e+100 if n_features == 1 else 1e+10
+    for i_group in range(groups.shape[0]):
+        length, dilation = groups[i_group]
+        a = group_ptr[i_group]
+        b = group_ptr[i_group+1]
+        c = norm_ptr[i_group]
+        W_all = _windows(X, length, dilation, use_phase)
+        win_bytes = 8 * W_all.shape[2] * length
+        chunk = max(1, NUMPY_BLOCK_BYTES // (win_bytes * n_features))
+        max_rows = max(
+            1, NUMPY_BLOCK_BYTES // (win_bytes * min(chunk, n_samples))
+        )
+        for s in range(0, n_samples, chunk):
+            W = W_all[s:s+chunk]
+            for start, end, norm in [(a, c, False), (c, b, True)]:
+                if start >= end:
+                    continue
+                _W = _normalized_windows(W) if norm else W
+                bounds = _block_bounds(channels_ptr, start, end, max_rows)
+                for i in range(len(bounds) - 1):
+                    _apply_block(
+                        out[s:s+chunk], _W, plan, bounds[i], bounds[i+1],
+                        length, metric, min_init
+                    )
+
+def apply_all_shapelets_numpy(
+    X, plan, metric, use_phase, X_len, X_offsets, X_new
+):
+    """
+    Apply a set of generated shapelet using the execution plan previously
+    built to a set of time series, of any of the four types of input, with
+    NumPy operations only. The samples of same length are processed together.
+
+    Parameters
+    ----------
+    X : array, shape=(n_values)
+        Input time series, the values of the i-th sample being
+        X[X_offsets[i]:X_offsets[i+1]] in the shape (n_features, X_len[i]).
+    plan : tuple of array
+        The execution plan of the shapelets, built by shapelet_plan at fit
+        time.
+    metric : int
+        The distance, among DIST_MANHATTAN, DIST_EUCLIDEAN and DIST_SQUARED.
+    use_phase: bool
+        Wheter to use phase invariance
+    X_len : array, shape=(n_samples)
+        The length of each input time series
+    X_offsets : array, shape=(n_samples+1)
+        The position of each input time series in X
+    X_new : array, shape=(n_samples, 3*n_shapelets)
+        Array of the type of X in which the features are written, for 
+        example a view of a shared memory block.
+
+    Returns
+    -------
+    X_new : array, shape=(n_samples, 3*n_shapelets)
+        The transformed input time series with each shapelet extracting 3
+        feature from the distance vector computed on each time series, 
+        written in the X_new argument.
+
+    """
+    n_shapelets = plan[3].shape[0]
+    n_samples = X_len.shape[0]
+    n_features = (X_offsets[1] - X_offsets[0]) // X_len[0]
+    lengths = unique(X_len)
+    if lengths.shape[0] == 1:
+        # Same length samples are a view of X
+        _apply_batch(
+            X_new, X.reshape(n_samples, n_features, lengths[0]), plan, metric,
+            use_phase
+        )
+        return X_new
+    for n_timestamps in lengths:
+        samples = where(X_len == n_timestamps)[0]
+        idx = X_offsets[samples, None] + arange(
+            n_features * n_timestamps, dtype=int64
+        )
+        X_new_batch = zeros((samples.shape[0], 3 * n_shapelets), dtype=X.dtype)
+        _apply_batch(
+            X_new_batch, X[idx].reshape(-1, n_features, n_timestamps), plan,
+            metric, use_phase
+        )
+        X_new[samples] = X_new_batch
+    return X_new
@@ -2,26 +2,24 @@
 """
 @author: Antoine Guillaume
 """
-from numpy.random import choice, uniform, random, seed
 from numpy import (
-    unique, where, percentile, all as _all, int64, bool_, any as _any,
-    log2, floor_divide, zeros, floor, power, ones, cumsum, mean, std
-
+    unique, where, percentile, all as _all, int64, bool_,
+    log2, floor_divide, zeros, floor, power, ones, uint64
 )
 
 from convst.transformers._commons import (
-    get_subsequence, compute_shapelet_dist_vector,
-    apply_one_shapelet_one_sample_univariate, _combinations_1d,
-    generate_strides_1D, prime_up_to
+    get_subsequence, compute_shapelet_dist_vector, prime_up_to, bitset_select,
+    sampling_index_init, sampling_index_clear, fenwick_prefix, fenwick_search,
+    same_class_index, choose_same_class, rng_stream, rng_randint, rng_random,
+    rng_uniform, ragged_sample, ragged_bitsets, ragged_bitset,
+    generation_schedule
 )
 
-from numba import njit, prange
-
-# TODO : check if numba could support Tuple of variable length numpy arrays as input
+from numba import njit, prange, literally
 
 @njit(cache=True)
 def U_VL_init_random_shapelet_params(
-    n_shapelets, shapelet_sizes, n_timestamps, p_norm, prime_scheme
+    n_shapelets, shapelet_sizes, n_timestamps, p_norm, prime_scheme, r_seed
 ):
     """
     Initialize the parameters of the shapelets.    
@@ -38,6 +36,8 @@ def U_VL_init_random_shapelet_params(
         A value in the range [0,1] indicating the chance for each
         shapelet to use z-normalized distance
 
+    r_seed : int
+        Random seed of the random streams of the shapelets
     Returns
     -------
     values : array, shape=(n_shapelet, max(shapelet_sizes))
@@ -52,8 +52,18 @@ def U_VL_init_random_shapelet_params(
         The randomly initialized normalization indicator of each shapelet
 
     """
-    # Lengths of the shapelets
-    lengths = choice(shapelet_sizes, size=n_shapelets).astype(int64)
+    # Each shapelet draws its parameters from its own random stream
+    states = zeros((n_shapelets, 2), dtype=uint64)
+    lengths = zeros(n_shapelets, dtype=int64)
+    normalize = zeros(n_shapelets, dtype=bool_)
+    for i in prange(n_shapelets):
+        states[i] = rng_stream(r_seed, 2*i)
+        # Lengths of the shapelets
+        lengths[i] = shapelet_sizes[
+            rng_randint(states[i], 0, shapelet_sizes.shape[0])
+        ]
+        # Is shapelet using z-normalization ?
+        normalize[i] = rng_random(states[i]) < p_norm
 
     # Dilations
     upper_bounds = log2(floor_divide(n_timestamps - 1, lengths - 1))
@@ -61,11 +71,14 @@ def U_VL_init_random_shapelet_params(
         primes = prime_up_to(int64(2**upper_bounds.max()))
         dilations = zeros(n_shapelets, dtype=int64)
         for i in prange(n_shapelets):
-            dilations[i] = choice(primes[primes<=int64(2**upper_bounds[i])])
+            _primes = primes[primes<=int64(2**upper_bounds[i])]
+            dilations[i] = _primes[
+                rng_randint(states[i], 0, _primes.shape[0])
+            ]
     else:
         powers = zeros(n_shapelets)
         for i in prange(n_shapelets):
-            powers[i] = uniform(0, upper_bounds[i])
+            powers[i] = rng_uniform(states[i], 0, upper_bounds[i])
         dilations = floor(power(2, powers)).astype(int64)
 
     # Init threshold array
@@ -74,17 +87,13 @@ def U_VL_init_random_shapelet_params(
     # Init values array
     values = zeros((n_shapelets, max(shapelet_sizes)))
 
-    # Is shapelet using z-normalization ?
-    normalize = random(size=n_shapelets)
-    normalize = (normalize < p_norm)
-
     return values, lengths, dilations, threshold, normalize
 
 
 @njit(cache=True, parallel=True)
 def U_VL_generate_shapelet(
     X, y, n_shapelets, shapelet_sizes, r_seed, p_norm, p_min, p_max, alpha,
-    dist_func, use_phase, min_len, X_len, prime_scheme
+    metric, sdp_mode, use_phase, min_len, X_len, X_offsets, prime_scheme
 ):
     """
     Given a time series dataset and parameters of the method, generate the
@@ -92,17 +101,17 @@ def U_VL_generate_shapelet(
 
     Parameters
     ----------
-    X : array, shape=(n_samples, n_features, n_timestamps)
-        Time series dataset, n_timestamps is equal to the maximum observed 
-        length.
+    X : array, shape=(n_values)
+        Time series dataset, the values of the i-th sample being
+        X[X_offsets[i]:X_offsets[i+1]].
     y : array, shape=(n_samples)
         Class of each input time series
     n_shapelets : int
         Number of shapelet to generate
     shapelet_sizes : array, shape=()
         An array of possible shapelet length.
-    seed : int
-        Random seed generator for numpy
+    r_seed : int
+        Random seed of the random streams of the shapelets
     p_norm : float
         Probability of each shapelet to use z-normalized distance
     p_min : float
@@ -111,15 +120,19 @@ def U_VL_generate_shapelet(
         Upper bound for the percentile during the choice of threshold
     alpha : float
         Alpha similarity parameter
-    dist_func: function
-        A distance function implemented with Numba taking two 1D vectors as
-        input.
+    metric : int
+        The distance, among DIST_MANHATTAN, DIST_EUCLIDEAN and DIST_SQUARED.
+    sdp_mode : int
+        Indicate if the sliding dot product engine can be used to compute
+        distance vectors, and for which distance.
     use_phase: bool
         Wheter to use phase invariance
     min_len : int
         Minimum length for input time series
     X_len : array, shape=(n_samples)
         The length of each input time series
+    X_offsets : array, shape=(n_samples+1)
+        The position of each input time series in X
     
     Returns
     -------
@@ -137,102 +150,102 @@ def U_VL_generate_shapelet(
         normalize : array, shape=(n_shapelets)
             Normalization indicatorr of the shapelets
     """
+    literally(metric)
     
-    n_samples = len(X)
-    max_len = max(X_len)
-    # Fix the random seed
-    seed(r_seed)
+    n_samples = X_len.shape[0]
     
     #Initialize shapelets
     values, lengths, dilations, threshold, normalize = \
     U_VL_init_random_shapelet_params(
-        n_shapelets, shapelet_sizes, min_len, p_norm, prime_scheme
+        n_shapelets, shapelet_sizes, min_len, p_norm, prime_scheme, r_seed
     )
     
-    #Initialize self similarity mask
-    unique_dil = unique(dilations)
-    mask_sampling = ones(
-        (2,unique_dil.shape[0],n_samples,max_len), dtype=bool_
+    order, start, size, rank = same_class_index(y)
+    states, items_ptr, items_shapelets, items_samples = generation_schedule(
+        dilations, normalize, n_samples, r_seed
     )
     
-    for i in range(n_samples):
-        mask_sampling[:,:,i,X_len[i]:] = False
-    
-    #For each dilation, we can do in parallel
-    for i_d in prange(unique_dil.shape[0]):
-        #For each shapelet id with this dilation
-        id_shps = where(dilations==unique_dil[i_d])[0]
-        min_l = min(lengths[id_shps])
+    #For each work item (a block of samples of a dilation and normalization
+    #group), we can do in parallel
+    for i_item in prange(items_samples.shape[0]):
+        #For each shapelet id of this work item
+        id_shps = items_shapelets[items_ptr[i_item]:items_ptr[i_item+1]]
+        _dilation = dilations[id_shps[0]]
+        norm = int64(normalize[id_shps[0]])
+        min_l = min(lengths[dilations==_dilation])
+        x_start = items_samples[i_item, 0]
+        n_block = items_samples[i_item, 1] - x_start
+        #Initialize self similarity mask of the block, as one bitset per
+        #sample of the size of the sample
+        mask_bits, mask_offsets = ragged_bitsets(
+            X_len[x_start:x_start+n_block], 1
+        )
+        #Index the number of possible sampling points of each sample for each
+        #length of this work item, as it bounds the sampling to d_shape
+        u_lengths = unique(lengths[id_shps])
+        d_shapes = zeros((u_lengths.shape[0], n_block), dtype=int64)
+        for i_l in range(u_lengths.shape[0]):
+            for i_x in range(n_block):
+                if use_phase:
+                    d_shapes[i_l, i_x] = X_len[x_start+i_x]
+                else:
+                    d_shapes[i_l, i_x] = (
+                        X_len[x_start+i_x]-(u_lengths[i_l]-1)*_dilation
+                    )
+        counts, trees = sampling_index_init(d_shapes, True)
+        
         for i_shp in id_shps:
-            _dilation = dilations[i_shp]
             _length = lengths[i_shp]
-            norm = int64(normalize[i_shp])
-            
-            mask_dil = mask_sampling[norm,i_d]
+            state = states[i_shp]
+            i_l = where(u_lengths == _length)[0][0]
             
-            i_mask = zeros(n_samples, dtype=bool_)
             # TODO : the choice of sample don't have the same probability
             # compared to same length version, evaluate the impact.
+            n_valid = fenwick_prefix(trees[i_l], n_block)
             
-            if use_phase:
-                for i_x in range(n_samples):
-                    i_mask[i_x] = _any(mask_dil[i_x, :X_len[i_x]])
-            else:
-                for i_x in range(n_samples):
-                    i_mask[i_x] = _any(
-                        mask_dil[i_x, :X_len[i_x]-(_length-1)*_dilation]
-                    )
-            
-            i_mask = where(i_mask)
-            
-            if i_mask[0].shape[0] > 0:
-                #Choose a sample
-                id_sample = choice(i_mask[0])
+            if n_valid > 0:
+                #Choose a sample, with the same draw as choice() over the 
+                #list of samples with possible sampling points
+                i_x = fenwick_search(trees[i_l], rng_randint(state, 0, n_valid))
+                id_sample = x_start + i_x
+                mask_x = ragged_bitset(mask_bits, mask_offsets, 1, i_x)[0]
                 #Choose a timestamp
-                if use_phase:
-                    t_mask = where(mask_dil[id_sample, :X_len[id_sample]])
-                else:
-                    t_mask = where(
-                        mask_dil[id_sample, :X_len[id_sample]-(_length-1)*_dilation]
-                    )
-                
-                index = choice(t_mask[0])    
+                index = bitset_select(
+                    mask_x, rng_randint(state, 0, counts[i_l, i_x])
+                )
                 #Update the mask
                 alpha_size = _length - int64(max(1,(1-alpha)*min_l))
                 for j in range(alpha_size):
                     #We can use modulo even without phase invariance, as we
                     #limit the sampling to d_shape
-                    mask_sampling[
-                        norm, i_d, id_sample,
-                        (index-(j*_dilation))%X_len[id_sample]
-                    ] = False
-                    mask_sampling[
-                        norm, i_d, id_sample, 
-                        (index+(j*_dilation))%X_len[id_sample]
-                    ] = False
+                    sampling_index_clear(
+                        mask_x, (index-(j*_dilation))%X_len[id_sample],
+                        i_x, d_shapes, counts, trees, True
+                    )
+                    sampling_index_clear(
+                        mask_x, (index+(j*_dilation))%X_len[id_sample],
+                        i_x, d_shapes, counts, trees, True
+                    )
                 #Extract the values
                 v = get_subsequence(
-                    X[id_sample, 0, :X_len[id_sample]], index,
+                    ragged_sample(X, X_offsets, X_len, id_sample)[0], index,
                     _length, _dilation, norm, use_phase
                 )
         
                 #Select another sample of the same class as the sample used
-                loc_others = where(y == y[id_sample])[0]
-                if loc_others.shape[0] > 1:
-                    loc_others = loc_others[loc_others != id_sample]
-                    id_test = choice(loc_others)
-                else:
-                    id_test = id_sample
+                id_test = choose_same_class(
+                    state, id_sample, order, start, size, rank
+                )
                 #Compute distance vector
                 x_dist = compute_shapelet_dist_vector(
-                    X[id_test, 0, :X_len[id_test]], v, _length,
-                    _dilation, dist_func, norm, use_phase
+                    ragged_sample(X, X_offsets, X_len, id_test)[0], v, _length,
+                    _dilation, metric, norm, use_phase, sdp_mode
                 )
                 
                 #Extract value between two percentile as threshold for SO
                 ps = percentile(x_dist, [p_min,p_max])
-                threshold[i_shp] = uniform(
-                    ps[0], ps[1]
+                threshold[i_shp] = rng_uniform(
+                    state, ps[0], ps[1]
                 )
                 values[i_shp, :_length] = v
                 
@@ -248,110 +261,3 @@ def U_VL_generate_shapelet(
         threshold[mask_values],
         normalize[mask_values]
     )
-
-
-@njit(cache=True, parallel=True, fastmath=True)
-def U_VL_apply_all_shapelets(
-    X, shapelets, dist_func, use_phase, X_len
-):
-    """
-    Apply a set of generated shapelet using the parameter arrays previously 
-    generated to a set of time series.
-
-    Parameters
-    ----------
-    X : array, shape=(n_samples, n_features, n_timestamps)
-        Input time series, n_timestamps is equal to the maximum observed 
-        length.
-    shapelets: set of array, shape=(5)
-        values : array, shape=(n_shapelets, max(shapelet_sizes))
-            Values of the shapelets. If the shapelet use z-normalized distance,
-            those values are already z-normalized by the shapelet 
-            initialization step.
-        lengths : array, shape=(n_shapelets)
-            Length parameter of the shapelets
-        dilations : array, shape=(n_shapelets)
-            Dilation parameter of the shapelets
-        threshold : array, shape=(n_shapelets)
-            Threshold parameter of the shapelets
-        normalize : array, shape=(n_shapelets)
-            Normalization indicatorr of the shapelets
-    dist_func: function
-        A distance function implemented with Numba taking two 1D vectors as
-        input.
-    use_phase: bool
-        Wheter to use phase invariance
-    X_len : array, shape=(n_samples)
-        The length of each input time series
-        
-    Returns
-    -------
-    X_new : array, shape=(n_samples, 3*n_shapelets)
-        The transformed input time series with each shapelet extracting 3
-        feature from the distance vector computed on each time series.
-
-    """
-    (values, lengths, dilations, threshold, normalize) = shapelets
-    n_shapelets = len(lengths)
-    n_samples = len(X)
-    n_features = 3
-    
-    #(u_l * u_d , 2)
-    params_shp = _combinations_1d(lengths, dilations)
-    #(u_l * u_d) + 1
-    n_shp_params = zeros(params_shp.shape[0]+1, dtype=int64)
-    #(n_shapelets)
-    idx_shp = zeros(n_shapelets, dtype=int64)
-    a = 0
-    
-    for i in range(params_shp.shape[0]):
-        _length = params_shp[i, 0]
-        _dilation = params_shp[i, 1]
-        
-        ix_shapelets = where((lengths == _length) & (dilations == _dilation))[0]
-        b = a + ix_shapelets.shape[0]
-        
-        idx_shp[a:b] = ix_shapelets
-        n_shp_params[i+1] = ix_shapelets.shape[0]
-        
-        a = b
-    n_shp_params = cumsum(n_shp_params)
-    
-    X_new = zeros((n_samples, n_features * n_shapelets))
-    for i_sample in prange(n_samples):
-        #n_shp_params is a cumsum starting at 0
-        for i_shp_param in prange(n_shp_params.shape[0]-1):
-            _length = params_shp[i_shp_param, 0]
-            _dilation = params_shp[i_shp_param, 1]
-            strides = generate_strides_1D(
-                X[i_sample, 0, :X_len[i_sample]], _length, _dilation, use_phase
-            )
-            # Indexes of shapelets corresponding to the params of i_shp_param
-            _idx_shp = idx_shp[n_shp_params[i_shp_param]:n_shp_params[i_shp_param+1]]
-            
-            _idx_no_norm = _idx_shp[where(normalize[_idx_shp] == False)[0]]
-            for i_idx in range(_idx_no_norm.shape[0]):               
-                i_shp = _idx_no_norm[i_idx]
-                _values = values[i_shp, :_length]
-                
-                X_new[i_sample, (n_features * i_shp):(n_features * i_shp + n_features)] = \
-                apply_one_shapelet_one_sample_univariate(
-                    strides, _values, threshold[i_shp], dist_func
-                )
-            
-            _idx_norm = _idx_shp[where(normalize[_idx_shp] == True)[0]]
-            if _idx_norm.shape[0] > 0:
-                for i_stride in range(strides.shape[0]):
-                    _str = strides[i_stride]
-                    strides[i_stride] = (_str - mean(_str))/(std(_str)+1e-8)
-                        
-                for i_idx in range(_idx_norm.shape[0]):               
-                    i_shp = _idx_norm[i_idx]
-                    _values = values[i_shp, :_length]
-                    
-                    X_new[i_sample, (n_features * i_shp):(n_features * i_shp + n_features)] = \
-                    apply_one_shapelet_one_sample_univariate(
-                        strides, _values, threshold[i_shp], dist_func
-                    )
-                
-    return X_new
\ No newline at end of file
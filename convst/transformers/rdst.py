@@ -5,18 +5,30 @@ Created on Fri Sep  2 09:20:49 2022
 
 @author: Antoine Guillaume
 """
+import os
+import copy
 import numpy as np
 import warnings
 
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from itertools import repeat
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
 from sklearn.utils import resample
 from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.utils.validation import check_is_fitted, check_random_state
 
 from convst.utils.checks_utils import (
     check_array_3D, check_array_1D, check_is_numeric, 
-    check_is_boolean, check_n_jobs
+    check_is_boolean, check_n_jobs, check_is_path_or_array
+)
+from convst.utils.ragged_utils import RaggedArray
+from convst.utils.persistence_utils import save_model, load_model
+from convst.transformers._commons import (
+    shapelet_plan, APPLY_ALL_SHAPELETS, SDP_DISABLED, SDP_SQUARED,
+    SDP_EUCLIDEAN, DIST_MANHATTAN, DIST_EUCLIDEAN, DIST_SQUARED
 )
-from convst.transformers._commons import manhattan, euclidean, squared_euclidean
 
 from numba import set_num_threads
 
@@ -25,6 +37,136 @@ STR_UNIVARIATE = 'univariate'
 STR_UNIVARIATE_VARIABLE = 'univariate_variable'
 STR_MULTIVARIATE_VARIABLE = 'multivariate_variable'
 
+# Maximum size in bytes of the chunks of output computed at once when
+# transform writes to an out array.
+OUT_CHUNK_BYTES = 67108864
+
+# Attributes set by the fit method, copied when merging fitted shards.
+FITTED_ATTRIBUTES = [
+    'min_len', 'max_channels', 'shapelet_lengths', 'transform_type', 'fitter',
+    'transformer', 'shapelets_', 'plan_'
+]
+
+# Parameters allowed to differ between the shards of a transformer.
+SHARD_PARAMETERS = ['n_shapelets', 'random_state', 'n_jobs']
+
+# Names of the arrays of the plan_ tuple, used as file names by save.
+PLAN_ARRAYS = [
+    'groups', 'group_ptr', 'norm_ptr', 'order', 'values', 'values_ptr',
+    'channel_ids', 'channels_ptr', 'threshold', 'ea_orders'
+]
+
+def _fit_shard(shard, X, y):
+    """Fit a shard in a worker process of R_DST.fit_sharded."""
+    if not isinstance(shard.n_jobs, bool):
+        set_num_threads(shard.n_jobs)
+    return shard.fit(X, y)
+
+def _to_shared_memory(array, blocks):
+    """
+    Copy an array to a new shared memory block, appended to blocks, and 
+    return the (name, shape, dtype) specification used to open it again.
+    """
+    shm = SharedMemory(create=True, size=max(1, array.nbytes))
+    blocks.append(shm)
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return (shm.name, array.shape, array.dtype.str)
+
+def _from_shared_memory(spec, blocks):
+    """
+    Open the array of a shared memory block created by _to_shared_memory. The
+    array must be deleted before the block, appended to blocks, is closed.
+    """
+    shm = SharedMemory(name=spec[0])
+    blocks.append(shm)
+    return np.ndarray(spec[1], dtype=spec[2], buffer=shm.buf)
+
+def _transform_shared_rows(transformer, specs, start, end):
+    """
+    Transform the samples [start, end[ of the input time series of 
+    R_DST.transform_processes in a worker process, and write them to the 
+    shared output array.
+    """
+    if not isinstance(transformer.n_jobs, bool):
+        set_num_threads(transformer.n_jobs)
+    blocks = []
+    try:
+        _transform_shared_views(transformer, specs, start, end, blocks)
+    finally:
+        for shm in blocks:
+            shm.close()
+
+def _transform_shared_views(transformer, specs, start, end, blocks):
+    X_specs, plan_specs, out_spec = specs
+    X = [_from_shared_memory(spec, blocks) for spec in X_specs]
+    X = X[0] if len(X) == 1 else RaggedArray(*X)
+    out = _from_shared_memory(out_spec, blocks)
+    transformer.plan_ = tuple(
+        _from_shared_memory(spec, blocks) for spec in plan_specs
+    )
+    try:
+        transformer._transform_formatted(X[start:end], out=out[start:end])
+    finally:
+        transformer.plan_ = None
+
+def _merge_shapelets(shapelets):
+    """
+    Concatenate the shapelets_ tuples of several transformers. The values of
+    univariate shapelets are padded with zeros to the largest length.
+    """
+    if len(shapelets[0]) == 5:
+        width = max(shp[0].shape[1] for shp in shapelets)
+        values = np.concatenate([
+            np.pad(shp[0], ((0, 0), (0, width - shp[0].shape[1])))
+            for shp in shapelets
+        ])
+        return (values,) + tuple(
+            np.concatenate([shp[i] for shp in shapelets]) for i in range(1, 5)
+        )
+    return tuple(
+        np.concatenate([shp[i] for shp in shapelets]) 
+        for i in range(len(shapelets[0]))
+    )
+
+def _gather_segments(array, ptr, segments):
+    """Concatenate the segments array[ptr[i]:ptr[i+1]] for i in segments."""
+    sizes = ptr[segments + 1] - ptr[segments]
+    shift = np.repeat(ptr[segments] - np.cumsum(sizes) + sizes, sizes)
+    return array[shift + np.arange(sizes.sum())]
+
+def _shapelets_from_plan(plan, is_multivariate):
+    """
+    Rebuild the shapelets_ tuple, in the order of the fitter, from a plan
+    built by shapelet_plan. The values of univariate shapelets are padded 
+    with zeros to the largest length.
+    """
+    (groups, group_ptr, norm_ptr, order, values, values_ptr, channel_ids,
+     channels_ptr, threshold, _) = plan
+    n_shapelets = order.shape[0]
+    i_group = np.repeat(np.arange(groups.shape[0]), np.diff(group_ptr))
+    # Position in the plan of each shapelet
+    position = np.empty(n_shapelets, dtype=np.int64)
+    position[order] = np.arange(n_shapelets)
+    lengths = groups[i_group, 0][position]
+    dilations = groups[i_group, 1][position]
+    normalize = (np.arange(n_shapelets) >= norm_ptr[i_group])[position]
+    threshold = np.asarray(threshold)[position]
+    if not is_multivariate:
+        mask = np.arange(lengths.max()) < lengths[:, np.newaxis]
+        padded = np.zeros(mask.shape, dtype=values.dtype)
+        padded[mask] = _gather_segments(values, values_ptr, position)
+        return (padded, lengths, dilations, threshold, normalize)
+    return (
+        _gather_segments(values, values_ptr, position), lengths, dilations,
+        threshold, normalize, np.diff(channels_ptr)[position],
+        _gather_segments(channel_ids, channels_ptr, position)
+    )
+
+def _same_parameter(a, b):
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        return np.array_equal(a, b)
+    return a == b
+
 class R_DST(BaseEstimator, TransformerMixin):
     """
     Base class for RDST transformer. Depending on the parameters and of the
@@ -49,7 +191,38 @@ class R_DST(BaseEstimator, TransformerMixin):
         computation. The default is False.
     distance : str, optional
         The distance function to use whe computing distances between shapelets
-        and time series. The default is 'euclidean'.
+        and time series. With 'euclidean' and 'squared', distance vectors of 
+        long shapelets are computed with FFT based sliding dot products when 
+        it is estimated to be faster. The default is 'manhattan'.
+    early_abandon : bool, optional
+        Wheter to use early abandoning when computing the distances between
+        shapelets and time series during the transform. The points of the 
+        shapelets are visited by decreasing absolute z-value, and a window
+        is abandoned as soon as it can neither be the minimum nor an 
+        occurrence. The features are identical up to floating point rounding.
+        The default is False.
+    engine : str, optional
+        The engine used to compute the distances during the transform. With
+        'numba', the distance vector of each shapelet is computed separately.
+        With 'gemm', the distances between all the windows of a series and all
+        the shapelets sharing a length and a dilation are obtained from a 
+        blocked matrix product (BLAS). The 'gemm' engine is only available for 
+        the 'euclidean' and 'squared' distances on same length time series.
+        With 'numpy', the distances are computed with vectorized NumPy 
+        operations on strided views of the windows, batched over the samples
+        of same length and the shapelets sharing a length and a dilation, so
+        that no numba function is compiled during the transform. It avoids
+        the compilation time for small batches or where JIT compilation is
+        not allowed, the shapelets being still generated by numba during the
+        fit. The 'numpy' engine ignores early_abandon. The default is 
+        'numba'.
+    dtype : str, optional
+        The floating point type, either 'float64' or 'float32', used to store
+        the input time series, the shapelets and the transformed output. With
+        'float32', the memory used by the arrays (and the traffic to read 
+        them) is halved, while the distances between the windows and the
+        shapelets of the 'numba' and 'numpy' engines are still computed and
+        accumulated in double precision. The default is 'float64'.
     alpha : float, optional
         The alpha similarity parameter, the higher the value, the lower the 
         allowed number of common indexes with previously sampled shapelets 
@@ -98,6 +271,9 @@ class R_DST(BaseEstimator, TransformerMixin):
         transform_type='auto',
         phase_invariance=False,
         distance='manhattan',
+        early_abandon=False,
+        engine='numba',
+        dtype='float64',
         alpha=0.5,
         normalize_output=False,
         n_samples=None,
@@ -116,6 +292,9 @@ class R_DST(BaseEstimator, TransformerMixin):
         self.transform_type = self._validate_transform_type(transform_type)
         self.phase_invariance = check_is_boolean(phase_invariance)
         self.distance = self._validate_distances(distance)
+        self.early_abandon = check_is_boolean(early_abandon)
+        self.engine = self._validate_engine(engine)
+        self.dtype = self._validate_dtype(dtype)
         self.alpha = check_is_numeric(alpha)
         self.normalize_output = check_is_boolean(normalize_output)
         self.n_samples = check_is_numeric(n_samples) if n_samples is not None else n_samples
@@ -134,6 +313,9 @@ class R_DST(BaseEstimator, TransformerMixin):
         self.proba_norm = check_is_numeric(proba_norm)
         self.percentiles = self._validate_percentiles(percentiles)
         self.random_state = check_random_state(random_state)
+        # State of random_state at construction, from which the seeds of the
+        # shards are derived, as fit draws from random_state
+        self._shards_random_state = copy.deepcopy(self.random_state)
         if isinstance(n_jobs, bool):
             self.n_jobs=n_jobs
         else:
@@ -176,34 +358,45 @@ class R_DST(BaseEstimator, TransformerMixin):
         Parameters
         ----------
         X : array, shape=(n_samples, n_features, n_timestamps)
-            Input time series.
+            Input time series. It can also be a path to a .npy file, which is
+            opened as a memory map. Memory mapped inputs of same length are 
+            not copied if they are C-contiguous and of type dtype. Variable
+            length time series can be given as a list of 2D arrays or as a 
+            RaggedArray.
             
         y : array, shape=(n_samples)
             Class of the input time series.
 
         """
+        X = check_is_path_or_array(X)
         self._set_fit_transform(X)
         if self.transform_type in [STR_MULTIVARIATE_VARIABLE, STR_UNIVARIATE_VARIABLE]:
-            X, X_len = self._format_uneven_timestamps(X)
-            X = check_array_3D(X, is_univariate=False).astype(np.float64)
+            X = self._format_uneven_timestamps(X)
             if self.min_len is None:
-                self.min_len = X_len.min()
+                self.min_len = X.lengths.min()
         else:
-            X = check_array_3D(X, is_univariate=False).astype(np.float64)
+            X = np.ascontiguousarray(
+                check_array_3D(X, is_univariate=False), dtype=self.dtype
+            )
             self.min_len = X.shape[2]
         
         if self.n_samples is None:
             pass
         elif self.n_samples < 1.0:
-            id_X = resample(np.arange(X.shape[0]), replace=False, n_samples=int(X.shape[0]*self.n_samples), stratify=y)
+            id_X = resample(np.arange(len(X)), replace=False, n_samples=int(len(X)*self.n_samples), stratify=y)
             X = X[id_X]
             y = y[id_X]
         elif self.n_samples > 1.0:
-            id_X = resample(np.arange(X.shape[0]), replace=True, n_samples=int(X.shape[0]*self.n_samples), stratify=y)
+            id_X = resample(np.arange(len(X)), replace=True, n_samples=int(len(X)*self.n_samples), stratify=y)
             X = X[id_X]
             y = y[id_X]
+        # Encode the classes as integers for the shapelet generators
+        y = np.unique(y, return_inverse=True)[1]
         
-        n_samples, n_features, _ = X.shape
+        if isinstance(X, RaggedArray):
+            n_features = X.n_features
+        else:
+            n_features = X.shape[1]
         
         if self.max_channels is None:
             self.max_channels = n_features
@@ -215,38 +408,261 @@ class R_DST(BaseEstimator, TransformerMixin):
         # Generate the shapelets
         if self.transform_type == STR_UNIVARIATE_VARIABLE:
             self.shapelets_ = self.fitter(
-                X, y, self.n_shapelets, shapelet_lengths, seed, self.proba_norm,
-                self.percentiles[0], self.percentiles[1], self.alpha,
-                self._get_distance_function(), self.phase_invariance,
-                self.min_len, X_len, self.prime_dilations
+                X.values, y, self.n_shapelets, shapelet_lengths, seed,
+                self.proba_norm, self.percentiles[0], self.percentiles[1],
+                self.alpha, self._get_metric(),
+                self._get_sdp_mode(), self.phase_invariance,
+                self.min_len, X.lengths, X.offsets, self.prime_dilations
             )
         elif self.transform_type == STR_MULTIVARIATE_VARIABLE:
             self.shapelets_ = self.fitter(
-                X, y, self.n_shapelets, shapelet_lengths, seed, self.proba_norm,
-                self.percentiles[0], self.percentiles[1], self.alpha,
-                self._get_distance_function(), self.phase_invariance,
-                self.max_channels, self.min_len, X_len, self.prime_dilations
+                X.values, y, self.n_shapelets, shapelet_lengths, seed,
+                self.proba_norm, self.percentiles[0], self.percentiles[1],
+                self.alpha, self._get_metric(),
+                self._get_sdp_mode(), self.phase_invariance, 
+                self.max_channels, self.min_len, X.lengths, X.offsets,
+                self.prime_dilations
             )
         elif self.transform_type == STR_MUTLIVARIATE:
             self.shapelets_ = self.fitter(
                 X, y, self.n_shapelets, shapelet_lengths, seed, self.proba_norm,
                 self.percentiles[0], self.percentiles[1], self.alpha, 
-                self._get_distance_function(), self.phase_invariance, 
+                self._get_metric(), self._get_sdp_mode(),
+                self.phase_invariance, 
                 self.max_channels, self.prime_dilations
             )
         elif self.transform_type == STR_UNIVARIATE:
             self.shapelets_ = self.fitter(
                 X, y, self.n_shapelets, shapelet_lengths, seed, self.proba_norm,
                 self.percentiles[0], self.percentiles[1], self.alpha, 
-                self._get_distance_function(), self.phase_invariance, self.prime_dilations
+                self._get_metric(), self._get_sdp_mode(),
+                self.phase_invariance, self.prime_dilations
             )
         else:
             raise ValueError('Unknown value for transform type parameter')
+        self.shapelets_ = self._cast_shapelets(self.shapelets_)
+        self._set_plan()
+        
+        return self
+
+
+    def shards(self, n_shards):
+        """
+        Split the shapelet generation into n_shards independent shards. Each
+        shard is an unfitted copy of this transformer generating its part of 
+        the n_shapelets shapelets, with a seed derived from random_state, as
+        given when this transformer was created, and from the index of the 
+        shard. Calling fit or shards does not change the seeds of the shards.
         
+        The shards can be fitted in different processes, or on different
+        machines from a shared dataset file, and combined with merge.
+
+        Parameters
+        ----------
+        n_shards : int
+            Number of shards.
+
+        Returns
+        -------
+        shards : list of R_DST
+            The unfitted shards.
+
+        """
+        n_shards = int(check_is_numeric(n_shards))
+        if n_shards < 1 or n_shards > self.n_shapelets:
+            raise ValueError('n_shards should be between 1 and n_shapelets, got {}'.format(n_shards))
+        seed = copy.deepcopy(self._shards_random_state).randint(
+            np.iinfo(np.uint32).max
+        )
+        params = self.get_params()
+        shards = []
+        for i_shard in range(n_shards):
+            params['n_shapelets'] = (
+                self.n_shapelets // n_shards 
+                + int(i_shard < self.n_shapelets % n_shards)
+            )
+            params['random_state'] = int(
+                np.random.SeedSequence([seed, i_shard]).generate_state(1)[0]
+            )
+            shards.append(self.__class__(**params))
+        return shards
+    
+    @classmethod
+    def merge(cls, transformers):
+        """
+        Combine fitted transformers, such as the shards returned by the 
+        shards method, into one fitted transformer using all their shapelets.
+        The transformers must have the same parameters, except n_shapelets,
+        random_state and n_jobs, and must be fitted on the same type of data.
+
+        Parameters
+        ----------
+        transformers : list of R_DST
+            The fitted transformers.
+
+        Returns
+        -------
+        merged : R_DST
+            The fitted transformer using the shapelets of all transformers.
+
+        """
+        transformers = list(transformers)
+        if len(transformers) == 0:
+            raise ValueError('At least one transformer is needed to merge')
+        for transformer in transformers:
+            check_is_fitted(transformer, ['shapelets_'])
+        params = transformers[0].get_params()
+        for transformer in transformers[1:]:
+            other = transformer.get_params()
+            for key in params:
+                if key not in SHARD_PARAMETERS and not _same_parameter(
+                    params[key], other[key]
+                ):
+                    raise ValueError('Cannot merge transformers with different values of {}, got {} and {}'.format(key, params[key], other[key]))
+        params['n_shapelets'] = sum(
+            transformer.n_shapelets for transformer in transformers
+        )
+        merged = cls(**params)
+        merged._copy_fitted_attributes(transformers[0])
+        merged.shapelets_ = _merge_shapelets(
+            [transformer.shapelets_ for transformer in transformers]
+        )
+        merged._set_plan()
+        return merged
+    
+    def fit_sharded(self, X, y, n_shards, n_processes=None):
+        """
+        Fit method generating the shapelets in n_shards independent shards,
+        each of them fitted in a separate process, which are then merged into
+        this transformer. The result only depends on random_state and 
+        n_shards, not on the number of processes.
+
+        Parameters
+        ----------
+        X : array, shape=(n_samples, n_features, n_timestamps)
+            Input time series. It can also be a path to a .npy file, which is
+            then opened as a memory map by each process instead of being 
+            copied to it.
+        y : array, shape=(n_samples)
+            Class of the input time series.
+        n_shards : int
+            Number of shards.
+        n_processes : int, optional
+            Number of processes used to fit the shards. The default is None,
+            which uses one process per shard.
+
+        """
+        shards = self.shards(n_shards)
+        if n_processes is not None:
+            n_processes = int(check_is_numeric(n_processes))
+            if n_processes < 1:
+                raise ValueError('n_processes should be a positive integer, got {}'.format(n_processes))
+        # Spawned processes, as forking a process using numba threads is 
+        # not safe.
+        with ProcessPoolExecutor(
+            max_workers=n_processes or len(shards), 
+            mp_context=get_context('spawn')
+        ) as executor:
+            shards = list(executor.map(
+                _fit_shard, shards, repeat(X, len(shards)), 
+                repeat(y, len(shards))
+            ))
+        self._copy_fitted_attributes(self.merge(shards))
         return self
+    
+    def _copy_fitted_attributes(self, transformer):
+        for attribute in FITTED_ATTRIBUTES:
+            if hasattr(transformer, attribute):
+                setattr(self, attribute, getattr(transformer, attribute))
 
+    def fit_iter(self, chunks, max_samples_per_class=1000):
+        """
+        Fit method for datasets that do not fit in memory. The chunks of 
+        (X, y) are read once, and a reservoir of at most max_samples_per_class
+        samples is uniformly sampled for each class. The shapelets are then
+        generated from the samples of the reservoirs, which are the only ones
+        kept in memory.
+        
+        For datasets stored as a .npy file, prefer fit with the path of the 
+        file, which opens it as a memory map and only reads the samples drawn
+        during shapelet generation.
+
+        Parameters
+        ----------
+        chunks : iterable
+            An iterable of (X, y) tuples, with X of shape 
+            (n_samples_chunk, n_features, n_timestamps), or a list of 2D 
+            arrays for variable length time series, and y of shape 
+            (n_samples_chunk).
+        max_samples_per_class : int, optional
+            The maximum number of samples kept for each class. 
+            The default is 1000.
+
+        """
+        max_samples_per_class = int(check_is_numeric(max_samples_per_class))
+        if max_samples_per_class < 1:
+            raise ValueError('max_samples_per_class should be a positive integer, got {}'.format(max_samples_per_class))
+        X, y, min_len = self._reservoir_from_chunks(
+            chunks, max_samples_per_class
+        )
+        if self.min_len is None:
+            self.min_len = min_len
+        return self.fit(X, y)
+    
+    def _reservoir_from_chunks(self, chunks, max_samples_per_class):
+        """
+        Uniformly sample at most max_samples_per_class samples of each class
+        from an iterable of chunks, in a single pass (reservoir sampling).
+
+        Parameters
+        ----------
+        chunks : iterable
+            An iterable of (X, y) tuples.
+        max_samples_per_class : int
+            The maximum number of samples kept for each class.
+
+        Returns
+        -------
+        X : array, shape=(n_samples, n_features, n_timestamps)
+            The sampled time series, or a list of 2D arrays if they are of
+            variable length.
+        y : array, shape=(n_samples)
+            Class of the sampled time series.
+        min_len : int
+            The minimum length of all the time series of the chunks.
 
-    def transform(self, X):
+        """
+        rng = check_random_state(self.random_state)
+        reservoirs = {}
+        n_seen = {}
+        min_len = None
+        for X_chunk, y_chunk in chunks:
+            X_chunk = check_is_path_or_array(X_chunk)
+            for x, label in zip(X_chunk, y_chunk):
+                if min_len is None or x.shape[-1] < min_len:
+                    min_len = x.shape[-1]
+                if label not in reservoirs:
+                    reservoirs[label] = []
+                    n_seen[label] = 0
+                n_seen[label] += 1
+                if len(reservoirs[label]) < max_samples_per_class:
+                    reservoirs[label].append(np.array(x))
+                else:
+                    j = rng.randint(n_seen[label])
+                    if j < max_samples_per_class:
+                        reservoirs[label][j] = np.array(x)
+        if min_len is None:
+            raise ValueError('No samples were found in the chunks')
+        X = []
+        y = []
+        for label in reservoirs:
+            X.extend(reservoirs[label])
+            y.extend([label] * len(reservoirs[label]))
+        if all(x.shape == X[0].shape for x in X):
+            X = np.asarray(X)
+        return X, np.asarray(y), min_len
+    
+    def transform(self, X, out=None):
         """
         Transform the input time series using previously fitted shapelets. 
         We compute a distance vector between each shapelet and each time series
@@ -256,30 +672,375 @@ class R_DST(BaseEstimator, TransformerMixin):
         Parameters
         ----------
         X : array, shape=(n_samples, n_features, n_timestamps)
-            Input time series.
+            Input time series. It can also be a path to a .npy file, which is
+            opened as a memory map. Memory mapped inputs of same length are 
+            not copied if they are C-contiguous and of type dtype. Variable
+            length time series can be given as a list of 2D arrays or as a 
+            RaggedArray.
+        out : array, shape=(n_samples, 3*n_shapelets), optional
+            An array, which can be a memory map, in which the transformed time
+            series are written. If given, X is transformed by chunks so that
+            neither the input nor the output is entirely loaded in memory.
+            The default is None.
 
         Returns
         -------
         X : array, shape=(n_samples, 3*n_shapelets)
-            Transformed input time series.
+            Transformed input time series, out if it was given.
 
         """
         
         check_is_fitted(self, ['shapelets_'])
-        if self.transform_type in [STR_MULTIVARIATE_VARIABLE, STR_UNIVARIATE_VARIABLE]:
-            X, X_len = self._format_uneven_timestamps(X)
-            X = check_array_3D(X).astype(np.float64)
-            X_new = self.transformer(
-                X, self.shapelets_ , self._get_distance_function(),
-                self.phase_invariance, X_len
+        X = check_is_path_or_array(X)
+        if out is None:
+            return self._transform_formatted(self._format_transform_input(X))
+        
+        n_samples = len(X)
+        expected_shape = (n_samples, 3*self.shapelets_[1].shape[0])
+        if out.shape != expected_shape:
+            raise ValueError('Wrong out shape, got {}, expected {}'.format(out.shape, expected_shape))
+        # Number of samples per chunk so that a chunk of output stays below
+        # OUT_CHUNK_BYTES
+        chunk_size = max(
+            1, OUT_CHUNK_BYTES // (out.dtype.itemsize * expected_shape[1])
+        )
+        a = 0
+        for X_new in self.transform_iter(X, chunk_size=chunk_size):
+            b = a + X_new.shape[0]
+            out[a:b] = X_new
+            a = b
+        return out
+    
+    def transform_processes(self, X, n_processes=None, out=None):
+        """
+        Transform the input time series with a pool of processes, for example
+        to use several sockets for a single transform. The input time series,
+        once formatted, and the shapelets are copied to shared memory, and 
+        each process computes the transformation of its range of samples
+        directly in a shared output array, so that neither the inputs nor 
+        the results are pickled. As the shared blocks are released when the
+        call returns, the shared output is copied once to the returned 
+        array (or to out).
+
+        Parameters
+        ----------
+        X : array, shape=(n_samples, n_features, n_timestamps)
+            Input time series. It can also be a path to a .npy file.
+        n_processes : int, optional
+            Number of processes, each of them using n_jobs threads. The 
+            default is None, which uses one process per core.
+        out : array, shape=(n_samples, 3*n_shapelets), optional
+            An array, which can be a memory map, in which the transformed time
+            series are written. The default is None.
+
+        Returns
+        -------
+        X : array, shape=(n_samples, 3*n_shapelets)
+            Transformed input time series, out if it was given.
+
+        """
+        check_is_fitted(self, ['shapelets_'])
+        if n_processes is None:
+            n_processes = os.cpu_count()
+        n_processes = int(check_is_numeric(n_processes))
+        if n_processes < 1:
+            raise ValueError('n_processes should be a positive integer, got {}'.format(n_processes))
+        X = self._format_transform_input(check_is_path_or_array(X))
+        n_samples = len(X)
+        expected_shape = (n_samples, 3*self.shapelets_[1].shape[0])
+        if out is not None and out.shape != expected_shape:
+            raise ValueError('Wrong out shape, got {}, expected {}'.format(out.shape, expected_shape))
+        n_processes = min(n_processes, n_samples)
+        bounds = np.linspace(0, n_samples, n_processes + 1).astype(int)
+        
+        # The workers receive a copy of the transformer without its shapelets,
+        # and read its execution plan from shared memory.
+        worker = copy.copy(self)
+        worker.shapelets_ = None
+        worker.plan_ = None
+        blocks = []
+        try:
+            shm = SharedMemory(
+                create=True, 
+                size=max(1, np.dtype(self.dtype).itemsize*expected_shape[0]*expected_shape[1])
+            )
+            blocks.append(shm)
+            if isinstance(X, RaggedArray):
+                X = [X.values, X.offsets, X.lengths]
+            else:
+                X = [X]
+            specs = (
+                [_to_shared_memory(x, blocks) for x in X],
+                [_to_shared_memory(arr, blocks) for arr in self.plan_],
+                (shm.name, expected_shape, np.dtype(self.dtype).str)
+            )
+            del X
+            with ProcessPoolExecutor(
+                max_workers=n_processes, mp_context=get_context('spawn')
+            ) as executor:
+                list(executor.map(
+                    _transform_shared_rows, repeat(worker, n_processes), 
+                    repeat(specs, n_processes), bounds[:-1], bounds[1:]
+                ))
+            # The shared block is released when this call returns, the 
+            # result is copied once to the returned array.
+            X_new = np.ndarray(expected_shape, dtype=self.dtype, buffer=shm.buf)
+            if out is None:
+                out = X_new.copy()
+            else:
+                out[...] = X_new
+            del X_new
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+        return out
+    
+    def transform_iter(self, X, chunk_size=None, prefetch=True):
+        """
+        Transform the input time series by chunks, yielding the transformed
+        chunks one after the other. This allows to transform datasets that do
+        not fit in memory. The compiled kernels are reused for all chunks, and
+        if prefetch is True, the next chunk is fetched and formatted in a 
+        background thread while the current one is transformed.
+
+        Parameters
+        ----------
+        X : iterable or array, shape=(n_samples, n_features, n_timestamps)
+            If chunk_size is None, an iterable of chunks of input time series,
+            each chunk being a valid input of the transform method. Otherwise,
+            input time series supporting len and slicing (e.g. an array, a
+            memory map, a path to a .npy file or a list of 2D arrays) which 
+            will be cut in chunks of chunk_size samples.
+        chunk_size : int, optional
+            Number of samples per chunk. The default is None.
+        prefetch : bool, optional
+            Wheter to fetch the next chunk while the current one is being 
+            transformed. The default is True.
+
+        Yields
+        ------
+        X_new : array, shape=(n_samples_chunk, 3*n_shapelets)
+            Transformed chunk of input time series.
+
+        """
+        check_is_fitted(self, ['shapelets_'])
+        if chunk_size is None:
+            chunks = iter(X)
+        else:
+            X = check_is_path_or_array(X)
+            chunk_size = int(check_is_numeric(chunk_size))
+            if chunk_size < 1:
+                raise ValueError('chunk_size should be a positive integer, got {}'.format(chunk_size))
+            chunks = (
+                X[i:i+chunk_size] for i in range(0, len(X), chunk_size)
             )
+        
+        if not check_is_boolean(prefetch):
+            for chunk in chunks:
+                yield self._transform_formatted(
+                    self._format_transform_input(chunk)
+                )
         else:
-            X = check_array_3D(X).astype(np.float64)
-            X_new = self.transformer(
-                X, self.shapelets_, self._get_distance_function(),
-                self.phase_invariance
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                next_chunk = executor.submit(self._next_formatted_chunk, chunks)
+                while True:
+                    formatted = next_chunk.result()
+                    if formatted is None:
+                        break
+                    next_chunk = executor.submit(
+                        self._next_formatted_chunk, chunks
+                    )
+                    yield self._transform_formatted(formatted)
+    
+    def save(self, path):
+        """
+        Save the fitted transformer in a directory, as the arrays of its
+        execution plan, in which the shapelet values are packed without 
+        padding, and a versioned JSON file with its parameters.
+
+        Parameters
+        ----------
+        path : str or path
+            Directory in which the transformer is saved. It is created if it
+            does not exist.
+
+        Returns
+        -------
+        None.
+
+        """
+        check_is_fitted(self, ['plan_'])
+        save_model(
+            path, self.__class__.__name__, self.get_params(), {},
+            dict(zip(PLAN_ARRAYS, self.plan_))
+        )
+    
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a transformer saved by the save method.
+
+        Parameters
+        ----------
+        path : str or path
+            Directory in which the transformer was saved.
+        mmap : bool, optional
+            Wheter to open the arrays of the plan as copy on write memory 
+            maps, so that processes loading the same transformer share one 
+            copy of them. The default is True.
+
+        Returns
+        -------
+        R_DST
+            The fitted transformer. The random_state of a loaded transformer
+            is None.
+
+        """
+        params, _, arrays = load_model(path, cls.__name__, mmap=mmap)
+        transformer = cls(**params)
+        transformer._set_fit_transform(None)
+        transformer.plan_ = tuple(arrays[name] for name in PLAN_ARRAYS)
+        transformer.shapelets_ = _shapelets_from_plan(
+            transformer.plan_, transformer.transform_type in [
+                STR_MUTLIVARIATE, STR_MULTIVARIATE_VARIABLE
+            ]
+        )
+        return transformer
+    
+    def _next_formatted_chunk(self, chunks):
+        """
+        Fetch the next chunk of an iterator and format it for the transform.
+
+        Parameters
+        ----------
+        chunks : iterator
+            An iterator over chunks of input time series.
+
+        Returns
+        -------
+        array, RaggedArray or None
+            The output of _format_transform_input for the next chunk, or None
+            if the iterator is exhausted.
+
+        """
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return None
+        return self._format_transform_input(chunk)
+    
+    def _format_transform_input(self, X):
+        """
+        Format input time series to be used by the transformer.
+
+        Parameters
+        ----------
+        X : array, shape=(n_samples, n_features, n_timestamps)
+            Input time series.
+
+        Returns
+        -------
+        X : array or RaggedArray, shape=(n_samples, n_features, n_timestamps)
+            Input time series as a 3D array of type dtype, or as a RaggedArray
+            for variable length transformers.
+
+        """
+        if self.transform_type in [STR_MULTIVARIATE_VARIABLE, STR_UNIVARIATE_VARIABLE]:
+            return self._format_uneven_timestamps(X)
+        return np.ascontiguousarray(check_array_3D(X), dtype=self.dtype)
+    
+    def _transform_formatted(self, X, out=None):
+        """
+        Apply the transformer to input time series formatted by the 
+        _format_transform_input method.
+
+        Parameters
+        ----------
+        X : array or RaggedArray, shape=(n_samples, n_features, n_timestamps)
+            Input time series.
+        out : array, shape=(n_samples, 3*n_shapelets), optional
+            A C-contiguous array of type dtype in which the kernels write the
+            transformed time series. The default is None, which allocates it.
+
+        Returns
+        -------
+        X : array, shape=(n_samples, 3*n_shapelets)
+            Transformed input time series, out if it was given.
+
+        """
+        if out is None:
+            out = np.zeros(
+                (len(X), 3*self.plan_[3].shape[0]), dtype=self.dtype
+            )
+        if self.engine == 'gemm':
+            return self.transformer(
+                X, self.plan_, self._get_sdp_mode(), self.phase_invariance,
+                out
             )
-        return X_new
+        if not isinstance(X, RaggedArray):
+            # A same length input is a ragged array of uniform lengths,
+            # whose values are a view of X
+            n_samples, n_features, n_timestamps = X.shape
+            X = RaggedArray(
+                X.reshape(-1), 
+                np.arange(n_samples+1) * (n_features * n_timestamps),
+                np.full(n_samples, n_timestamps)
+            )
+        if self.engine == 'numpy':
+            return self.transformer(
+                X.values, self.plan_, self._get_metric(),
+                self.phase_invariance, X.lengths, X.offsets, out
+            )
+        return self.transformer(
+            X.values, self.plan_, self.early_abandon, self._get_sdp_mode(),
+            self.phase_invariance, X.lengths, X.offsets, out
+        )
+    
+    def _cast_shapelets(self, shapelets):
+        """
+        Cast the values and threshold arrays of the shapelets to the dtype
+        parameter, the other arrays being integer or boolean parameters.
+
+        Parameters
+        ----------
+        shapelets : tuple of array
+            The shapelets returned by the fitter function.
+
+        Returns
+        -------
+        tuple of array
+            The shapelets with values and threshold of type dtype.
+
+        """
+        shapelets = list(shapelets)
+        shapelets[0] = shapelets[0].astype(self.dtype)
+        shapelets[3] = shapelets[3].astype(self.dtype)
+        return tuple(shapelets)
+    
+    def _set_plan(self):
+        """
+        Build the execution plan used by the transformer from the fitted 
+        shapelets, so that the shapelets are grouped by length, dilation and
+        normalization only once. The values of univariate shapelets are 
+        packed without their padding.
+
+        Returns
+        -------
+        None.
+
+        """
+        values, lengths, dilations, threshold, normalize = self.shapelets_[:5]
+        if len(self.shapelets_) == 5:
+            values = values[np.arange(values.shape[1]) < lengths[:, np.newaxis]]
+            n_channels = np.ones(lengths.shape[0], dtype=np.int64)
+            channel_ids = np.zeros(lengths.shape[0], dtype=np.int64)
+        else:
+            n_channels, channel_ids = self.shapelets_[5:]
+        self.plan_ = shapelet_plan(
+            values, lengths, dilations, threshold, normalize, n_channels,
+            channel_ids
+        )
     
     def _auto_class(self, X):
         """
@@ -301,12 +1062,17 @@ class R_DST(BaseEstimator, TransformerMixin):
 
         """
         #[STR_UNIVARIATE,STR_MUTLIVARIATE,STR_UNIVARIATE,STR_MULTIVARIATE_VARIABLE]
-        if isinstance(X, list) or X.dtype == np.object_:
+        if isinstance(X, RaggedArray):
+            if X.n_features > 1:
+                return STR_MULTIVARIATE_VARIABLE
+            else:
+                return STR_UNIVARIATE_VARIABLE
+        elif isinstance(X, list) or X.dtype == np.object_:
             if len(X[0]) > 1:
                 return STR_MULTIVARIATE_VARIABLE
             else:
                 return STR_UNIVARIATE_VARIABLE
-        elif X.dtype == np.int_ or X.dtype == np.float_:
+        elif np.issubdtype(X.dtype, np.number):
             #Even length
             X = check_array_3D(X)
             if X.shape[1] > 1:
@@ -338,43 +1104,65 @@ class R_DST(BaseEstimator, TransformerMixin):
             self.transform_type = _type
         else:
             _type = self.transform_type
+        
+        if self.engine == 'gemm':
+            if self._get_sdp_mode() == SDP_DISABLED:
+                raise ValueError(
+                    "The 'gemm' engine requires the 'euclidean' or 'squared' "
+                    "distance, got {}".format(self.distance)
+                )
+            if _type not in [STR_UNIVARIATE, STR_MUTLIVARIATE]:
+                raise ValueError(
+                    "The 'gemm' engine is only available for same length "
+                    "time series, got {}".format(_type)
+                )
             
         if _type == STR_UNIVARIATE:
             from convst.transformers._univariate_same_length import (
-                U_SL_apply_all_shapelets, U_SL_generate_shapelet
+                U_SL_apply_all_shapelets_gemm, U_SL_generate_shapelet
             )
             self.fitter = U_SL_generate_shapelet
-            self.transformer = U_SL_apply_all_shapelets
+            if self.engine == 'gemm':
+                self.transformer = U_SL_apply_all_shapelets_gemm
             
         elif _type == STR_MUTLIVARIATE:
             from convst.transformers._multivariate_same_length import (
-                M_SL_apply_all_shapelets, M_SL_generate_shapelet
+                M_SL_apply_all_shapelets_gemm, M_SL_generate_shapelet
             )
             self.fitter = M_SL_generate_shapelet
-            self.transformer = M_SL_apply_all_shapelets
+            if self.engine == 'gemm':
+                self.transformer = M_SL_apply_all_shapelets_gemm
             
         elif _type == STR_UNIVARIATE_VARIABLE:
             from convst.transformers._univariate_variable_length import (
-                U_VL_apply_all_shapelets, U_VL_generate_shapelet
+                U_VL_generate_shapelet
             )
             self.fitter = U_VL_generate_shapelet
-            self.transformer = U_VL_apply_all_shapelets
             
         elif _type == STR_MULTIVARIATE_VARIABLE:
             from convst.transformers._multivariate_variable_length import (
-                M_VL_apply_all_shapelets, M_VL_generate_shapelet
+                M_VL_generate_shapelet
             )
             self.fitter = M_VL_generate_shapelet
-            self.transformer = M_VL_apply_all_shapelets
         
         else:
             raise ValueError('Unknwon transform type parameter')
+        # The numba engine uses the same kernel for all types of input,
+        # specialized for the distance
+        if self.engine == 'numba':
+            self.transformer = APPLY_ALL_SHAPELETS[self._get_metric()]
+        elif self.engine == 'numpy':
+            from convst.transformers._numpy_engine import (
+                apply_all_shapelets_numpy
+            )
+            self.transformer = apply_all_shapelets_numpy
         
     
-    def _get_distance_function(self):
+    def _get_metric(self):
         """
-        Based on the distance parameter, return the distance function to be 
-        used during the shapelet generation and transform.
+        Based on the distance parameter, return the code of the distance
+        to be used by the numba functions during the shapelet generation and
+        transform.
 
         Raises
         ------
@@ -384,30 +1172,50 @@ class R_DST(BaseEstimator, TransformerMixin):
 
         Returns
         -------
-        function
-            Return the numba function based on the distance parameter.
+        int
+            Return the code of the distance, which the numba functions are
+            specialized for.
             
         """
         if self.distance == 'euclidean':
-            return euclidean
+            return DIST_EUCLIDEAN
         if self.distance == 'squared':
-            return squared_euclidean
+            return DIST_SQUARED
         if self.distance == 'manhattan':
-            return manhattan
+            return DIST_MANHATTAN
         raise ValueError('Wrong distance parameter value, got {}'.format(self.distance))
     
+    def _get_sdp_mode(self):
+        """
+        Based on the distance parameter, return the mode of the sliding dot 
+        product engine. This engine is only available for the euclidean and
+        squared euclidean distances, and it is used only for the shapelets 
+        for which it is estimated to be faster.
+
+        Returns
+        -------
+        int
+            The mode of the sliding dot product engine.
+
+        """
+        if self.distance == 'euclidean':
+            return SDP_EUCLIDEAN
+        if self.distance == 'squared':
+            return SDP_SQUARED
+        return SDP_DISABLED
+    
     def _format_uneven_timestamps(self, X):
         """
-        Given a set of variable length time series, create a 3D numpy array 
-        of float dtype to be used in the numba function. This will create an 
-        array with n_timestamps equal to the maximum length in X.
+        Given a set of variable length time series, create a RaggedArray of 
+        type dtype to be used in the numba function. The time series are 
+        stored one after the other in a single buffer, without padding.
 
         Parameters
         ----------
         X : array, shape=(n_samples, n_featrues, n_timestamps)
              The input time series data. For variable length time series, it 
-             can either be a list of 2D array, or a numpy array with object
-             dtype.
+             can either be a list of 2D array, a numpy array with object
+             dtype or a RaggedArray.
 
         Raises
         ------
@@ -417,27 +1225,13 @@ class R_DST(BaseEstimator, TransformerMixin):
 
         Returns
         -------
-        X_new : array, shape=(n_samples, n_featrues, n_timestamps)
-             The input time series data. For variable length time series, it 
-             can either be a list of 2D array, or a numpy array with object
-             dtype.
-        lengths : array, shape=(n_samples)
-             The true length of each input time series.
+        X_new : RaggedArray, shape=(n_samples, n_featrues, n_timestamps)
+             The input time series data.
 
         """
-        n_ft = np.zeros(len(X),dtype=np.int64)
-        lengths = np.zeros(len(X),dtype=np.int64)
-        for i in range(len(X)):
-            n_ft[i] = X[i].shape[0]
-            lengths[i] = X[i].shape[1]
-        
-        if np.all(n_ft == n_ft[0]):      
-            X_new = np.zeros((len(X), n_ft[0], lengths.max()))
-            for i in range(len(X)):
-                X_new[i, :, :lengths[i]] = X[i]
-            return X_new, lengths
-        else:
-            raise ValueError("Samples got different number of features")
+        if isinstance(X, RaggedArray):
+            return X.astype(self.dtype)
+        return RaggedArray.from_list(X, dtype=self.dtype)
     
 
     def _check_params(self, n_timestamps):
@@ -498,7 +1292,7 @@ class R_DST(BaseEstimator, TransformerMixin):
     
     def _validate_transform_type(self, transform_type):
         transform_type = transform_type.lower()
-        valid = ['auto',STR_UNIVARIATE,STR_MUTLIVARIATE,STR_UNIVARIATE,STR_MULTIVARIATE_VARIABLE]
+        valid = ['auto',STR_UNIVARIATE,STR_MUTLIVARIATE,STR_UNIVARIATE_VARIABLE,STR_MULTIVARIATE_VARIABLE]
         if transform_type not in valid:
             raise ValueError('Wrong transform_type parameter value, got {}, valid ones are {}'.format(transform_type, valid))
         return transform_type
@@ -515,4 +1309,18 @@ class R_DST(BaseEstimator, TransformerMixin):
         valid = ['euclidean','squared','manhattan']
         if distance_str not in valid:
             raise ValueError('Wrong distance parameter value, got {}, valid ones are {}'.format(distance_str, valid))
-        return distance_str
\ No newline at end of file
+        return distance_str
+    
+    def _validate_engine(self, engine_str):
+        engine_str = engine_str.lower()
+        valid = ['numba','gemm','numpy']
+        if engine_str not in valid:
+            raise ValueError('Wrong engine parameter value, got {}, valid ones are {}'.format(engine_str, valid))
+        return engine_str
+    
+    def _validate_dtype(self, dtype):
+        dtype = np.dtype(dtype).name
+        valid = ['float64','float32']
+        if dtype not in valid:
+            raise ValueError('Wrong dtype parameter value, got {}, valid ones are {}'.format(dtype, valid))
+        return dtype
@@ -1,10 +1,16 @@
 # -*- coding: utf-8 -*-
 
+import sys
 import numpy as np
-import pandas as pd
-from os import cpu_count
-from sktime.datatypes._panel._convert import from_nested_to_3d_numpy
-from sktime.datatypes._panel._check import is_nested_dataframe
+from os import cpu_count, PathLike
+
+def is_dataframe(X):
+    """
+    Check if X is a pandas DataFrame. Pandas is not imported by this check,
+    as X cannot be a DataFrame if pandas was never imported.
+    """
+    pd = sys.modules.get('pandas')
+    return pd is not None and isinstance(X, pd.DataFrame)
 
 def is_int(x):
     """Check if x is of integer type, but not boolean."""
@@ -27,6 +33,26 @@ def check_is_boolean(x):
 
 
 
+def check_is_path_or_array(X):
+    """
+    If the input is a path to a .npy file, open it as a read-only memory map,
+    so that its content is only read from disk when accessed.
+
+    Parameters
+    ----------
+    X : str, path or object
+        Input data, or path to a .npy file.
+
+    Returns
+    -------
+    X : object
+        Input data, or memory map of the .npy file.
+
+    """
+    if isinstance(X, (str, PathLike)):
+        return np.load(X, mmap_mode='r')
+    return X
+
 def check_n_jobs(n_jobs):
     """Check `n_jobs` parameter according to the scikit-learn convention.
 
@@ -89,7 +115,10 @@ def check_array_3D(X, coerce_to_numpy=True, is_univariate=False, min_timestamps=
             "Input should have more than {} timestamp"
             ", found only: {}".format(min_timestamps,X.shape[2])
         )
-    if isinstance(X, pd.DataFrame):
+    if is_dataframe(X):
+        # sktime is only needed, and imported, for nested DataFrames
+        from sktime.datatypes._panel._convert import from_nested_to_3d_numpy
+        from sktime.datatypes._panel._check import is_nested_dataframe
         if not is_nested_dataframe(X):
             raise ValueError(
                 "If passed as a pd.DataFrame, X must be a nested "
@@ -137,7 +166,7 @@ def check_array_2D(X, coerce_to_numpy=True):
             "Input is empty or have a dimension of size 0"
             ", found shape: {}".format(X.shape)
         )
-    if isinstance(X, pd.DataFrame):
+    if is_dataframe(X):
         if coerce_to_numpy:
             X = X.values
     return X
@@ -198,7 +227,7 @@ def check_is_numpy_or_pd(X):
     """
     if isinstance(X, list):
         return np.asarray(X)
-    if isinstance(X, pd.DataFrame):
+    if is_dataframe(X):
         return X
     if isinstance(X, np.ndarray):
         return X
@@ -1,18 +1,17 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
-from sktime.datasets import (load_UCR_UEA_dataset, 
-    load_from_tsfile_to_dataframe, load_from_arff_to_dataframe,
-    
-)
-from sktime.datatypes._panel._convert import (from_multiindex_to_dflist,
-    from_nested_to_multi_index
-)
 from sklearn.preprocessing import LabelEncoder
 from numba import njit, prange
 
 
+# sktime is imported by the functions using it, so that it is only loaded
+# when a dataset is.
+
 def _custom_from_nested_to_3d_numpy(X):
+    from sktime.datatypes._panel._convert import (from_multiindex_to_dflist,
+        from_nested_to_multi_index
+    )
     X = from_multiindex_to_dflist(from_nested_to_multi_index(X))
     if all([X[i].shape[0] == X[0].shape[0] for i in range(len(X))]):
         return np.array([X[i].values.T for i in range(len(X))])
@@ -94,6 +93,7 @@ def load_sktime_dataset_split(name, normalize=False):
 
     """
     #Load datasets
+    from sktime.datasets import load_UCR_UEA_dataset
     X_train, y_train = load_UCR_UEA_dataset(name, return_X_y=True, split='train')
     X_test, y_test = load_UCR_UEA_dataset(name, return_X_y=True, split='test')
 
@@ -148,6 +148,7 @@ def load_sktime_arff_file(path, normalize=False):
 
     """
     #Load datasets
+    from sktime.datasets import load_from_arff_to_dataframe
     X_train, y_train = load_from_arff_to_dataframe(path+'_TRAIN.arff')
     X_test, y_test = load_from_arff_to_dataframe(path+'_TEST.arff')
 
@@ -202,6 +203,7 @@ def load_sktime_arff_file_resample_id(path, rs_id, normalize=False):
 
     """
     #Load datasets
+    from sktime.datasets import load_from_arff_to_dataframe
     X_train, y_train = load_from_arff_to_dataframe(path+'_{}_TRAIN.arff'.format(rs_id))
     X_test, y_test = load_from_arff_to_dataframe(path+'_{}_TEST.arff'.format(rs_id))
 
@@ -252,6 +254,7 @@ def load_sktime_ts_file(path, normalize=False):
     """
     
     #Load datasets
+    from sktime.datasets import load_from_tsfile_to_dataframe
     X_train, y_train = load_from_tsfile_to_dataframe(path+'_TRAIN.ts')
     X_test, y_test = load_from_tsfile_to_dataframe(path+'_TEST.ts')
 
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import numpy as np
+
+from sklearn.preprocessing import LabelBinarizer
+
+# Version of the directory format written by save_model. It must be
+# incremented when the arrays or metadata of a model change.
+FORMAT_VERSION = 1
+METADATA_FILE = 'metadata.json'
+
+
+def _to_json(value):
+    """Convert a parameter value to a JSON serializable object."""
+    if isinstance(value, np.ndarray):
+        return {'__ndarray__': value.tolist(), 'dtype': value.dtype.str}
+    if isinstance(value, np.random.RandomState):
+        # The fitted state does not depend on it anymore
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [_to_json(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _to_json(v) for k, v in value.items()}
+    return value
+
+
+def _from_json(value):
+    """Convert a JSON object written by _to_json back to a parameter value."""
+    if isinstance(value, dict):
+        if '__ndarray__' in value:
+            return np.asarray(value['__ndarray__'], dtype=value['dtype'])
+        return {k: _from_json(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_from_json(v) for v in value]
+    return value
+
+
+def save_model(path, kind, params, attributes, arrays):
+    """
+    Write a model in a directory, as one .npy file per array and a JSON
+    metadata file with the format version, the kind of model, its parameters
+    and its scalar fitted attributes.
+
+    Parameters
+    ----------
+    path : str or path
+        Directory in which the model is written. It is created if it does not
+        exist.
+    kind : str
+        Name of the class of the model.
+    params : dict
+        Parameters of the model, as returned by get_params.
+    attributes : dict
+        Fitted attributes of the model which are not arrays.
+    arrays : dict
+        Fitted arrays of the model.
+
+    Returns
+    -------
+    None.
+
+    """
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(
+            os.path.join(path, name + '.npy'), np.ascontiguousarray(array),
+            allow_pickle=False
+        )
+    metadata = {
+        'format_version': FORMAT_VERSION,
+        'kind': kind,
+        'params': _to_json(params),
+        'attributes': _to_json(attributes),
+        'arrays': sorted(arrays)
+    }
+    with open(os.path.join(path, METADATA_FILE), 'w') as f:
+        json.dump(metadata, f, indent=1)
+
+
+def load_model(path, kind, mmap=True):
+    """
+    Read a model written by save_model.
+
+    Parameters
+    ----------
+    path : str or path
+        Directory in which the model was written.
+    kind : str
+        Expected name of the class of the model.
+    mmap : bool, optional
+        Wheter to open the arrays as memory maps. They are mapped copy on
+        write, so that processes loading the same model share the pages of
+        the files as long as they do not modify them. The default is True.
+
+    Raises
+    ------
+    ValueError
+        If the directory was written with another format version or for
+        another kind of model.
+
+    Returns
+    -------
+    params : dict
+        Parameters of the model.
+    attributes : dict
+        Fitted attributes of the model which are not arrays.
+    arrays : dict
+        Fitted arrays of the model.
+
+    """
+    with open(os.path.join(path, METADATA_FILE)) as f:
+        metadata = json.load(f)
+    if metadata.get('format_version') != FORMAT_VERSION:
+        raise ValueError('Unsupported model format version, got {}, expected {}'.format(metadata.get('format_version'), FORMAT_VERSION))
+    if metadata.get('kind') != kind:
+        raise ValueError('The directory contains a {} model, expected {}'.format(metadata.get('kind'), kind))
+    arrays = {
+        name: np.load(
+            os.path.join(path, name + '.npy'),
+            mmap_mode='c' if mmap else None, allow_pickle=False
+        )
+        for name in metadata['arrays']
+    }
+    return (
+        _from_json(metadata['params']), _from_json(metadata['attributes']),
+        arrays
+    )
+
+
+def linear_arrays(scaler, ridge):
+    """
+    Get the fitted arrays of a standard scaler followed by a ridge
+    classifier, used by the classifiers to save their final estimator.
+
+    Parameters
+    ----------
+    scaler : object
+        A fitted StandardScaler, or c_StandardScaler.
+    ridge : object
+        A fitted RidgeClassifierCV.
+
+    Returns
+    -------
+    dict
+        The arrays of the scaler and of the ridge classifier.
+
+    """
+    arrays = {
+        'scaler_mean': scaler.mean_,
+        'scaler_scale': scaler.scale_,
+        'ridge_coef': ridge.coef_,
+        'ridge_intercept': np.asarray(ridge.intercept_),
+        'ridge_classes': np.asarray(ridge.classes_),
+        'ridge_alpha': np.asarray(ridge.alpha_)
+    }
+    if hasattr(scaler, 'usefull_atts'):
+        arrays['scaler_usefull_atts'] = scaler.usefull_atts
+    return arrays
+
+
+def set_linear_arrays(scaler, ridge, arrays):
+    """
+    Set the fitted attributes of an unfitted standard scaler and ridge
+    classifier from the arrays returned by linear_arrays.
+
+    Parameters
+    ----------
+    scaler : object
+        An unfitted StandardScaler, or c_StandardScaler.
+    ridge : object
+        An unfitted RidgeClassifierCV.
+    arrays : dict
+        The arrays returned by linear_arrays.
+
+    Returns
+    -------
+    None.
+
+    """
+    if 'scaler_usefull_atts' in arrays:
+        scaler.usefull_atts = arrays['scaler_usefull_atts']
+    scaler.mean_ = arrays['scaler_mean']
+    scaler.scale_ = arrays['scaler_scale']
+    scaler.n_features_in_ = scaler.mean_.shape[0]
+    ridge.coef_ = arrays['ridge_coef']
+    ridge.intercept_ = arrays['ridge_intercept']
+    ridge.alpha_ = arrays['ridge_alpha'].item()
+    ridge.n_features_in_ = ridge.coef_.shape[1]
+    # The classes of a ridge classifier are given by its label binarizer
+    ridge._label_binarizer = LabelBinarizer(pos_label=1, neg_label=-1).fit(
+        arrays['ridge_classes']
+    )
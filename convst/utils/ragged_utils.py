@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+class RaggedArray:
+    """
+    Variable length time series stored in a single contiguous buffer, used as
+    input of the variable length transformers. The values of the i-th sample,
+    of shape (n_features, lengths[i]), are stored in C order in
+    values[offsets[i]:offsets[i+1]], so that no memory is spent on padding.
+
+    Use the from_list or from_padded constructors to build it from a list of
+    2D arrays or from a padded 3D array.
+
+    Parameters
+    ----------
+    values : array, shape=(n_values)
+        The values of all the samples, one after the other.
+    offsets : array, shape=(n_samples+1)
+        The position of the first value of each sample in values, followed by
+        the number of values.
+    lengths : array, shape=(n_samples)
+        The length of each sample.
+
+    Raises
+    ------
+    ValueError
+        If the offsets and lengths are not consistent with a single number
+        of features for all samples.
+
+    """
+    def __init__(self, values, offsets, lengths):
+        values = np.asarray(values)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        if values.ndim != 1:
+            raise ValueError('values should be a 1D array, got {} dimensions'.format(values.ndim))
+        if lengths.shape[0] == 0:
+            raise ValueError('A RaggedArray should contain at least one sample')
+        if offsets.shape[0] != lengths.shape[0] + 1:
+            raise ValueError('offsets should have one more element than lengths, got {} and {}'.format(offsets.shape[0], lengths.shape[0]))
+        if offsets[0] != 0 or offsets[-1] != values.shape[0]:
+            raise ValueError('offsets should start at 0 and end at the number of values')
+        if np.any(lengths < 1):
+            raise ValueError('lengths should be positive')
+        n_values = np.diff(offsets)
+        n_features = n_values[0] // lengths[0]
+        if np.any(n_values != n_features * lengths) or n_features < 1:
+            raise ValueError("Samples got different number of features")
+        self.values = values
+        self.offsets = offsets
+        self.lengths = lengths
+        self.n_features = int(n_features)
+
+    @classmethod
+    def from_list(cls, X, dtype=None):
+        """
+        Build a RaggedArray from a sequence of time series.
+
+        Parameters
+        ----------
+        X : list of array, shape=(n_samples, n_features, n_timestamps)
+            Input time series, as a list of 2D arrays or a numpy array with
+            object dtype.
+        dtype : dtype, optional
+            Type of the values. The default is None, which uses the type of
+            the first sample.
+
+        Returns
+        -------
+        RaggedArray
+            The input time series.
+
+        """
+        if len(X) == 0:
+            raise ValueError('Cannot build a RaggedArray from an empty input')
+        lengths = np.array([x.shape[1] for x in X], dtype=np.int64)
+        n_ft = np.array([x.shape[0] for x in X], dtype=np.int64)
+        if np.any(n_ft != n_ft[0]):
+            raise ValueError("Samples got different number of features")
+        offsets = np.concatenate(([0], np.cumsum(n_ft * lengths)))
+        values = np.concatenate(
+            [np.ravel(x) for x in X]
+        ).astype(dtype or np.asarray(X[0]).dtype, copy=False)
+        return cls(values, offsets, lengths)
+
+    @classmethod
+    def from_padded(cls, X, lengths, dtype=None):
+        """
+        Build a RaggedArray from a 3D array padded to the largest length.
+
+        Parameters
+        ----------
+        X : array, shape=(n_samples, n_features, max(lengths))
+            Input time series, the values of the i-th sample after
+            lengths[i] being ignored.
+        lengths : array, shape=(n_samples)
+            The length of each input time series.
+        dtype : dtype, optional
+            Type of the values. The default is None, which uses the type of X.
+
+        Returns
+        -------
+        RaggedArray
+            The input time series.
+
+        """
+        X = np.asarray(X)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        if X.ndim != 3 or X.shape[0] != lengths.shape[0]:
+            raise ValueError('Expected a 3D array with one length per sample, got shapes {} and {}'.format(X.shape, lengths.shape))
+        if np.any(lengths > X.shape[2]):
+            raise ValueError('lengths should not be greater than the padded length {}'.format(X.shape[2]))
+        mask = np.arange(X.shape[2]) < lengths[:, np.newaxis, np.newaxis]
+        # Boolean indexing reads X in C order, which is the order of the
+        # samples in the buffer.
+        values = X[np.broadcast_to(mask, X.shape)]
+        offsets = np.concatenate(([0], np.cumsum(X.shape[1] * lengths)))
+        return cls(
+            values.astype(dtype or X.dtype, copy=False), offsets, lengths
+        )
+
+    def astype(self, dtype):
+        """Return the time series with values of type dtype, without copy if
+        they already are."""
+        return RaggedArray(
+            self.values.astype(dtype, copy=False), self.offsets, self.lengths
+        )
+
+    def __len__(self):
+        return self.lengths.shape[0]
+
+    def __getitem__(self, key):
+        """
+        Return the i-th sample as a (n_features, lengths[i]) view if key is
+        an integer, else a RaggedArray of the selected samples, which is a
+        view of this one if key is a slice of step 1.
+        """
+        if isinstance(key, (int, np.integer)):
+            i = range(len(self))[key]
+            return self.values[self.offsets[i]:self.offsets[i+1]].reshape(
+                self.n_features, self.lengths[i]
+            )
+        if isinstance(key, slice) and key.step in (None, 1):
+            a, b, _ = key.indices(len(self))
+            b = max(a, b)
+            return RaggedArray(
+                self.values[self.offsets[a]:self.offsets[b]],
+                self.offsets[a:b+1] - self.offsets[a], self.lengths[a:b]
+            )
+        idx = np.arange(len(self))[key]
+        return RaggedArray.from_list([self[i] for i in idx])
+
+    def to_list(self):
+        """Return the time series as a list of 2D arrays."""
+        return [self[i] for i in range(len(self))]
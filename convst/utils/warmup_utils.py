@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import numpy as np
+
+from itertools import product
+
+KINDS = [
+    'univariate', 'multivariate', 'univariate_variable',
+    'multivariate_variable'
+]
+DISTANCES = ['manhattan', 'euclidean', 'squared']
+DTYPES = ['float64', 'float32']
+ENGINES = ['numba', 'gemm']
+
+# Modules defining cached numba functions. Their cache directory is fixed
+# when they are imported.
+CACHED_MODULES = [
+    'convst.transformers._commons',
+    'convst.transformers._univariate_same_length',
+    'convst.transformers._multivariate_same_length',
+    'convst.transformers._univariate_variable_length',
+    'convst.transformers._multivariate_variable_length',
+    'convst.transformers._input_transformers',
+    'convst.utils.dataset_utils'
+]
+
+
+def set_cache_dir(path):
+    """
+    Set the directory in which numba writes and reads the compiled functions
+    of convst, instead of the __pycache__ directories of the package. It
+    must be called before the transformers are imported, and is inherited
+    by the processes started afterwards, as it sets the NUMBA_CACHE_DIR
+    environment variable.
+
+    The directory can be filled in a build step, for example by warmup when
+    building a container image, and copied elsewhere: the compiled functions
+    are found as long as the convst sources are installed at the same path
+    and are not modified. As they are compiled for the CPU of the machine,
+    set the NUMBA_CPU_NAME environment variable to 'generic' both when
+    filling the cache and when using it on other machines.
+
+    Parameters
+    ----------
+    path : str or path
+        The cache directory. It is created if it does not exist.
+
+    Raises
+    ------
+    ValueError
+        If the transformers were already imported with another cache
+        directory.
+
+    Returns
+    -------
+    None.
+
+    """
+    from numba.core import config
+    path = os.path.abspath(path)
+    imported = [module for module in CACHED_MODULES if module in sys.modules]
+    if len(imported) > 0 and config.CACHE_DIR != path:
+        raise ValueError('The cache directory must be set before importing {}'.format(imported))
+    os.makedirs(path, exist_ok=True)
+    os.environ['NUMBA_CACHE_DIR'] = path
+    config.CACHE_DIR = path
+
+
+def _warmup_data(kind, random_state):
+    """Generate a small dataset of the given kind with two classes."""
+    n_features = 3 if kind.startswith('multivariate') else 1
+    y = np.array([0, 1] * 4)
+    if kind.endswith('variable'):
+        X = [
+            random_state.normal(size=(n_features, 30 + 2 * i))
+            for i in range(y.shape[0])
+        ]
+    else:
+        X = random_state.normal(size=(y.shape[0], n_features, 30))
+    return X, y
+
+
+def warmup(
+    kinds=None, distances=None, dtypes=None, phase_invariance=[False, True],
+    early_abandon=[False], engines=['numba'], cache_dir=None
+):
+    """
+    Compile the numba functions used by R_DST to fit and transform time
+    series, so that the first call made by a new process does not pay the
+    compilation, and write them in the numba cache. A small random dataset
+    is fitted and transformed for each combination of the parameters,
+    which compiles the functions for the same argument types as on real
+    data. Compiled functions found in the cache are only loaded.
+
+    Parameters
+    ----------
+    kinds : list of str, optional
+        The types of time series, among 'univariate', 'multivariate',
+        'univariate_variable' and 'multivariate_variable'. The default is
+        None, which uses all of them.
+    distances : list of str, optional
+        The distances, among 'manhattan', 'euclidean' and 'squared'. The
+        default is None, which uses all of them.
+    dtypes : list of str, optional
+        The dtypes, among 'float64' and 'float32'. The default is None, which
+        uses both.
+    phase_invariance : list of bool, optional
+        The values of the phase_invariance parameter. The default is
+        [False, True].
+    early_abandon : list of bool, optional
+        The values of the early_abandon parameter. The default is [False].
+    engines : list of str, optional
+        The engines, among 'numba' and 'gemm'. Combinations not supported by
+        the 'gemm' engine are skipped. The default is ['numba'].
+    cache_dir : str or path, optional
+        If given, the cache directory set by set_cache_dir before compiling.
+        The default is None, which uses the current numba cache directory.
+
+    Raises
+    ------
+    ValueError
+        If a kind, distance, dtype or engine is not valid.
+
+    Returns
+    -------
+    None.
+
+    """
+    kinds = KINDS if kinds is None else kinds
+    distances = DISTANCES if distances is None else distances
+    dtypes = DTYPES if dtypes is None else dtypes
+    for values, valid in [
+        (kinds, KINDS), (distances, DISTANCES), (dtypes, DTYPES),
+        (engines, ENGINES)
+    ]:
+        for value in values:
+            if value not in valid:
+                raise ValueError('Wrong warmup parameter value, got {}, valid ones are {}'.format(value, valid))
+    if cache_dir is not None:
+        set_cache_dir(cache_dir)
+
+    from convst.transformers import R_DST
+    random_state = np.random.RandomState(0)
+    for kind in kinds:
+        X, y = _warmup_data(kind, random_state)
+        for distance, dtype, phase, ea, engine in product(
+            distances, dtypes, phase_invariance, early_abandon, engines
+        ):
+            if engine == 'gemm' and (
+                distance == 'manhattan' or kind.endswith('variable')
+            ):
+                continue
+            R_DST(
+                transform_type=kind, distance=distance, dtype=dtype,
+                phase_invariance=phase, early_abandon=ea, engine=engine,
+                n_shapelets=10, random_state=0, n_jobs=False
+            ).fit(X, y).transform(X)
@@ -1,4 +1,17 @@
-from convst.transformers._commons import generate_strides_2D, generate_strides_1D
+from convst.transformers._commons import (
+    generate_strides_2D, generate_strides_1D, generate_chains_1D,
+    generate_chains_2D, compute_shapelet_dist_vector, sliding_mean_std,
+    sliding_mean_std_2D, sdp_prepare, sdp_distance_vector, euclidean,
+    squared_euclidean, manhattan, euclidean_ea, squared_euclidean_ea,
+    manhattan_ea, early_abandon_order, SDP_SQUARED, SDP_EUCLIDEAN,
+    DIST_SQUARED, DIST_EUCLIDEAN, benchmark_distances,
+    bitset_n_words, bitset_fill, bitset_get, bitset_clear, bitset_count,
+    bitset_select, bitset_count_channels, bitset_select_channels,
+    fenwick_init, fenwick_add, fenwick_prefix, fenwick_search,
+    same_class_index, rng_stream, rng_randint, rng_uniform, rng_choice,
+    generation_schedule, apply_schedule, ragged_sample, ragged_bitsets,
+    ragged_bitset, shapelet_plan
+)
 import numpy as np
 import pytest
 
@@ -34,3 +47,311 @@ def test_strides_1D(dims, window_size, dilation):
     assert X2.shape == (X.shape[0] - (window_size-1)*dilation, window_size)
     assert np.array_equal(X2[0], X[[0 + j*dilation for j in range(window_size)]])
     
+
+@pytest.mark.parametrize("dims, window_size, dilation, use_phase", [
+    ((3, 100), 10, 1, False),
+    ((3, 100), 5, 5, False),
+    ((3, 100), 3, 15, True),
+    ((3, 101), 9, 7, True)
+])
+def test_chains(dims, window_size, dilation, use_phase):
+    X = init_numpy(dims)
+    X_strides = generate_strides_2D(X, window_size, dilation, use_phase)
+    X_chains, win_start = generate_chains_2D(X, window_size, dilation, use_phase)
+    assert win_start.shape[0] == X_strides.shape[1]
+    for i in range(win_start.shape[0]):
+        assert np.array_equal(
+            X_chains[:, win_start[i]:win_start[i]+window_size], X_strides[:, i]
+        )
+    x_chains, x_win_start = generate_chains_1D(X[0], window_size, dilation, use_phase)
+    assert np.array_equal(x_chains, X_chains[0])
+    assert np.array_equal(x_win_start, win_start)
+
+##########################################
+#                                        #
+#          Test rolling statistics       #
+#                                        #
+##########################################
+
+@pytest.mark.parametrize("n_timestamps, length, dilation, use_phase", [
+    (100, 10, 1, False),
+    (100, 5, 5, False),
+    (100, 3, 15, True),
+    (101, 9, 7, True)
+])
+def test_sliding_mean_std(n_timestamps, length, dilation, use_phase):
+    X = init_numpy((3, n_timestamps)).cumsum(axis=1)
+    X[:, 20:60] = 3.
+    X_mean, X_std = sliding_mean_std_2D(X, length, dilation, use_phase)
+    for i in range(X.shape[0]):
+        strides = generate_strides_1D(X[i], length, dilation, use_phase)
+        x_mean, x_std = sliding_mean_std(X[i], length, dilation, use_phase)
+        assert np.allclose(x_mean, strides.mean(axis=1))
+        assert np.allclose(x_std, strides.std(axis=1))
+        assert np.array_equal(x_mean, X_mean[i])
+        assert np.array_equal(x_std, X_std[i])
+
+##########################################
+#                                        #
+#        Test sliding dot product        #
+#                                        #
+##########################################
+
+@pytest.mark.parametrize("n_timestamps, length, dilation, normalize, use_phase", [
+    (200, 11, 1, True, False),
+    (200, 11, 3, False, False),
+    (200, 11, 7, True, True),
+    (210, 9, 7, False, True),
+    (50, 11, 4, True, True),
+    (300, 30, 2, True, False)
+])
+def test_sdp_distance_vector(n_timestamps, length, dilation, normalize, use_phase):
+    X = init_numpy(n_timestamps).cumsum()
+    # Flat region to check the normalization of windows with null variance
+    X[20:40] = 3.
+    values = init_numpy(length)
+    if normalize:
+        values = (values - values.mean()) / (values.std() + 1e-8)
+    sdp_inputs = sdp_prepare(X, length, dilation, use_phase)
+    for sdp_mode, metric in [
+        (SDP_SQUARED, DIST_SQUARED), (SDP_EUCLIDEAN, DIST_EUCLIDEAN)
+    ]:
+        x_dist = compute_shapelet_dist_vector(
+            X, values, length, dilation, metric, normalize, use_phase
+        )
+        x_sdp = sdp_distance_vector(
+            *sdp_inputs, n_timestamps, values, length, dilation, normalize,
+            use_phase, sdp_mode
+        )
+        assert x_sdp.shape == x_dist.shape
+        assert np.allclose(x_sdp, x_dist)
+
+##########################################
+#                                        #
+#        Test early abandoning           #
+#                                        #
+##########################################
+
+@pytest.mark.parametrize("dist_func, ea_dist_func", [
+    (euclidean, euclidean_ea),
+    (squared_euclidean, squared_euclidean_ea),
+    (manhattan, manhattan_ea)
+])
+def test_early_abandon_distances(dist_func, ea_dist_func):
+    x = init_numpy(20)
+    y = init_numpy(20)
+    order = early_abandon_order(y)
+    assert np.array_equal(np.sort(order), np.arange(20))
+    d = dist_func(x, y, 0.5, 2.)
+    assert np.isclose(ea_dist_func(x, y, order, np.inf, 0.5, 2.), d)
+    assert np.isclose(ea_dist_func(x, y, order, d, 0.5, 2.), d)
+    assert ea_dist_func(x, y, order, d/2, 0.5, 2.) > d/2
+
+def test_benchmark_distances():
+    results = benchmark_distances(n_timestamps=500, n_repeats=2)
+    assert set(results) == {'manhattan', 'euclidean', 'squared'}
+    for timings in results.values():
+        assert len(timings) == 2
+        assert min(timings) > 0
+
+##########################################
+#                                        #
+#          Test sampling bitsets         #
+#                                        #
+##########################################
+
+@pytest.mark.parametrize("n_bits", [
+    (1),
+    (64),
+    (150)
+])
+def test_bitset(n_bits):
+    bits = np.zeros((3, bitset_n_words(n_bits)), dtype=np.uint64)
+    mask = np.random.random_sample((3, n_bits)) < 0.5
+    for c in range(3):
+        bitset_fill(bits[c], n_bits)
+        for i in np.where(~mask[c])[0]:
+            bitset_clear(bits[c], i)
+        assert all(bitset_get(bits[c], i) == mask[c, i] for i in range(n_bits))
+        for end in [0, n_bits//2, n_bits]:
+            assert bitset_count(bits[c], end) == mask[c, :end].sum()
+        valid = np.where(mask[c])[0]
+        assert all(bitset_select(bits[c], k) == valid[k] for k in range(valid.shape[0]))
+    
+    channels = np.array([0, 2])
+    valid = np.where(mask[channels].sum(axis=0) >= 1)[0]
+    assert bitset_count_channels(bits, channels, 1, n_bits) == valid.shape[0]
+    assert all(
+        bitset_select_channels(bits, channels, 1, k) == valid[k]
+        for k in range(valid.shape[0])
+    )
+
+@pytest.mark.parametrize("n_rows", [
+    (1),
+    (3)
+])
+def test_ragged(n_rows):
+    X_len = np.array([1, 64, 150, 65])
+    X = [np.random.random_sample((n_rows, l)) for l in X_len]
+    X_offsets = np.concatenate(([0], np.cumsum(n_rows * X_len)))
+    X_values = np.concatenate([x.ravel() for x in X])
+    bits, offsets = ragged_bitsets(X_len, n_rows)
+    for i in range(X_len.shape[0]):
+        assert np.array_equal(
+            ragged_sample(X_values, X_offsets, X_len, i), X[i]
+        )
+        rows = ragged_bitset(bits, offsets, n_rows, i)
+        assert rows.shape == (n_rows, bitset_n_words(X_len[i]))
+        for j in range(n_rows):
+            assert bitset_count(rows[j], X_len[i]) == X_len[i]
+
+@pytest.mark.parametrize("n_samples", [
+    (1),
+    (7),
+    (64)
+])
+def test_fenwick(n_samples):
+    counts = np.random.randint(0, 5, size=n_samples)
+    tree = fenwick_init(counts)
+    for _ in range(n_samples):
+        i = np.random.randint(n_samples)
+        if counts[i] > 0:
+            counts[i] -= 1
+            fenwick_add(tree, i, -1)
+    cumsum = np.cumsum(counts)
+    assert all(fenwick_prefix(tree, i+1) == cumsum[i] for i in range(n_samples))
+    assert all(
+        fenwick_search(tree, k) == np.searchsorted(cumsum, k, side='right')
+        for k in range(cumsum[-1])
+    )
+
+def test_same_class_index():
+    y = np.array([2, 0, 1, 0, 2, 0])
+    order, start, size, rank = same_class_index(y)
+    for i in range(y.shape[0]):
+        others = order[start[i]:start[i]+size[i]]
+        assert np.array_equal(others, np.where(y == y[i])[0])
+        assert others[rank[i]] == i
+
+def test_rng():
+    draws = []
+    for _ in range(2):
+        state = rng_stream(42, 3)
+        draws.append([rng_randint(state, 0, 10) for _ in range(100)])
+    assert draws[0] == draws[1]
+    assert all(0 <= d < 10 for d in draws[0])
+    state = rng_stream(42, 4)
+    assert draws[0] != [rng_randint(state, 0, 10) for _ in range(100)]
+    state = rng_stream(0, 0)
+    assert 1.0 <= rng_uniform(state, 1.0, 2.0) < 2.0
+    choice = rng_choice(state, 10, 5)
+    assert np.unique(choice).shape[0] == 5 and choice.max() < 10
+
+@pytest.mark.parametrize("n_shapelets, n_samples", [
+    (100, 50),
+    (5000, 50),
+    (5000, 1000)
+])
+def test_generation_schedule(n_shapelets, n_samples):
+    dilations = np.random.choice([1, 2, 3], size=n_shapelets)
+    normalize = np.random.random_sample(n_shapelets) < 0.5
+    states, items_ptr, items_shapelets, items_samples = generation_schedule(
+        dilations, normalize, n_samples, 0
+    )
+    assert np.array_equal(np.sort(items_shapelets), np.arange(n_shapelets))
+    covered = np.zeros((3, 2, n_samples), dtype=int)
+    for i in range(items_samples.shape[0]):
+        id_shps = items_shapelets[items_ptr[i]:items_ptr[i+1]]
+        assert np.all(np.diff(id_shps) > 0)
+        assert np.unique(dilations[id_shps]).shape[0] == 1
+        assert np.unique(normalize[id_shps]).shape[0] == 1
+        covered[
+            dilations[id_shps[0]] - 1, int(normalize[id_shps[0]]),
+            items_samples[i, 0]:items_samples[i, 1]
+        ] += 1
+    assert covered.max() == 1
+    if n_samples < 128:
+        assert items_samples.shape[0] <= 6
+    elif n_shapelets > 3000:
+        assert items_samples.shape[0] > 6
+
+@pytest.mark.parametrize("n_shapelets, max_channels", [
+    (1, 1),
+    (200, 1),
+    (200, 3)
+])
+def test_shapelet_plan(n_shapelets, max_channels):
+    lengths = np.random.choice([7, 9, 11], size=n_shapelets)
+    dilations = np.random.choice([1, 2, 5], size=n_shapelets)
+    normalize = np.random.random_sample(n_shapelets) < 0.5
+    threshold = np.random.random_sample(n_shapelets)
+    n_channels = np.random.randint(1, max_channels+1, size=n_shapelets)
+    channel_ids = np.concatenate(
+        [np.random.choice(max_channels, c, replace=False) for c in n_channels]
+    )
+    values = np.random.random_sample((n_channels * lengths).sum())
+    a1 = np.concatenate(([0], np.cumsum(n_channels * lengths)))
+    a2 = np.concatenate(([0], np.cumsum(n_channels)))
+    (groups, group_ptr, norm_ptr, order, _values, values_ptr, _channel_ids,
+     channels_ptr, _threshold, ea_orders) = shapelet_plan(
+        values, lengths, dilations, threshold, normalize, n_channels,
+        channel_ids
+    )
+    assert np.array_equal(np.sort(order), np.arange(n_shapelets))
+    assert np.array_equal(_threshold, threshold[order])
+    assert group_ptr[0] == 0 and group_ptr[-1] == n_shapelets
+    assert np.unique(lengths * 100 + dilations).shape[0] == groups.shape[0]
+    for i_group in range(groups.shape[0]):
+        a, b = group_ptr[i_group], group_ptr[i_group+1]
+        c = norm_ptr[i_group]
+        assert np.all(lengths[order[a:b]] == groups[i_group, 0])
+        assert np.all(dilations[order[a:b]] == groups[i_group, 1])
+        assert not np.any(normalize[order[a:c]])
+        assert np.all(normalize[order[c:b]])
+    for p, i in enumerate(order):
+        assert np.array_equal(
+            _values[values_ptr[p]:values_ptr[p+1]], values[a1[i]:a1[i+1]]
+        )
+        assert np.array_equal(
+            _channel_ids[channels_ptr[p]:channels_ptr[p+1]],
+            channel_ids[a2[i]:a2[i+1]]
+        )
+        for k in range(n_channels[i]):
+            _a = values_ptr[p] + k * lengths[i]
+            assert np.array_equal(
+                ea_orders[_a:_a+lengths[i]],
+                early_abandon_order(_values[_a:_a+lengths[i]])
+            )
+
+@pytest.mark.parametrize("n_samples, use_phase", [
+    (1, False),
+    (1, True),
+    (1000, False)
+])
+def test_apply_schedule(n_samples, use_phase):
+    params_shp = np.array([[7, 1], [7, 4], [11, 1], [11, 9]])
+    n_shp_params = np.cumsum([0, 500, 30, 450, 20])
+    X_len = np.random.randint(80, 121, size=n_samples)
+    samples, chunks, blocks = apply_schedule(
+        params_shp, n_shp_params, X_len, use_phase
+    )
+    assert np.array_equal(np.sort(samples), np.arange(n_samples))
+    assert np.all(np.diff(X_len[samples]) <= 0)
+    covered = np.zeros(n_shp_params[-1], dtype=int)
+    costs = []
+    for i_group, a, b in chunks:
+        assert n_shp_params[i_group] <= a < b <= n_shp_params[i_group+1]
+        covered[a:b] += 1
+        length, dilation = params_shp[i_group]
+        n_windows = X_len.max()
+        if not use_phase:
+            n_windows -= (length - 1) * dilation
+        costs.append(n_windows * (b - a))
+    assert np.all(covered == 1)
+    assert np.all(np.diff(costs) <= 0)
+    if n_samples == 1:
+        assert chunks.shape[0] > params_shp.shape[0]
+    else:
+        assert chunks.shape[0] == params_shp.shape[0]
+    assert blocks[0] == 0 and blocks[-1] == n_samples * chunks.shape[0]
+    assert np.all(np.diff(blocks) >= 0)
@@ -0,0 +1,41 @@
+import sys
+import json
+import subprocess
+import pytest
+
+import logging
+LOGGER = logging.getLogger(__name__)
+
+# Packages which must only be imported when the features using them are.
+OPTIONAL_PACKAGES = ['sktime', 'pyts', 'seaborn', 'matplotlib', 'pandas']
+
+IMPORT_SCRIPT = """
+import sys, json, time
+t0 = time.perf_counter()
+{}
+t1 = time.perf_counter()
+print(json.dumps({{
+    'time': t1 - t0,
+    'modules': sorted({{name.split('.')[0] for name in sys.modules}})
+}}))
+"""
+
+def _import_in_new_process(statement):
+    output = subprocess.run(
+        [sys.executable, '-c', IMPORT_SCRIPT.format(statement)],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+@pytest.mark.parametrize("statement", [
+    ('import convst'),
+    ('from convst.transformers import R_DST'),
+    ('from convst.classifiers import R_DST_Ridge'),
+    ('from convst.interpreters import RDST_Ridge_interpreter'),
+    ('from convst.utils.dataset_utils import load_sktime_dataset_split'),
+])
+def test_import_time(statement):
+    result = _import_in_new_process(statement)
+    LOGGER.info('{} -> {:.3f}s'.format(statement, result['time']))
+    for package in OPTIONAL_PACKAGES:
+        assert package not in result['modules']
@@ -8,9 +8,10 @@ import pytest
 
 import numpy as np
 
-from convst.classifiers import R_DST_Ridge
+from convst.classifiers import R_DST_Ridge, R_DST_Ensemble
 from convst.transformers import R_DST
 from convst.utils.dataset_utils import load_sktime_dataset_split
+from convst.utils.ragged_utils import RaggedArray
 from convst.utils.experiments_utils import cross_validate_UCR_UEA
 from convst.transformers._commons import is_prime
 
@@ -82,6 +83,89 @@ def test_prime_dilations(name):
     assert all([is_prime(i) for i in rdst.transformer.shapelets_[2]])
 
 
+# Early abandoning changes the order of the sums, so the argmin feature may
+# differ between windows with tied distances.
+@pytest.mark.parametrize("name, distance", [
+    ('GunPoint','manhattan'),
+    ('GunPoint','euclidean'),
+    ('BasicMotions','squared'),
+    ('PLAID','manhattan'),
+    ('AsphaltObstaclesCoordinates','euclidean')
+])
+def test_early_abandon(name, distance):
+    X_train, X_test, y_train, y_test, min_len = load_sktime_dataset_split(
+        name=name
+    )
+    rdst = R_DST(
+        n_shapelets=500, distance=distance, min_len=min_len, random_state=0
+    ).fit(X_train, y_train)
+    X_full = rdst.transform(X_test)
+    rdst.early_abandon = True
+    X_ea = rdst.transform(X_test)
+    assert np.allclose(X_full[:, 0::3], X_ea[:, 0::3])
+    assert np.array_equal(X_full[:, 2::3], X_ea[:, 2::3])
+
+# The batched engine computes the distances from dot products, so the min
+# feature matches up to rounding (amplified by the square root for small
+# euclidean distances) and the argmin may differ on tied windows.
+@pytest.mark.parametrize("name, distance, phase", [
+    ('GunPoint','euclidean',False),
+    ('GunPoint','squared',True),
+    ('BasicMotions','euclidean',True),
+    ('BasicMotions','squared',False)
+])
+def test_gemm_engine(name, distance, phase):
+    X_train, X_test, y_train, y_test, min_len = load_sktime_dataset_split(
+        name=name
+    )
+    rdst = R_DST(
+        n_shapelets=500, distance=distance, phase_invariance=phase,
+        min_len=min_len, random_state=0
+    ).fit(X_train, y_train)
+    X_numba = rdst.transform(X_test)
+    rdst.engine = 'gemm'
+    rdst._set_fit_transform(X_test)
+    X_gemm = rdst.transform(X_test)
+    assert np.allclose(X_numba[:, 0::3], X_gemm[:, 0::3], atol=1e-3)
+    assert np.array_equal(X_numba[:, 2::3], X_gemm[:, 2::3])
+
+
+# The NumPy engine sums the distances in another order, so the min feature
+# matches up to rounding and the argmin may differ on tied windows.
+@pytest.mark.parametrize("name, distance, phase", [
+    ('GunPoint','manhattan',False),
+    ('GunPoint','euclidean',True),
+    ('BasicMotions','squared',False),
+    ('BasicMotions','manhattan',True),
+    ('PLAID','euclidean',False),
+    ('AsphaltObstaclesCoordinates','manhattan',True)
+])
+def test_numpy_engine(name, distance, phase):
+    X_train, X_test, y_train, y_test, min_len = load_sktime_dataset_split(
+        name=name
+    )
+    rdst = R_DST(
+        n_shapelets=500, distance=distance, phase_invariance=phase,
+        min_len=min_len, random_state=0
+    ).fit(X_train, y_train)
+    X_numba = rdst.transform(X_test)
+    rdst.engine = 'numpy'
+    rdst._set_fit_transform(X_test)
+    X_numpy = rdst.transform(X_test)
+    assert X_numpy.dtype == X_numba.dtype
+    assert np.allclose(X_numba[:, 0::3], X_numpy[:, 0::3])
+    assert np.array_equal(X_numba[:, 2::3], X_numpy[:, 2::3])
+
+
+def test_gemm_engine_invalid_distance():
+    X_train, X_test, y_train, y_test, min_len = load_sktime_dataset_split(
+        name='GunPoint'
+    )
+    with pytest.raises(ValueError):
+        R_DST(engine='gemm', distance='manhattan').fit(X_train, y_train)
+
+
+
 # TODO : this may fail due to unlucky generation of shapelets, if a length 
 # is not selected randomly, the expected array will be bigger than actual
 @pytest.mark.parametrize("name, bounds, reduction, expected", [
@@ -107,6 +191,289 @@ def test_length_bounds(name, bounds, reduction, expected):
         assert False 
     assert list(np.unique(rdst.transformer.shapelets_[1])) == expected
 
+@pytest.mark.parametrize("name, chunk_size, prefetch", [
+    ('GunPoint',32,True),
+    ('GunPoint',None,False),
+    ('BasicMotions',7,False),
+    ('PLAID',100,True),
+    ('PLAID',None,True)
+])
+def test_transform_iter(name, chunk_size, prefetch):
+    X_train, X_test, y_train, y_test, min_len = load_sktime_dataset_split(
+        name=name
+    )
+    rdst = R_DST(
+        n_shapelets=500, min_len=min_len, random_state=0
+    ).fit(X_train, y_train)
+    X_new = rdst.transform(X_test)
+    if chunk_size is None:
+        chunks = (X_test[i:i+50] for i in range(0, len(X_test), 50))
+    else:
+        chunks = X_test
+    X_iter = np.concatenate(list(rdst.transform_iter(
+        chunks, chunk_size=chunk_size, prefetch=prefetch
+    )))
+    assert np.array_equal(X_new, X_iter)
+
+
+@pytest.mark.parametrize("name, dtype", [
+    ('GunPoint','float64'),
+    ('BasicMotions','float32')
+])
+def test_memmap(name, dtype, tmp_path):
+    X_train, X_test, y_train, y_test, min_len = load_sktime_dataset_split(
+        name=name
+    )
+    path = str(tmp_path / 'X_test.npy')
+    np.save(path, X_test.astype(dtype))
+    rdst = R_DST(
+        n_shapelets=500, min_len=min_len, random_state=0, dtype=dtype
+    ).fit(X_train, y_train)
+    X_new = rdst.transform(X_test)
+    out = np.lib.format.open_memmap(
+        str(tmp_path / 'X_new.npy'), mode='w+', dtype=dtype,
+        shape=X_new.shape
+    )
+    rdst.transform(path, out=out)
+    out.flush()
+    assert np.array_equal(X_new, np.load(str(tmp_path / 'X_new.npy')))
+    # Fitting from the memory map must sample the same shapelets
+    np.save(str(tmp_path / 'X_train.npy'), X_train.astype(dtype))
+    rdst_mmap = R_DST(
+        n_shapelets=500, min_len=min_len, random_state=0, dtype=dtype
+    ).fit(str(tmp_path / 'X_train.npy'), y_train)
+    assert np.array_equal(rdst.shapelets_[0], rdst_mmap.shapelets_[0])
+    with pytest.raises(ValueError):
+        rdst.transform(X_test, out=np.zeros((1, 3)))
+
+
+@pytest.mark.parametrize("name, max_samples_per_class", [
+    ('GunPoint',10),
+    ('GunPoint',1000),
+    ('PLAID',5)
+])
+def test_fit_iter(name, max_samples_per_class):
+    X_train, X_test, y_train, y_test, min_len = load_sktime_dataset_split(
+        name=name
+    )
+    chunks = [
+        (X_train[i:i+20], y_train[i:i+20]) for i in range(0, len(X_train), 20)
+    ]
+    rdst = R_DST(n_shapelets=500, random_state=0)
+    X, y, _min_len = rdst._reservoir_from_chunks(chunks, max_samples_per_class)
+    classes, counts = np.unique(y_train, return_counts=True)
+    assert _min_len == min(x.shape[-1] for x in X_train)
+    for c, n in zip(classes, counts):
+        assert (y == c).sum() == min(n, max_samples_per_class)
+    X_new = rdst.fit_iter(chunks, max_samples_per_class).transform(X_test)
+    assert X_new.shape == (len(X_test), 3*rdst.shapelets_[1].shape[0])
+
+
+# float32 storage should not change the accuracy beyond a small tolerance
+@pytest.mark.parametrize("name", [
+    ('GunPoint'),
+    ('BasicMotions'),
+    ('PLAID'),
+    ('AsphaltObstaclesCoordinates')
+])
+def test_float32(name):
+    X_train, X_test, y_train, y_test, min_len = load_sktime_dataset_split(
+        name=name
+    )
+    acc = {}
+    for dtype in ['float64', 'float32']:
+        rdst = R_DST_Ridge(
+            n_shapelets=2000, min_len=min_len, random_state=0, dtype=dtype
+        ).fit(X_train, y_train)
+        assert rdst.transformer.shapelets_[0].dtype == dtype
+        assert rdst.transformer.transform(X_test).dtype == dtype
+        acc[dtype] = rdst.score(X_test, y_test)
+    LOGGER.info('{} Dataset -> float64 Accuracy {}, float32 Accuracy {}'.format(
+         name, acc['float64'], acc['float32']
+    ))
+    assert acc['float32'] >= acc['float64'] - 0.02
+
+# With float32 storage, the distances should still be computed in double
+# precision. The float32 transformer is compared to a float64 copy of itself
+# on the same float32 values, on long series far from zero for which a
+# float32 accumulator changes the min and occurrence features.
+@pytest.mark.parametrize("distance", ['manhattan', 'euclidean', 'squared'])
+def test_float32_precision(distance):
+    rng = np.random.RandomState(0)
+    X = np.cumsum(rng.normal(size=(20, 1, 3000)), axis=2) + 1e4
+    y = np.repeat([0, 1], 10)
+    rdst = R_DST(
+        n_shapelets=500, distance=distance, dtype='float32', random_state=0
+    ).fit(X, y)
+    X_32 = rdst.transform(X)
+    rdst.dtype = 'float64'
+    rdst.plan_ = tuple(
+        arr.astype('float64') if arr.dtype == np.float32 else arr
+        for arr in rdst.plan_
+    )
+    X_64 = rdst.transform(X.astype('float32'))
+    assert X_32.dtype == np.float32
+    assert np.allclose(X_32[:, 0::3], X_64[:, 0::3], atol=1e-3)
+    assert np.mean(X_32[:, 2::3] != X_64[:, 2::3]) <= 0.001
+
+@pytest.mark.parametrize("name", [
+    ('GunPoint'),
+    ('BasicMotions'),
+    ('PLAID'),
+    ('AsphaltObstaclesCoordinates')
+])
+def test_n_jobs_reproducible(name):
+    X_train, X_test, y_train, y_test, min_len = load_sktime_dataset_split(
+        name=name
+    )
+    shapelets = [
+        R_DST(
+            n_shapelets=1000, min_len=min_len, random_state=0, n_jobs=n_jobs
+        ).fit(X_train, y_train).shapelets_
+        for n_jobs in [1, -1]
+    ]
+    for a, b in zip(*shapelets):
+        assert np.array_equal(a, b)
+
+@pytest.mark.parametrize("name", [
+    ('GunPoint'),
+    ('BasicMotions'),
+    ('PLAID'),
+    ('AsphaltObstaclesCoordinates')
+])
+def test_shards_merge(name):
+    X_train, X_test, y_train, y_test, min_len = load_sktime_dataset_split(
+        name=name
+    )
+    shards = R_DST(n_shapelets=500, min_len=min_len, random_state=0).shards(3)
+    assert sum(shard.n_shapelets for shard in shards) == 500
+    shards = [shard.fit(X_train, y_train) for shard in shards]
+    merged = R_DST.merge(shards)
+    assert merged.shapelets_[1].shape[0] == sum(
+        shard.shapelets_[1].shape[0] for shard in shards
+    )
+    assert np.allclose(
+        merged.transform(X_test),
+        np.concatenate([shard.transform(X_test) for shard in shards], axis=1)
+    )
+    other = R_DST(
+        n_shapelets=500, min_len=min_len, random_state=0, distance='euclidean'
+    ).fit(X_train, y_train)
+    with pytest.raises(ValueError):
+        R_DST.merge([shards[0], other])
+
+def test_fit_sharded():
+    X_train, X_test, y_train, y_test, min_len = load_sktime_dataset_split(
+        name='GunPoint'
+    )
+    rdst = R_DST(n_shapelets=500, random_state=0).fit_sharded(
+        X_train, y_train, n_shards=2, n_processes=1
+    )
+    shards = [
+        shard.fit(X_train, y_train) 
+        for shard in R_DST(n_shapelets=500, random_state=0).shards(2)
+    ]
+    for a, b in zip(rdst.shapelets_, R_DST.merge(shards).shapelets_):
+        assert np.array_equal(a, b)
+
+# The seeds of the shards should not depend on previous calls to shards or
+# fit, which draw from the same random_state.
+def test_shards_seeds():
+    rng = np.random.RandomState(0)
+    X = rng.normal(size=(20, 1, 60))
+    y = np.repeat([0, 1], 10)
+    def shard_seeds(rdst):
+        return [
+            shard.random_state.randint(np.iinfo(np.int32).max)
+            for shard in rdst.shards(2)
+        ]
+    rdst = R_DST(n_shapelets=100, random_state=0)
+    seeds = shard_seeds(rdst)
+    assert seeds == shard_seeds(rdst)
+    sharded = rdst.fit_sharded(X, y, n_shards=2, n_processes=1)
+    rdst = R_DST(n_shapelets=100, random_state=0).fit(X, y)
+    assert seeds == shard_seeds(rdst)
+    refit = rdst.fit_sharded(X, y, n_shards=2, n_processes=1)
+    for a, b in zip(sharded.shapelets_, refit.shapelets_):
+        assert np.array_equal(a, b)
+
+@pytest.mark.parametrize("name", [
+    ('GunPoint'),
+    ('PLAID')
+])
+def test_transform_processes(name):
+    X_train, X_test, y_train, y_test, min_len = load_sktime_dataset_split(
+        name=name
+    )
+    rdst = R_DST(n_shapelets=500, min_len=min_len).fit(X_train, y_train)
+    X_new = rdst.transform(X_test)
+    out = np.zeros_like(X_new)
+    assert rdst.transform_processes(X_test, n_processes=2, out=out) is out
+    assert np.array_equal(out, X_new)
+
+def test_ragged_array():
+    X_train, X_test, y_train, y_test, min_len = load_sktime_dataset_split(
+        name='PLAID'
+    )
+    lengths = np.array([x.shape[1] for x in X_test])
+    X_padded = np.zeros((len(X_test), 1, lengths.max()))
+    for i in range(len(X_test)):
+        X_padded[i, :, :lengths[i]] = X_test[i]
+    X_ragged = RaggedArray.from_list(X_test)
+    assert np.array_equal(
+        X_ragged.values, RaggedArray.from_padded(X_padded, lengths).values
+    )
+    assert all(np.array_equal(a, b) for a, b in zip(X_ragged, X_test))
+    rdst = R_DST(n_shapelets=500, min_len=min_len, random_state=0)
+    X_new = rdst.fit(X_train, y_train).transform(X_test)
+    rdst = R_DST(n_shapelets=500, min_len=min_len, random_state=0)
+    X_train = RaggedArray.from_list(X_train)
+    assert np.array_equal(
+        X_new, rdst.fit(X_train, y_train).transform(X_ragged)
+    )
+    assert np.array_equal(X_new[10:30], rdst.transform(X_ragged[10:30]))
+
+@pytest.mark.parametrize("name, dtype", [
+    ('GunPoint','float64'),
+    ('BasicMotions','float32'),
+    ('PLAID','float64')
+])
+def test_save_load(name, dtype, tmp_path):
+    X_train, X_test, y_train, y_test, min_len = load_sktime_dataset_split(
+        name=name
+    )
+    rdst = R_DST_Ridge(
+        n_shapelets=500, min_len=min_len, random_state=0, dtype=dtype
+    ).fit(X_train, y_train)
+    rdst.save(str(tmp_path / 'model'))
+    loaded = R_DST_Ridge.load(str(tmp_path / 'model'))
+    assert isinstance(loaded.transformer.plan_[4], np.memmap)
+    for a, b in zip(rdst.transformer.plan_, loaded.transformer.plan_):
+        assert np.array_equal(a, b) and a.dtype == b.dtype
+    for a, b in zip(rdst.transformer.shapelets_, loaded.transformer.shapelets_):
+        if a.ndim == 2:
+            a = a[:, :b.shape[1]]
+        assert np.array_equal(a, b)
+    assert np.array_equal(
+        rdst.transformer.transform(X_test), 
+        loaded.transformer.transform(X_test)
+    )
+    assert np.array_equal(rdst.predict(X_test), loaded.predict(X_test))
+    with pytest.raises(ValueError):
+        R_DST.load(str(tmp_path / 'model'))
+
+def test_save_load_ensemble(tmp_path):
+    X_train, X_test, y_train, y_test, min_len = load_sktime_dataset_split(
+        name='GunPoint'
+    )
+    ensemble = R_DST_Ensemble(
+        n_shapelets_per_estimator=100, random_state=0
+    ).fit(X_train, y_train)
+    ensemble.save(str(tmp_path / 'model'))
+    loaded = R_DST_Ensemble.load(str(tmp_path / 'model'), mmap=False)
+    assert loaded.model_weights == ensemble.model_weights
+    assert np.array_equal(ensemble.predict(X_test), loaded.predict(X_test))
+
 # Lower than actual best accuracy to account for possible deviation due to random sampling
 @pytest.mark.parametrize("name, expected", [
     ('GunPoint',0.98),
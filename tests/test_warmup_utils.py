@@ -0,0 +1,39 @@
+import os
+import sys
+import importlib
+import subprocess
+import pytest
+
+from convst.utils.warmup_utils import warmup, set_cache_dir
+
+
+def test_warmup_cache_dir(tmp_path):
+    # The cache directory must be set before the transformers are imported,
+    # hence in a new process.
+    cache_dir = str(tmp_path / 'cache')
+    subprocess.run([
+        sys.executable, '-c',
+        "import convst; convst.warmup(kinds=['univariate'], "
+        "distances=['manhattan'], dtypes=['float64'], "
+        "phase_invariance=[False], cache_dir={!r})".format(cache_dir)
+    ], check=True)
+    files = [f for _, _, fs in os.walk(cache_dir) for f in fs]
+    assert any(f.endswith('.nbi') for f in files)
+    assert any(f.endswith('.nbc') for f in files)
+
+
+@pytest.mark.parametrize("params", [
+    ({'kinds': ['univariate_same_length']}),
+    ({'distances': ['cosine']}),
+    ({'dtypes': ['float16']}),
+    ({'engines': ['fft']}),
+])
+def test_warmup_wrong_parameters(params):
+    with pytest.raises(ValueError):
+        warmup(**params)
+
+
+def test_set_cache_dir_after_import(tmp_path):
+    importlib.import_module('convst.transformers._commons')
+    with pytest.raises(ValueError):
+        set_cache_dir(str(tmp_path / 'cache'))